@@ -0,0 +1,96 @@
+"""Compares the recursive generation assignment lineages used before with the iterative one in utils.lineage.
+
+Runs on synthetic lineages, no AWS access needed: run with `python -m benchmarks.lineage_benchmark` from backend/.
+"""
+import random
+import sys
+import timeit
+
+from plant_api.utils.lineage import PlantLineageNode, assign_generations_and_source_parents
+
+N_NODES = 100_000
+N_SOURCES = 50
+REPEATS = 3
+
+
+def recursive_assign_generations(nodes: list[PlantLineageNode]) -> None:
+    """The previous implementation, kept for reference"""
+    node_dict = {node.id: node for node in nodes}
+
+    def get_generation(node_id: int | str) -> int:
+        node = node_dict[node_id]
+        if node.generation != -1:
+            return node.generation
+        if node.source is None and node.parents is None:
+            node.generation = 0
+            return 0
+        if node.parents is None and node.source is not None:
+            node.parents = [node.source]
+            node.generation = 1
+            return 1
+        if isinstance(node.id, str):
+            node.generation = -1
+            return -1
+        if node.parents is not None:
+            node.generation = max(get_generation(parent_id) for parent_id in node.parents) + 1
+            return node.generation
+        return -1
+
+    for node in nodes:
+        get_generation(node.id)
+
+    max_generation = max(node.generation for node in nodes if node.generation != -1)
+    for node in nodes:
+        if node.generation == -1:
+            node.generation = max_generation + 1
+
+
+def make_wide_lineage(n_nodes: int) -> list[dict]:
+    """Random cuttings: each plant has one or two earlier plants as parents, or comes from a source"""
+    rng = random.Random(0)
+    plants = []
+    for plant_id in range(n_nodes):
+        if plant_id < N_SOURCES or rng.random() < 0.05:
+            plants.append(dict(id=plant_id, source=f"source_{rng.randrange(N_SOURCES)}", node_type="plant"))
+        else:
+            parents = {rng.randrange(plant_id) for _ in range(rng.choice([1, 1, 1, 2]))}
+            plants.append(dict(id=plant_id, parents=sorted(parents), node_type="plant"))
+    # Shuffled so neither implementation gets the nodes in topological order
+    rng.shuffle(plants)
+    return plants + [dict(id=f"source_{i}", node_type="source") for i in range(N_SOURCES)]
+
+
+def make_deep_chain(n_nodes: int) -> list[dict]:
+    """One plant propagated from the previous one, n_nodes times (newest first, as a user would usually list them)"""
+    return (
+        [dict(id=i, parents=[i - 1], node_type="plant") for i in range(n_nodes - 1, 0, -1)]
+        + [dict(id=0, source="source_0", node_type="plant")]
+        + [dict(id="source_0", node_type="source")]
+    )
+
+
+def to_nodes(plants: list[dict]) -> list[PlantLineageNode]:
+    return [PlantLineageNode(**plant) for plant in plants]
+
+
+def time_assignment(assign, plants: list[dict]) -> str:
+    # Fresh nodes for every run since both implementations assign in place; building them isn't timed
+    node_lists = [to_nodes(plants) for _ in range(REPEATS)]
+    try:
+        seconds = min(timeit.repeat(lambda: assign(node_lists.pop()), number=1, repeat=REPEATS))
+    except RecursionError:
+        return "RecursionError"
+    return f"{seconds * 1000:.0f}"
+
+
+def main():
+    print(f"Python recursion limit: {sys.getrecursionlimit()}")
+    print(f"{'lineage':>8} {'nodes':>8} {'recursive (ms)':>16} {'iterative (ms)':>16}")
+    for name, plants in [("wide", make_wide_lineage(N_NODES)), ("chain", make_deep_chain(N_NODES))]:
+        recursive = time_assignment(recursive_assign_generations, plants)
+        iterative = time_assignment(assign_generations_and_source_parents, plants)
+        print(f"{name:>8} {len(plants):>8} {recursive:>16} {iterative:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Compares laying out a lineage on pydantic nodes, as utils.lineage did before, against the compact LineageGraph.
+
+Both produce the JSON stored in a user's lineage layout. Runs on synthetic lineages, no AWS access needed: run with
+`python -m benchmarks.lineage_layout_benchmark` from backend/.
+"""
+import gc
+import json
+import random
+import timeit
+import tracemalloc
+from collections import defaultdict, deque
+from datetime import date
+
+from pydantic import TypeAdapter
+
+from plant_api.utils.lineage import (
+    LineagePlant,
+    PlantLineageNode,
+    assign_levels_to_generations,
+    compute_lineage_level_dicts,
+    create_nodes_for_plants,
+    create_nodes_for_sources,
+)
+
+N_NODES = [10_000, 100_000]
+N_SOURCES = 50
+REPEATS = 3
+LEVELS_ADAPTER = TypeAdapter(list[list[PlantLineageNode]])
+
+
+def model_assign_generations(nodes: list[PlantLineageNode]) -> None:
+    """The previous generation assignment on pydantic nodes, kept for reference (minus the diagnostics)"""
+    node_ids = {node.id for node in nodes}
+    generations: dict = {}
+    children_of: dict = defaultdict(list)
+    n_unprocessed_parents: dict = {}
+    queue: deque = deque()
+    for node in nodes:
+        parents = [parent_id for parent_id in node.parents or [] if parent_id in node_ids]
+        if node.parents is not None and len(parents) < len(node.parents):
+            node.parents = parents or None
+        if node.parents is None:
+            if node.source is None:
+                generations[node.id] = 0
+            else:
+                node.parents = [node.source]
+                generations[node.id] = 1
+            queue.append(node.id)
+            continue
+        n_unprocessed_parents[node.id] = len(parents)
+        generations[node.id] = 0
+        for parent_id in parents:
+            children_of[parent_id].append(node.id)
+    while queue:
+        node_id = queue.popleft()
+        for child_id in children_of[node_id]:
+            generations[child_id] = max(generations[child_id], generations[node_id] + 1)
+            n_unprocessed_parents[child_id] -= 1
+            if n_unprocessed_parents[child_id] == 0:
+                queue.append(child_id)
+    for node in nodes:
+        node.generation = generations[node.id]
+
+
+def model_levels_json(plants: list[LineagePlant]) -> str:
+    nodes = create_nodes_for_plants(plants) + create_nodes_for_sources(plants)
+    model_assign_generations(nodes)
+    return LEVELS_ADAPTER.dump_json(assign_levels_to_generations(nodes), exclude_none=True).decode("utf-8")
+
+
+def graph_levels_json(plants: list[LineagePlant]) -> str:
+    """What LineageLayout.build stores"""
+    levels, _ = compute_lineage_level_dicts(plants)
+    return json.dumps(levels, separators=(",", ":"))
+
+
+def make_plants(n_nodes: int) -> list[LineagePlant]:
+    """Random cuttings: each plant has one or two earlier plants as parents, or comes from a source"""
+    rng = random.Random(0)
+    plants = []
+    for human_id in range(n_nodes):
+        parents = None
+        if human_id >= N_SOURCES and rng.random() > 0.05:
+            parents = sorted({rng.randrange(human_id) for _ in range(rng.choice([1, 1, 1, 2]))})
+        plants.append(
+            LineagePlant(
+                plant_id=f"plant-{human_id}",
+                human_id=human_id,
+                human_name=f"Plant {human_id}",
+                parent_id=parents,
+                source=f"source_{rng.randrange(N_SOURCES)}",
+                source_date=date(2024, 1, 1),
+            )
+        )
+    rng.shuffle(plants)
+    return plants
+
+
+def peak_memory_bytes(layout, plants: list[LineagePlant]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    layout(plants)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    print(f"{'nodes':>8} {'':>8} {'ms / 10k nodes':>15} {'peak MiB / 10k nodes':>21}")
+    for n_nodes in N_NODES:
+        plants = make_plants(n_nodes)
+        assert LEVELS_ADAPTER.validate_json(model_levels_json(plants)) == LEVELS_ADAPTER.validate_json(
+            graph_levels_json(plants)
+        )
+        for name, layout in [("models", model_levels_json), ("graph", graph_levels_json)]:
+            seconds = min(timeit.repeat(lambda: layout(plants), number=1, repeat=REPEATS))
+            peak = peak_memory_bytes(layout, plants)
+            scale = 10_000 / n_nodes
+            print(f"{n_nodes:>8} {name:>8} {seconds * 1000 * scale:>15.0f} {peak / 2**20 * scale:>21.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Compares signing image URLs one at a time with botocore against the batch signer in utils.s3.
+
+Signing is local, so no AWS access is needed: run with `python -m benchmarks.presign_benchmark` from backend/.
+"""
+import os
+import timeit
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+from plant_api.constants import S3_BUCKET_NAME  # noqa: E402
+from plant_api.utils.s3 import get_s3_client, presign_get_urls  # noqa: E402
+
+N_IMAGES = [10, 100, 1000]
+REPEATS = 5
+
+
+def sign_with_botocore_loop(object_names: list[str]) -> list[str]:
+    s3_client = get_s3_client()
+    return [
+        s3_client.generate_presigned_url(
+            "get_object", Params={"Bucket": S3_BUCKET_NAME, "Key": object_name}, ExpiresIn=86400
+        )
+        for object_name in object_names
+    ]
+
+
+def main():
+    get_s3_client()  # Build the client outside the timings
+    print(f"{'images':>8} {'URLs':>6} {'botocore loop (ms)':>20} {'batch (ms)':>12} {'speedup':>8}")
+    for n_images in N_IMAGES:
+        # Full photo and thumbnail for each image, as GET /images/plants/{plant_id} signs them
+        object_names = [
+            f"new_images/plant/{i}_{suffix}.jpg" for i in range(n_images) for suffix in ("original", "thumb")
+        ]
+        loop_seconds = min(timeit.repeat(lambda: sign_with_botocore_loop(object_names), number=1, repeat=REPEATS))
+        batch_seconds = min(
+            timeit.repeat(lambda: presign_get_urls(S3_BUCKET_NAME, object_names), number=1, repeat=REPEATS)
+        )
+        print(
+            f"{n_images:>8} {len(object_names):>6} {loop_seconds * 1000:>20.2f} {batch_seconds * 1000:>12.2f}"
+            f" {loop_seconds / batch_seconds:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
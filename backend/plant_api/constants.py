@@ -5,9 +5,19 @@ from fastapi import HTTPException
 from pydantic import BaseModel, Field
 from starlette import status
 
-from plant_api.utils.secrets import get_aws_secret
+from plant_api.utils.secrets import SECRETS_PROVIDER
 
 TABLE_NAME = "new_plants"
+# Sparse GSI over user items only: plants and images have an entity_type but no created_at, so they aren't indexed
+USER_DIRECTORY_INDEX = "entity_type-created_at-index"
+# Sparse GSIs over a user's plants, ranged by human_id: each only holds plants that have its hash key attribute, i.e.
+# plants that aren't sunk, and plants with a location or species (prefixed with the owner's ID, so it's per user)
+ACTIVE_PLANTS_INDEX = "active_owner-human_id-index"
+ACTIVE_OWNER_ATTR = "active_owner"
+PLANT_LOCATION_INDEX = "owner_location-human_id-index"
+OWNER_LOCATION_ATTR = "owner_location"
+PLANT_SPECIES_INDEX = "owner_species-human_id-index"
+OWNER_SPECIES_ATTR = "owner_species"
 
 AWS_REGION = "us-west-2"
 S3_BUCKET_NAME = "0bf665f0db5b-plant-app"
@@ -31,9 +41,19 @@ AWS_DEPLOYMENT_ENV = "aws"
 
 UNSET = "unset"
 
+# Paginated list endpoints return the cursor for the next page in this header (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000
+
 
 def get_jwt_secret() -> str:
-    return get_aws_secret(JWT_KEY_IN_SECRETS_MANAGER)
+    """Returns the current JWT signing key (cached in-process)"""
+    return SECRETS_PROVIDER.get_secret(JWT_KEY_IN_SECRETS_MANAGER)
+
+
+def get_jwt_secrets() -> list[str]:
+    """Returns every JWT key that tokens may still be signed with: the current key, then the pre-rotation key"""
+    return SECRETS_PROVIDER.get_secret_versions(JWT_KEY_IN_SECRETS_MANAGER)
 
 
 class GoogleOauthPayload(BaseModel):
@@ -1,6 +1,6 @@
 import logging
 from datetime import datetime, timezone
-from typing import Annotated
+from typing import Annotated, Optional
 
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
@@ -13,9 +13,10 @@ from plant_api.constants import (
     CREDENTIALS_EXCEPTION,
     JwtPayload,
     TOKEN_URL,
-    get_jwt_secret,
+    get_jwt_secrets,
 )
 from plant_api.schema import User
+from plant_api.utils.cache import USER_SESSION_CACHE
 from plant_api.utils.db import get_user_by_google_id
 
 LOGGER = logging.getLogger(__name__)
@@ -28,25 +29,44 @@ oauth2_google = OAuth2PasswordBearer(
 
 
 def decode_jwt_token(token: str) -> JwtPayload:
-    """Decodes a JWT token and returns the payload."""
-    try:
-        decoded_token = jwt.decode(token, get_jwt_secret(), algorithms=[ALGORITHM])
-        return JwtPayload(**decoded_token)
-    except jose.JWTError as e:
-        LOGGER.error("Could not decode JWT token: %s", e)
-        raise CREDENTIALS_EXCEPTION
+    """Decodes a JWT token and returns the payload.
+
+    Tries the current signing key first and falls back to the previous one so tokens survive a key rotation.
+    """
+    error: Optional[jose.JWTError] = None
+    for secret in get_jwt_secrets():
+        try:
+            decoded_token = jwt.decode(token, secret, algorithms=[ALGORITHM])
+            return JwtPayload(**decoded_token)
+        except (jose.ExpiredSignatureError, jose.exceptions.JWTClaimsError) as e:
+            # The signature matched, so another key won't help
+            error = e
+            break
+        except jose.JWTError as e:
+            error = e
+    LOGGER.error("Could not decode JWT token: %s", error)
+    raise CREDENTIALS_EXCEPTION
 
 
 def get_current_user_session(session_token: Annotated[str, Depends(oauth2_google)]) -> User:
-    """Returns the user from the session cookie if they're a valid user and the session is not expired."""
+    """Returns the user from the session cookie if they're a valid user and the session is not expired.
+
+    Users are cached by token `jti` after the first DB lookup, so repeat requests with the same token only pay for
+    verifying the JWT.
+    """
     LOGGER.info("Attempting to validate credentials...")
 
     decoded_token = decode_jwt_token(session_token)
 
-    if decoded_token.exp < datetime.utcnow().replace(tzinfo=timezone.utc):
+    now = datetime.utcnow().replace(tzinfo=timezone.utc)
+    if decoded_token.exp < now:
         LOGGER.error("Session token is expired.")
         raise CREDENTIALS_EXCEPTION
 
+    cached_user = USER_SESSION_CACHE.get(decoded_token.jti)
+    if cached_user is not None and cached_user.google_id == decoded_token.google_id:
+        return cached_user.model_copy()
+
     user_item = get_user_by_google_id(decoded_token.google_id)
 
     LOGGER.info(f"User item: {user_item}")
@@ -56,4 +76,7 @@ def get_current_user_session(session_token: Annotated[str, Depends(oauth2_google
     if user_item.disabled:
         LOGGER.error("User is disabled!")
         raise CREDENTIALS_EXCEPTION
-    return User(**user_item.model_dump())
+    user = User(**user_item.model_dump())
+    # Never cache a session past the token's own expiration
+    USER_SESSION_CACHE.set(decoded_token.jti, user, ttl_seconds=(decoded_token.exp - now).total_seconds())
+    return user.model_copy()
@@ -1,4 +1,5 @@
 import logging
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI
@@ -7,14 +8,29 @@ from fastapi.middleware.cors import CORSMiddleware
 from mangum import Mangum
 from starlette.middleware.sessions import SessionMiddleware
 
-from plant_api.constants import AWS_DEPLOYMENT_ENV, LOCAL_DEPLOYMENT_ENV, get_jwt_secret
+from plant_api.constants import (
+    AWS_DEPLOYMENT_ENV,
+    LOCAL_DEPLOYMENT_ENV,
+    NEXT_CURSOR_HEADER,
+    get_jwt_secret,
+)
 from plant_api.routers import auth, plants, images, users, testing, lineages
 from plant_api.utils.deployment import get_deployment_env
+from plant_api.utils.image_worker import shutdown_image_worker
 
 logging.basicConfig(level=logging.INFO)
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Let queued thumbnail jobs and plant deletions finish before the process goes away
+    images.shutdown_image_job_queue()
+    plants.shutdown_plant_deletion_queue()
+    shutdown_image_worker()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(SessionMiddleware, secret_key=get_jwt_secret())
 
@@ -36,6 +52,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
@@ -58,7 +75,21 @@ def test():
     return {"message": "I'm working"}
 
 
-handler = Mangum(app)
+# The lifespan only drains background work on shutdown. Mangum would run it around every invocation, and Lambda
+# freezes the process rather than shutting it down, so it's left off there.
+mangum_handler = Mangum(app, lifespan="off")
+
+
+def handler(event, context):
+    """Lambda entry point: S3 upload notifications go to the image recorder, scheduled events to the deletion sweep,
+    everything else to the API"""
+    if images.is_s3_event(event):
+        return {"images": [image.image_id for image in images.handle_s3_upload_event(event)]}
+    if plants.is_scheduled_event(event):
+        plants.resume_stale_plant_deletions()
+        return {}
+    return mangum_handler(event, context)
+
 
 # For debugging, run this instead of from console
 if __name__ == "__main__":
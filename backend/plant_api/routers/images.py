@@ -1,40 +1,72 @@
-import asyncio
-
-from aiobotocore.session import get_session
-
 import io
 import logging
+import re
+import tempfile
 from datetime import datetime
-from enum import Enum
 from typing import Annotated, Optional
+from urllib.parse import unquote_plus
 from uuid import UUID, uuid4
 
-from boto3.dynamodb.conditions import Key
-from fastapi import Depends, File, HTTPException, UploadFile
-from pydantic import TypeAdapter
+from boto3.dynamodb.conditions import Attr, Key
+from fastapi import Depends, File, HTTPException, Query, Response, UploadFile
+from pydantic import BaseModel, TypeAdapter
 from starlette import status
-
-from plant_api.constants import ACCESS_NOT_ALLOWED_EXCEPTION, AWS_REGION, IMAGES_FOLDER, S3_BUCKET_NAME, TABLE_NAME
+from starlette.concurrency import run_in_threadpool
+
+from plant_api.constants import (
+    ACCESS_NOT_ALLOWED_EXCEPTION,
+    IMAGES_FOLDER,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    S3_BUCKET_NAME,
+)
 from plant_api.dependencies import get_current_user_session
 from plant_api.routers.common import BaseRouter
 from plant_api.utils.db import (
+    add_to_user_counters,
+    batch_get_plants,
+    get_all_users,
     get_db_table,
+    iterate_items,
+    get_image_owner,
+    get_plant_owner,
+    make_image_owner_item,
+    make_image_owner_key,
     make_image_query_key,
+    make_plant_query_key,
     query_by_image_id,
     query_by_plant_id,
+    query_page,
+)
+from plant_api.utils.image_processing import (
+    DERIVATIVE_SPECS,
+    ImageSuffixes,
+    encode_image,
+    render_derivatives,
 )
+from plant_api.utils.image_worker import get_image_worker
+from plant_api.utils.jobs import JobQueue, create_job_queue
 from plant_api.utils.s3 import (
-    create_async_presigned_thumbnail_url,
-    create_presigned_urls_for_image,
+    create_presigned_image_post,
+    create_presigned_urls_for_images,
     get_s3_client,
+    get_s3_object_metadata,
+    s3_object_exists,
+    stream_upload_to_s3,
+)
+from plant_api.schema import (
+    EntityType,
+    ImageCreate,
+    ImageItem,
+    ImageProcessingStatus,
+    ImageUploadTicket,
+    PlantItem,
 )
-from plant_api.schema import EntityType, ImageItem
-from PIL import Image as img, ImageOps
 from PIL.Image import Image
 
 from fastapi import Form
 
-from plant_api.utils.db import deserialize_dynamodb_item, is_user_access_allowed
+from plant_api.utils.db import is_user_access_allowed
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -46,96 +78,312 @@ router = BaseRouter(
     responses={404: {"description": "Not found"}},
 )
 
-MAX_THUMB_X_PIXELS = 500
 
+# Direct-to-S3 uploads
+MAX_IMAGE_UPLOAD_BYTES = 50 * 1024 * 1024
+UPLOAD_URL_EXPIRATION_SEC = 15 * 60
+ORIGINAL_S3_KEY_REGEX = re.compile(
+    rf"^{IMAGES_FOLDER}/(?P<plant_id>[0-9a-f-]{{36}})/(?P<image_id>[0-9a-f-]{{36}})"
+    rf"_{ImageSuffixes.ORIGINAL.value}\.jpg$"
+)
 
-class ImageSuffixes(str, Enum):
-    ORIGINAL = "original"
-    THUMB = "thumb"
+# Originals uploaded with a presigned POST are tagged with this metadata. The S3 event handler only records those; the
+# originals the API uploads itself are recorded by the API, with the timestamp and hash the upload came with.
+UPLOAD_SOURCE_METADATA = "upload-source"
+PRESIGNED_POST_UPLOAD_SOURCE = "presigned-post"
 
 
-def make_s3_path_for_image(image_id: UUID, plant_id: UUID, image_suffix: str) -> str:
-    return f"{IMAGES_FOLDER}/{plant_id}/{image_id}_{image_suffix}.jpg"
+class ImageDerivativeJob(BaseModel):
+    user_id: str
+    plant_id: UUID
+    image_id: UUID
 
 
-def upload_image_to_s3(image: Image, image_id: UUID, plant_id: UUID, image_suffix) -> str:
+def make_s3_path_for_image(image_id: UUID, plant_id: UUID, image_suffix: str, extension: str = "jpg") -> str:
+    return f"{IMAGES_FOLDER}/{plant_id}/{image_id}_{image_suffix}.{extension}"
+
+
+def upload_bytes_to_s3(content: bytes, s3_path: str, content_type: Optional[str] = None) -> str:
     s3_client = get_s3_client()
+    extra_args = {"ContentType": content_type} if content_type else None
+    s3_client.upload_fileobj(io.BytesIO(content), S3_BUCKET_NAME, s3_path, ExtraArgs=extra_args)
+    return s3_path
+
 
-    buf = io.BytesIO()
-    image.save(buf, format="JPEG")
-    buf.seek(0)
+def upload_image_to_s3(image: Image, image_id: UUID, plant_id: UUID, image_suffix) -> str:
     s3_path = make_s3_path_for_image(image_id, plant_id, image_suffix)
-    s3_client.upload_fileobj(buf, S3_BUCKET_NAME, s3_path)
-    return s3_path
+    return upload_bytes_to_s3(get_image_worker().run(encode_image, image, "JPEG"), s3_path, "image/jpeg")
 
 
 def get_images_for_plant(plant_id: UUID) -> list[ImageItem]:
     table = get_db_table()
 
-    response = table.query(
+    items = iterate_items(
+        table.query,
         KeyConditionExpression=Key("PK").eq(f"PLANT#{plant_id}") & Key("SK").begins_with("IMAGE#"),
     )
-    return TypeAdapter(list[ImageItem]).validate_python(response["Items"])
+    return TypeAdapter(list[ImageItem]).validate_python(list(items))
+
+
+def get_images_page_for_plant(
+    plant_id: UUID, limit: int, cursor: Optional[str]
+) -> tuple[list[ImageItem], Optional[str]]:
+    """Returns one page of the plant's images and the cursor for the next page"""
+    items, next_cursor = query_page(get_db_table(), f"PLANT#{plant_id}", "IMAGE#", limit, cursor)
+    return TypeAdapter(list[ImageItem]).validate_python(items), next_cursor
+
+
+def make_image_from_latest_pointer(plant: PlantItem) -> Optional[ImageItem]:
+    """Builds the plant's most recent image from the pointer denormalized onto the plant item"""
+    if (
+        plant.latest_image_id is None
+        or plant.latest_image_timestamp is None
+        or plant.latest_image_full_photo_s3_url is None
+        or plant.latest_image_thumbnail_s3_url is None
+    ):
+        return None
+    return ImageItem(
+        PK=f"PLANT#{plant.plant_id}",
+        SK=f"IMAGE#{plant.latest_image_id}",
+        entity_type=EntityType.IMAGE,
+        full_photo_s3_url=plant.latest_image_full_photo_s3_url,
+        thumbnail_photo_s3_url=plant.latest_image_thumbnail_s3_url,
+        timestamp=plant.latest_image_timestamp,
+    )
 
 
-async def get_async_images_for_plant(client, plant_id: UUID) -> list[ImageItem]:
-    response = await client.query(
-        TableName=TABLE_NAME,
-        KeyConditionExpression="PK = :pk and begins_with(SK, :sk)",
-        ExpressionAttributeValues={
-            ":pk": {"S": f"PLANT#{plant_id}"},
-            ":sk": {"S": "IMAGE#"},
+def _latest_image_update_kwargs(image: Optional[ImageItem]) -> dict:
+    if image is None:
+        return {
+            "UpdateExpression": "REMOVE latest_image_id, latest_image_timestamp, latest_image_full_photo_s3_url, "
+            "latest_image_thumbnail_s3_url"
+        }
+    return {
+        "UpdateExpression": "SET latest_image_id = :id, latest_image_timestamp = :ts, "
+        "latest_image_full_photo_s3_url = :full, latest_image_thumbnail_s3_url = :thumb",
+        "ExpressionAttributeValues": {
+            ":id": image.image_id,
+            ":ts": image.dynamodb_dump()["timestamp"],
+            ":full": image.full_photo_s3_url,
+            ":thumb": image.thumbnail_photo_s3_url,
         },
+    }
+
+
+def set_latest_image_if_newer(table, user_id: str, image: ImageItem) -> None:
+    """Points the plant at the image unless the plant already points at a newer one"""
+    latest_timestamp = Attr("latest_image_timestamp")
+    try:
+        table.update_item(
+            Key=make_plant_query_key(user_id, UUID(image.plant_id)),
+            ConditionExpression=Attr("PK").exists()
+            & (
+                latest_timestamp.not_exists()
+                | latest_timestamp.attribute_type("NULL")
+                | latest_timestamp.lte(image.dynamodb_dump()["timestamp"])
+            ),
+            **_latest_image_update_kwargs(image),
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        logger.debug(f"Plant {image.plant_id} already points at a newer image than {image.image_id}")
+
+
+def refresh_latest_image_for_plant(table, user_id: str, plant_id: UUID) -> None:
+    """Recomputes the plant's latest image pointer from all of its images (e.g. after the latest one is removed)"""
+    images = get_images_for_plant(plant_id)
+    latest_image = max(images, key=lambda image: image.timestamp) if images else None
+    table.update_item(
+        Key=make_plant_query_key(user_id, plant_id),
+        ConditionExpression=Attr("PK").exists(),
+        **_latest_image_update_kwargs(latest_image),
     )
-    items = [await deserialize_dynamodb_item(item) for item in response["Items"]]
-    return TypeAdapter(list[ImageItem]).validate_python(items)
 
 
-async def get_async_most_recent_image_for_plant(client, plant_id: UUID) -> Optional[ImageItem]:
-    logger.debug(f"Fetching most recent image for plant {plant_id}")
-    images = await get_async_images_for_plant(client, plant_id)
-    # Sort images by timestamp
-    images.sort(key=lambda x: x.timestamp, reverse=True)
-    return images[0] if images else None
+def backfill_latest_image_pointers() -> None:
+    """Migration job: sets the latest image pointer of every plant written before plants had one"""
+    table = get_db_table()
+    for user in get_all_users():
+        plant_items = iterate_items(
+            table.query,
+            KeyConditionExpression=Key("PK").eq(f"USER#{user.google_id}") & Key("SK").begins_with("PLANT#"),
+            ProjectionExpression="SK",
+        )
+        for plant_item in plant_items:
+            try:
+                refresh_latest_image_for_plant(table, user.google_id, UUID(plant_item["SK"].split("#")[1]))
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                # Deleted since the query
+                continue
+
+
+def set_latest_image_thumbnail(table, user_id: str, image: ImageItem) -> None:
+    """Updates the plant's latest image pointer with the image's new thumbnail, if the pointer is still at it"""
+    try:
+        table.update_item(
+            Key=make_plant_query_key(user_id, UUID(image.plant_id)),
+            UpdateExpression="SET latest_image_thumbnail_s3_url = :thumb",
+            ConditionExpression=Attr("latest_image_id").eq(image.image_id),
+            ExpressionAttributeValues={":thumb": image.thumbnail_photo_s3_url},
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        logger.debug(f"Plant {image.plant_id} no longer points at image {image.image_id}")
+
+
+def _set_processing_failed(table, image_key: dict) -> Optional[ImageItem]:
+    try:
+        response = table.update_item(
+            Key=image_key,
+            UpdateExpression="SET processing_status = :status",
+            ConditionExpression=Attr("PK").exists(),
+            ExpressionAttributeValues={":status": ImageProcessingStatus.FAILED.value},
+            ReturnValues="ALL_NEW",
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return None
+    return ImageItem(**response["Attributes"])
+
+
+def generate_image_derivatives(job: ImageDerivativeJob) -> Optional[ImageItem]:
+    """Renders the image's thumbnails from the stored original, uploads them and marks the image READY.
+
+    Returns the updated image, or None if the image was deleted while it was being processed.
+    """
+    table = get_db_table()
+    s3_client = get_s3_client()
+    image_key = make_image_query_key(job.plant_id, job.image_id)
+    try:
+        original_s3_path = make_s3_path_for_image(job.image_id, job.plant_id, ImageSuffixes.ORIGINAL)
+        # Stream the original to disk and hand the worker a path, so it's never held in memory as raw bytes
+        with tempfile.NamedTemporaryFile() as original:
+            s3_client.download_fileobj(S3_BUCKET_NAME, original_s3_path, original)
+            original.flush()
+            derivatives = get_image_worker().run(render_derivatives, original.name)
+    except Exception as e:
+        logger.error(f"Could not process image {job.image_id}: {e}")
+        return _set_processing_failed(table, image_key)
+
+    s3_paths = {}
+    try:
+        for suffix, content in derivatives.items():
+            _, image_format, extension = DERIVATIVE_SPECS[suffix]
+            s3_paths[suffix] = upload_bytes_to_s3(
+                content,
+                make_s3_path_for_image(job.image_id, job.plant_id, suffix, extension),
+                f"image/{image_format.lower()}",
+            )
+    except Exception as e:
+        # Derivatives already uploaded are overwritten if the image is reprocessed
+        logger.error(f"Could not upload derivatives of image {job.image_id}: {e}")
+        return _set_processing_failed(table, image_key)
+
+    try:
+        response = table.update_item(
+            Key=image_key,
+            UpdateExpression="SET thumbnail_photo_s3_url = :thumb, small_thumbnail_photo_s3_url = :small, "
+            "webp_thumbnail_photo_s3_url = :webp, processing_status = :status",
+            ConditionExpression=Attr("PK").exists(),
+            ExpressionAttributeValues={
+                ":thumb": s3_paths[ImageSuffixes.THUMB],
+                ":small": s3_paths[ImageSuffixes.SMALL_THUMB],
+                ":webp": s3_paths[ImageSuffixes.THUMB_WEBP],
+                ":status": ImageProcessingStatus.READY.value,
+            },
+            ReturnValues="ALL_NEW",
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        logger.info(f"Image {job.image_id} was deleted while processing; removing its derivatives")
+        for s3_path in s3_paths.values():
+            s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=s3_path)
+        return None
+
+    image = ImageItem(**response["Attributes"])
+    set_latest_image_thumbnail(table, job.user_id, image)
+    return image
+
+
+_image_job_queue: Optional[JobQueue[ImageDerivativeJob, Optional[ImageItem]]] = None
+
+
+def get_image_job_queue() -> JobQueue[ImageDerivativeJob, Optional[ImageItem]]:
+    global _image_job_queue
+    if _image_job_queue is None:
+        _image_job_queue = create_job_queue(generate_image_derivatives)
+    return _image_job_queue
+
+
+def set_image_job_queue(queue: Optional[JobQueue[ImageDerivativeJob, Optional[ImageItem]]]) -> None:
+    """Swaps the queue derivative jobs are sent to (None goes back to the configured default on next use)"""
+    global _image_job_queue
+    _image_job_queue = queue
+
+
+def shutdown_image_job_queue() -> None:
+    if _image_job_queue is not None:
+        _image_job_queue.shutdown()
+    set_image_job_queue(None)
 
 
 @router.get("/plants/{plant_id}", response_model=list[ImageItem])
-async def get_all_images_for_plant(plant_id: UUID, user=Depends(get_current_user_session)) -> list[ImageItem]:
+async def get_all_images_for_plant(
+    plant_id: UUID,
+    response: Response,
+    user=Depends(get_current_user_session),
+    limit: Annotated[Optional[int], Query(ge=1, le=MAX_PAGE_SIZE)] = None,
+    cursor: Optional[str] = None,
+) -> list[ImageItem]:
+    """Returns the plant's images; all of them, or one page if `limit`/`cursor` is given.
+
+    When paging, the cursor for the next page is returned in the X-Next-Cursor header.
+    """
     plant = query_by_plant_id(get_db_table(), plant_id)
     if not is_user_access_allowed(user, plant.user_id):
         raise ACCESS_NOT_ALLOWED_EXCEPTION
-    images = get_images_for_plant(plant_id)
-    if not images:
+    if limit is None and cursor is None:
+        images = get_images_for_plant(plant_id)
+    else:
+        images, next_cursor = get_images_page_for_plant(plant_id, limit or MAX_PAGE_SIZE, cursor)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    # Only the first page can tell us the plant has no images at all
+    if not images and cursor is None:
         raise HTTPException(status_code=404, detail="Could not find images for plant.")
 
-    for image in images:
-        create_presigned_urls_for_image(image)
-
+    create_presigned_urls_for_images(images)
     return images
 
 
-# TODO: protect this route from non-public profile access (currently protected by obscurity of UUIDs)
-# TODO: write tests for this route
 @router.post("/plants/most_recent", response_model=list[Optional[ImageItem]])
 async def get_plants_most_recent_image(
-    plant_ids: list[UUID], user=Depends(get_current_user_session)
+    plant_ids: list[UUID],
+    user=Depends(get_current_user_session),
+    user_id: Optional[str] = None,
 ) -> list[ImageItem]:
-    """Returns a list of the most recent image for plant ids provided in the request body"""
-
-    aiosession = get_session()
+    """Returns a list of the most recent image for plant ids provided in the request body
 
-    async def fetch_image(plant_id: UUID):
-        async with aiosession.create_client("dynamodb", region_name=AWS_REGION) as client:
-            image = await get_async_most_recent_image_for_plant(client, plant_id)
-
-        if image:
-            await create_async_presigned_thumbnail_url(aiosession, image)
-        return image
-
-    # Use asyncio.gather to run fetch_image concurrently for each plant_id
-    images = await asyncio.gather(*(fetch_image(plant_id) for plant_id in plant_ids))
-
-    return [image for image in images if image]
+    Plants are resolved with BatchGetItem, reading the latest image pointer stored on each plant item rather than
+    querying each plant's images. They belong to `user_id` if it's given; otherwise the owner is looked up from the
+    plants themselves (one index query per distinct owner, so normally just one).
+    """
+    table = get_db_table()
+    plants_by_id: dict[Optional[str], PlantItem] = {}
+    unresolved = list(dict.fromkeys(plant_ids))
+    while unresolved:
+        owner_id = user_id or get_plant_owner(table, unresolved[0])
+        if owner_id is None:
+            # Plant doesn't exist
+            unresolved.pop(0)
+            continue
+        if not is_user_access_allowed(user, owner_id):
+            raise ACCESS_NOT_ALLOWED_EXCEPTION
+        plants_by_id.update((plant.plant_id, plant) for plant in batch_get_plants(owner_id, unresolved))
+        if user_id is not None:
+            break
+        unresolved = [plant_id for plant_id in unresolved[1:] if str(plant_id) not in plants_by_id]
+
+    plants = [plants_by_id[str(plant_id)] for plant_id in dict.fromkeys(plant_ids) if str(plant_id) in plants_by_id]
+    images = [image for image in (make_image_from_latest_pointer(plant) for plant in plants) if image]
+    create_presigned_urls_for_images(images, thumbnails_only=True)
+    return images
 
 
 # TODO: protect this route from non-public profile access (currently protected by obscurity of UUIDs)
@@ -148,6 +396,134 @@ async def get_image(image_id: UUID, user=Depends(get_current_user_session)):
     return image_response
 
 
+def get_own_plant(table, user_id: str, plant_id: UUID) -> PlantItem:
+    response = table.get_item(Key=make_plant_query_key(user_id, plant_id))
+    # A plant that is being deleted can't get new images
+    if "Item" not in response or response["Item"].get("deleted_at") is not None:
+        raise HTTPException(status_code=404, detail="Coul not find plant to attach image to for user.")
+    return PlantItem(**response["Item"])
+
+
+def get_image_item(table, plant_id: UUID, image_id: UUID) -> ImageItem:
+    response = table.get_item(Key=make_image_query_key(plant_id, image_id), ConsistentRead=True)
+    if "Item" not in response:
+        raise HTTPException(status_code=404, detail=f"Could not find image with ID {image_id}.")
+    return ImageItem(**response["Item"])
+
+
+def get_own_image_plant_id(table, user_id: str, image_id: UUID) -> UUID:
+    """Checks that the user owns the image and returns the ID of the plant it belongs to"""
+    owner_user_id, plant_id = get_image_owner(table, image_id)
+    if owner_user_id != user_id:
+        raise HTTPException(status_code=403, detail="User does not own plant.")
+    return plant_id
+
+
+def record_uploaded_image(
+    table,
+    user_id: str,
+    plant_id: UUID,
+    image_id: UUID,
+    timestamp: datetime,
+    original_sha256: Optional[str] = None,
+) -> tuple[ImageItem, bool]:
+    """Writes the (pending) ImageItem for an original that is already in S3.
+
+    Safe to call more than once for the same upload (e.g. the completion call and the S3 event both arriving): only
+    the first call writes the item and bumps the counters. Returns the image and whether this call created it.
+    """
+    original_s3_path = make_s3_path_for_image(image_id, plant_id, ImageSuffixes.ORIGINAL)
+    image_item = ImageItem(
+        PK=f"PLANT#{plant_id}",
+        SK=f"IMAGE#{image_id}",
+        entity_type=EntityType.IMAGE,
+        full_photo_s3_url=original_s3_path,
+        thumbnail_photo_s3_url=original_s3_path,
+        original_sha256=original_sha256,
+        processing_status=ImageProcessingStatus.PENDING,
+        timestamp=timestamp,
+        owner_user_id=user_id,
+    )
+    # Written with the item pointing from the image's ID to its plant and owner, for the image routes' access checks
+    client = table.meta.client
+    try:
+        client.transact_write_items(
+            TransactItems=[
+                {
+                    "Put": {
+                        "TableName": table.name,
+                        "Item": image_item.dynamodb_dump(),
+                        "ConditionExpression": "attribute_not_exists(SK)",
+                    }
+                },
+                {
+                    "Put": {
+                        "TableName": table.name,
+                        "Item": make_image_owner_item(image_item),
+                        "ConditionExpression": "attribute_not_exists(SK)",
+                    }
+                },
+            ]
+        )
+    except client.exceptions.TransactionCanceledException:
+        return get_image_item(table, plant_id, image_id), False
+    set_latest_image_if_newer(table, user_id, image_item)
+    add_to_user_counters(user_id, n_images=1)
+    return image_item, True
+
+
+def set_image_timestamp(table, user_id: str, image: ImageItem, timestamp: datetime) -> ImageItem:
+    """Updates only the image's timestamp (processing may be writing its other fields) and the plant's pointer"""
+    image_id, plant_id = UUID(image.image_id), UUID(image.plant_id)
+    response = table.update_item(
+        Key=make_image_query_key(plant_id, image_id),
+        UpdateExpression="SET #timestamp = :ts",
+        ConditionExpression=Attr("PK").exists(),
+        ExpressionAttributeNames={"#timestamp": "timestamp"},
+        ExpressionAttributeValues={":ts": timestamp.isoformat()},
+        ReturnValues="ALL_NEW",
+    )
+    refresh_latest_image_for_plant(table, user_id, plant_id)
+    return ImageItem(**response["Attributes"])
+
+
+def handle_s3_upload_event(event: dict) -> list[ImageItem]:
+    """Lambda handler for S3 ObjectCreated events on the images folder.
+
+    Records (and thumbnails) originals uploaded straight to S3 with a presigned POST, in case the client never makes
+    the completion call. Derivatives, originals the API uploaded itself and uploads already recorded are skipped.
+    """
+    table = get_db_table()
+    images = []
+    for record in event.get("Records", []):
+        s3_key = unquote_plus(record["s3"]["object"]["key"])
+        match = ORIGINAL_S3_KEY_REGEX.match(s3_key)
+        if match is None:
+            continue
+        metadata = get_s3_object_metadata(S3_BUCKET_NAME, s3_key)
+        if metadata is None or metadata.get(UPLOAD_SOURCE_METADATA) != PRESIGNED_POST_UPLOAD_SOURCE:
+            continue
+        plant_id, image_id = UUID(match["plant_id"]), UUID(match["image_id"])
+        try:
+            plant = query_by_plant_id(table, plant_id)
+        except HTTPException:
+            logger.warning(f"Got upload {s3_key} for a plant that doesn't exist")
+            continue
+        image_item, created = record_uploaded_image(table, plant.user_id, plant_id, image_id, datetime.utcnow())
+        if created:
+            processed_item = generate_image_derivatives(
+                ImageDerivativeJob(user_id=plant.user_id, plant_id=plant_id, image_id=image_id)
+            )
+            image_item = processed_item or image_item
+        images.append(image_item)
+    return images
+
+
+def is_s3_event(event: dict) -> bool:
+    records = event.get("Records") or [{}]
+    return records[0].get("eventSource") == "aws:s3"
+
+
 @router.post("/plants/{plant_id}", response_model=ImageItem)
 async def create_image(
     plant_id: UUID,
@@ -158,92 +534,148 @@ async def create_image(
 
     # Check if plant exists
     table = get_db_table()
-    response = table.get_item(Key={"PK": f"USER#{user.google_id}", "SK": f"PLANT#{plant_id}"})
-    if "Item" not in response:
-        raise HTTPException(status_code=404, detail="Coul not find plant to attach image to for user.")
+    get_own_plant(table, user.google_id, plant_id)
 
     image_id = uuid4()
-    image_content = await image_file.read()
-
-    # Save Original to S3
-    image = img.open(io.BytesIO(image_content))
-    image = _orient_image(image)
-    original_s3_path = upload_image_to_s3(image, image_id, plant_id, ImageSuffixes.ORIGINAL)
-
-    # Create thumbnail and save to S3 (I tried to break this out into a separate function but it didn't work...)
-    if image.width > MAX_THUMB_X_PIXELS:
-        ratio = MAX_THUMB_X_PIXELS / float(image.width)
-        new_size = (MAX_THUMB_X_PIXELS, int(image.height * ratio))
-        thumbnail = image.resize(new_size, img.Resampling.LANCZOS)
-    else:
-        logger.info(f"Image {image_id} is already smaller than {MAX_THUMB_X_PIXELS} pixels on the x-axis")
-        thumbnail = image
-    thumbnail_s3_path = upload_image_to_s3(thumbnail, image_id, plant_id, ImageSuffixes.THUMB)
+
+    # Stream the upload to S3 as-is; thumbnails are rendered from it by the derivative job queue
+    upload = await run_in_threadpool(
+        stream_upload_to_s3,
+        image_file.file,
+        S3_BUCKET_NAME,
+        make_s3_path_for_image(image_id, plant_id, ImageSuffixes.ORIGINAL),
+        image_file.content_type,
+    )
+    logger.debug(f"Uploaded image {image_id}: {upload}")
 
     if timestamp is None:
         timestamp = datetime.utcnow()
 
     # Save reference to DynamoDB
-    image_item = ImageItem(
-        PK=f"PLANT#{plant_id}",
-        SK=f"IMAGE#{image_id}",
-        entity_type=EntityType.IMAGE,
-        full_photo_s3_url=original_s3_path,
-        thumbnail_photo_s3_url=thumbnail_s3_path,
-        timestamp=timestamp,
+    image_item, created = record_uploaded_image(table, user.google_id, plant_id, image_id, timestamp, upload.sha256)
+    if not created:
+        return image_item
+
+    processed_item = await get_image_job_queue().submit(
+        ImageDerivativeJob(user_id=user.google_id, plant_id=plant_id, image_id=image_id)
     )
-    table.put_item(Item=image_item.dynamodb_dump())
-    return image_item
+    return processed_item or image_item
+
 
+@router.post("/plants/{plant_id}/uploads", response_model=ImageUploadTicket)
+async def create_image_upload(plant_id: UUID, user=Depends(get_current_user_session)) -> ImageUploadTicket:
+    """Starts a direct-to-S3 upload: returns a presigned POST for the image's original.
+
+    Once the client has uploaded the file, it calls the upload's complete route (if it doesn't, the S3 event handler
+    records the image instead).
+    """
+    get_own_plant(get_db_table(), user.google_id, plant_id)
+    image_id = uuid4()
+    s3_key = make_s3_path_for_image(image_id, plant_id, ImageSuffixes.ORIGINAL)
+    presigned_post = create_presigned_image_post(
+        S3_BUCKET_NAME,
+        s3_key,
+        MAX_IMAGE_UPLOAD_BYTES,
+        UPLOAD_URL_EXPIRATION_SEC,
+        metadata={UPLOAD_SOURCE_METADATA: PRESIGNED_POST_UPLOAD_SOURCE},
+    )
+    return ImageUploadTicket(
+        image_id=str(image_id),
+        s3_key=s3_key,
+        url=presigned_post["url"],
+        fields=presigned_post["fields"],
+        expires_in=UPLOAD_URL_EXPIRATION_SEC,
+    )
 
-def _orient_image(image: Image) -> Image:
-    return ImageOps.exif_transpose(image)
+
+@router.post("/plants/{plant_id}/uploads/{image_id}/complete", response_model=ImageItem)
+async def complete_image_upload(
+    plant_id: UUID,
+    image_id: UUID,
+    image_create: Optional[ImageCreate] = None,
+    user=Depends(get_current_user_session),
+):
+    """Records an image the client uploaded with a presigned POST and starts making its thumbnails"""
+    table = get_db_table()
+    get_own_plant(table, user.google_id, plant_id)
+    if not s3_object_exists(S3_BUCKET_NAME, make_s3_path_for_image(image_id, plant_id, ImageSuffixes.ORIGINAL)):
+        raise HTTPException(status_code=404, detail="Could not find the uploaded image in S3.")
+
+    timestamp = image_create.timestamp if image_create else datetime.utcnow()
+    image_item, created = record_uploaded_image(table, user.google_id, plant_id, image_id, timestamp)
+    if not created:
+        # The S3 event may have recorded it first, with the time the upload arrived instead of the client's
+        client_timestamp = image_create is not None and "timestamp" in image_create.model_fields_set
+        if client_timestamp and image_item.timestamp != timestamp:
+            image_item = set_image_timestamp(table, user.google_id, image_item, timestamp)
+        return image_item
+
+    processed_item = await get_image_job_queue().submit(
+        ImageDerivativeJob(user_id=user.google_id, plant_id=plant_id, image_id=image_id)
+    )
+    return processed_item or image_item
+
+
+def get_image_s3_paths(image: ImageItem) -> list[str]:
+    """The S3 keys of the image's original and derivatives (the thumbnail fields point at the original until then)"""
+    s3_paths = {
+        image.full_photo_s3_url,
+        image.thumbnail_photo_s3_url,
+        image.small_thumbnail_photo_s3_url,
+        image.webp_thumbnail_photo_s3_url,
+    }
+    return sorted(s3_path for s3_path in s3_paths if s3_path is not None)
 
 
 def delete_image_from_s3(image: ImageItem):
     s3_client = get_s3_client()
-    s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=image.full_photo_s3_url)
-    s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=image.thumbnail_photo_s3_url)
+    for s3_path in get_image_s3_paths(image):
+        s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=s3_path)
 
 
 @router.delete("/{image_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_image(image_id: UUID, user=Depends(get_current_user_session)):
     table = get_db_table()
-
-    # Check if image exists
-    image_response = query_by_image_id(table, image_id)
-    if not image_response:
+    plant_id = get_own_image_plant_id(table, user.google_id, image_id)
+
+    image = get_image_item(table, plant_id, image_id)
+    # S3 first, so if that fails the items that point at the objects are still there to retry the delete with
+    delete_image_from_s3(image)
+    client = table.meta.client
+    try:
+        client.transact_write_items(
+            TransactItems=[
+                {
+                    "Delete": {
+                        "TableName": table.name,
+                        "Key": make_image_query_key(plant_id, image_id),
+                        "ConditionExpression": "attribute_exists(SK)",
+                    }
+                },
+                {"Delete": {"TableName": table.name, "Key": make_image_owner_key(image_id)}},
+            ]
+        )
+    except client.exceptions.TransactionCanceledException:
+        # Deleted by a concurrent request, which counted it
         raise HTTPException(status_code=404, detail="Could not find image for plant.")
 
-    image_plant_id = UUID(image_response.PK.split("#")[1])
-
-    # Check if user owns plant
-    plant_response = query_by_plant_id(table, image_plant_id)
-    if not plant_response:
-        raise HTTPException(status_code=404, detail="Associated plant not found for image.")
-    if plant_response.PK != f"USER#{user.google_id}":
-        raise HTTPException(status_code=403, detail="User does not own plant.")
-
-    delete_image_from_s3(image_response)
-
-    table.delete_item(Key=make_image_query_key(image_plant_id, image_id))
+    add_to_user_counters(user.google_id, n_images=-1)
+    plant_response = table.get_item(Key=make_plant_query_key(user.google_id, plant_id))
+    if plant_response.get("Item", {}).get("latest_image_id") == str(image_id):
+        refresh_latest_image_for_plant(table, user.google_id, plant_id)
     return {"message": "Image deleted successfully"}
 
 
 @router.patch("/{image_id}", response_model=ImageItem)
 async def update_image(image_id: UUID, new_data: ImageItem, user=Depends(get_current_user_session)):
     table = get_db_table()
-    stored_item = query_by_image_id(table, image_id)
-
-    # Check to make sure attached plant exists and belongs to user
-    plant_response = query_by_plant_id(table, UUID(stored_item.PK.split("#")[1]))
-    if not plant_response:
-        raise HTTPException(status_code=404, detail="Associated plant not found for image.")
-    if plant_response.PK != f"USER#{user.google_id}":
-        raise HTTPException(status_code=403, detail="User does not own plant.")
+    plant_id = get_own_image_plant_id(table, user.google_id, image_id)
+    stored_item = get_image_item(table, plant_id, image_id)
 
-    update_data = new_data.model_dump(exclude_unset=True)
+    update_data = new_data.model_dump(exclude_unset=True, exclude={"owner_user_id"})
     updated_item = stored_item.model_copy(update=update_data)
 
     table.put_item(Item=updated_item.dynamodb_dump())
+    if updated_item.timestamp != stored_item.timestamp:
+        refresh_latest_image_for_plant(table, user.google_id, plant_id)
     return updated_item
@@ -1,17 +1,66 @@
+import asyncio
+import csv
+import io
 import logging
+import random
 import uuid
-from typing import Annotated
+from datetime import datetime, timedelta
+from typing import Annotated, Any, AsyncIterator, Callable, Optional
 from uuid import UUID
 
-from boto3.dynamodb.conditions import Attr, Key
-from fastapi import Depends, HTTPException, status
+from boto3.dynamodb.conditions import Attr, ConditionBase, Key
+from fastapi import Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
 
-from plant_api.constants import ACCESS_NOT_ALLOWED_EXCEPTION
+from plant_api.constants import (
+    ACCESS_NOT_ALLOWED_EXCEPTION,
+    ACTIVE_OWNER_ATTR,
+    ACTIVE_PLANTS_INDEX,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    OWNER_LOCATION_ATTR,
+    OWNER_SPECIES_ATTR,
+    PLANT_LOCATION_INDEX,
+    PLANT_SPECIES_INDEX,
+)
 from plant_api.dependencies import get_current_user_session
 from plant_api.routers.common import BaseRouter
-from plant_api.utils.db import get_db_table, query_by_plant_id
-from plant_api.schema import ImageItem, PlantCreate, PlantItem, PlantUpdate, User
-from plant_api.routers.images import delete_image_from_s3
+from plant_api.constants import S3_BUCKET_NAME
+from plant_api.utils.db import (
+    NOT_DELETED_CONDITION,
+    add_to_user_counters,
+    decode_cursor,
+    encode_cursor,
+    get_all_users,
+    get_db_table,
+    get_plant_by_human_id,
+    iterate_items,
+    make_human_id_item,
+    make_human_id_key,
+    make_image_owner_key,
+    make_image_query_key,
+    make_plant_query_key,
+    query_by_plant_id,
+)
+from plant_api.schema import (
+    BulkPlantImportResult,
+    BulkPlantRowError,
+    ImageItem,
+    PlantCreate,
+    PlantFilters,
+    PlantItem,
+    PlantSortField,
+    PlantStatus,
+    PlantUpdate,
+    User,
+)
+from plant_api.routers.images import get_image_s3_paths
+from plant_api.utils.ingestion import RetryPolicy
+from plant_api.utils.jobs import JobQueue, create_job_queue
+from plant_api.utils.lineage import invalidate_lineage_layout, update_lineage_layout
+from plant_api.utils.s3 import DELETE_OBJECTS_MAX_KEYS, delete_s3_objects
 
 from pydantic import TypeAdapter
 
@@ -21,6 +70,20 @@ LOGGER = logging.getLogger(__name__)
 
 PLANT_ROUTE = "/plants"
 
+# Images deleted per step of a plant's deletion: each has up to 4 S3 objects, so one step is one DeleteObjects call
+DELETION_PAGE_SIZE = DELETE_OBJECTS_MAX_KEYS // 4
+# Deletions tombstoned longer ago than this are taken to be interrupted, and are resumed by the sweep
+STALE_DELETION_AGE = timedelta(minutes=15)
+
+CSV_CONTENT_TYPE = "text/csv"
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/jsonl"}
+MAX_BULK_PLANTS = 5000
+MAX_BULK_BODY_BYTES = 10 * 1024 * 1024
+# Each plant is two items, and a transaction can write up to 100
+BULK_TRANSACTION_PLANTS = 50
+# For transactions cancelled by a conflicting write or throttling, rather than by a taken human_id
+BULK_TRANSACTION_RETRY_POLICY = RetryPolicy(attempts=5, base_delay_sec=0.05, max_delay_sec=1.0)
+
 router = BaseRouter(
     prefix=PLANT_ROUTE,
     dependencies=[Depends(get_current_user_session)],
@@ -28,52 +91,169 @@ router = BaseRouter(
 )
 
 
-def read_all_plants_for_user(user_id: str) -> list[PlantItem]:
-    pk_value = f"USER#{user_id}"
-    sk_value = "PLANT#"
-    table = get_db_table()
+def make_plants_query_kwargs(user_id: str, filters: PlantFilters, projection: Optional[list[str]] = None) -> dict:
+    """Query kwargs for the user's (not deleted) plants that pass the filters.
+
+    A location or species filter, or else the active status, is answered by its sparse index; the remaining filters
+    are applied as a FilterExpression. `projection` limits the attributes read (PK and SK are always included).
+    """
+    if filters.location is not None:
+        kwargs: dict = {
+            "IndexName": PLANT_LOCATION_INDEX,
+            "KeyConditionExpression": Key(OWNER_LOCATION_ATTR).eq(f"{user_id}#{filters.location}"),
+        }
+    elif filters.species is not None:
+        kwargs = {
+            "IndexName": PLANT_SPECIES_INDEX,
+            "KeyConditionExpression": Key(OWNER_SPECIES_ATTR).eq(f"{user_id}#{filters.species}"),
+        }
+    elif filters.status == PlantStatus.ACTIVE:
+        kwargs = {"IndexName": ACTIVE_PLANTS_INDEX, "KeyConditionExpression": Key(ACTIVE_OWNER_ATTR).eq(user_id)}
+    else:
+        kwargs = {"KeyConditionExpression": Key("PK").eq(f"USER#{user_id}") & Key("SK").begins_with("PLANT#")}
+
+    condition: ConditionBase = NOT_DELETED_CONDITION
+    if filters.location is not None and filters.species is not None:
+        condition &= Attr("species").eq(filters.species)
+    if filters.status == PlantStatus.ACTIVE and kwargs.get("IndexName") != ACTIVE_PLANTS_INDEX:
+        condition &= Attr("sink").not_exists() | Attr("sink").attribute_type("NULL")
+    elif filters.status == PlantStatus.SUNK:
+        condition &= Attr("sink").attribute_type("S")
+    if filters.name_prefix:
+        condition &= Attr("human_name").begins_with(filters.name_prefix)
+    kwargs["FilterExpression"] = condition
+
+    if projection is not None:
+        # Aliased, since plenty of plant attributes (location, source, ...) are DynamoDB reserved words
+        names = {f"#p{i}": name for i, name in enumerate(dict.fromkeys(["PK", "SK", *projection]))}
+        kwargs["ProjectionExpression"] = ", ".join(names)
+        kwargs["ExpressionAttributeNames"] = names
+    return kwargs
+
 
-    response = table.query(KeyConditionExpression=Key("PK").eq(pk_value) & Key("SK").begins_with(sk_value))
-    return TypeAdapter(list[PlantItem]).validate_python(response["Items"])
+def read_all_plants_for_user(user_id: str, filters: Optional[PlantFilters] = None) -> list[PlantItem]:
+    items = iterate_items(get_db_table().query, **make_plants_query_kwargs(user_id, filters or PlantFilters()))
+    return TypeAdapter(list[PlantItem]).validate_python(list(items))
+
+
+def read_plants_page_for_user(
+    user_id: str, limit: int, cursor: Optional[str], filters: Optional[PlantFilters] = None
+) -> tuple[list[PlantItem], Optional[str]]:
+    """Returns one page of the user's plants and the cursor for the next page"""
+    items, next_cursor = query_plants_page(user_id, filters or PlantFilters(), None, limit, cursor)
+    return TypeAdapter(list[PlantItem]).validate_python(items), next_cursor
+
+
+def query_plants_page(
+    user_id: str, filters: PlantFilters, projection: Optional[list[str]], limit: int, cursor: Optional[str]
+) -> tuple[list[dict], Optional[str]]:
+    """One page of plant items; with filters, a page can have fewer than `limit` plants and still not be the last.
+
+    The cursor is only valid with the same filters, as they decide the index queried and so the shape of its key.
+    """
+    kwargs = make_plants_query_kwargs(user_id, filters, projection)
+    kwargs["Limit"] = limit
+    scope = {"index": kwargs.get("IndexName"), "filters": filters.model_dump(mode="json")}
+    if cursor is not None:
+        kwargs["ExclusiveStartKey"] = decode_cursor(cursor, f"USER#{user_id}", scope=scope)
+    response = get_db_table().query(**kwargs)
+    return response["Items"], encode_cursor(response.get("LastEvaluatedKey"), scope)
+
+
+def parse_plant_fields(fields: str) -> list[str]:
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in PlantItem.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown plant fields: {', '.join(unknown)}")
+    return names
+
+
+def project_plant_item(item: dict, fields: list[str]) -> dict:
+    """The requested fields of a plant item read with a projection, plus its plant_id"""
+    derived = {"plant_id": item["SK"].split("#")[1], "user_id": item["PK"].split("#")[1]}
+    return {"plant_id": derived["plant_id"], **{name: derived.get(name, item.get(name)) for name in fields}}
 
 
 @router.get("/user/{user_id}/{human_id}", response_model=PlantItem)
-def get_plant_by_human_id(user_id: str, human_id: int, user: Annotated[User, Depends(get_current_user_session)]):
+def get_users_plant_by_human_id(
+    user_id: str, human_id: int, user: Annotated[User, Depends(get_current_user_session)]
+):
     if not is_user_access_allowed(user, user_id):
         raise ACCESS_NOT_ALLOWED_EXCEPTION
-    all_user_plants = read_all_plants_for_user(user_id)
-    for plant in all_user_plants:
-        if plant.human_id == human_id:
-            return plant
+    plant = get_plant_by_human_id(user_id, human_id)
+    if plant is None or plant.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Plant not found")
+    return plant
 
 
 @router.get("/user/{user_id}", response_model=list[PlantItem])
-async def all_plants(user_id: str, user: Annotated[User, Depends(get_current_user_session)]):
-    if is_user_access_allowed(user, user_id):
-        return read_all_plants_for_user(user_id)
-    raise ACCESS_NOT_ALLOWED_EXCEPTION
+async def all_plants(
+    user_id: str,
+    user: Annotated[User, Depends(get_current_user_session)],
+    response: Response,
+    limit: Annotated[Optional[int], Query(ge=1, le=MAX_PAGE_SIZE)] = None,
+    cursor: Optional[str] = None,
+    plant_status: Annotated[Optional[PlantStatus], Query(alias="status")] = None,
+    location: Optional[str] = None,
+    species: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    sort_by: Optional[PlantSortField] = None,
+    descending: bool = False,
+    fields: Annotated[Optional[str], Query(description="Comma-separated plant fields to return")] = None,
+):
+    """Returns the user's plants; all of them, or one page if `limit`/`cursor` is given.
+
+    Plants can be filtered by status, exact location or species, and a (case-sensitive) name prefix. With `fields`,
+    only those fields (and each plant's plant_id) are read and returned. Sorting is only available without paging.
+    When paging, the cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    if not is_user_access_allowed(user, user_id):
+        raise ACCESS_NOT_ALLOWED_EXCEPTION
+    paging = limit is not None or cursor is not None
+    if paging and sort_by is not None:
+        raise HTTPException(status_code=400, detail="Plants can't be sorted when paging.")
+    filters = PlantFilters(status=plant_status, location=location, species=species, name_prefix=name_prefix)
+    field_names = parse_plant_fields(fields) if fields is not None else None
+
+    if field_names is None:
+        if not paging:
+            plants = read_all_plants_for_user(user_id, filters)
+        else:
+            plants, next_cursor = read_plants_page_for_user(user_id, limit or MAX_PAGE_SIZE, cursor, filters)
+            if next_cursor:
+                response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        if sort_by is not None:
+            plants.sort(key=lambda plant: getattr(plant, sort_by.value), reverse=descending)
+        return plants
+
+    # Projected plants don't validate as PlantItems, so they're returned as-is rather than through response_model
+    projection = field_names + ([sort_by.value] if sort_by is not None else [])
+    if not paging:
+        items = list(iterate_items(get_db_table().query, **make_plants_query_kwargs(user_id, filters, projection)))
+        headers = {}
+    else:
+        items, next_cursor = query_plants_page(user_id, filters, projection, limit or MAX_PAGE_SIZE, cursor)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    if sort_by is not None:
+        items.sort(key=lambda item: item[sort_by.value], reverse=descending)
+    return JSONResponse(jsonable_encoder([project_plant_item(item, field_names) for item in items]), headers=headers)
 
 
 @router.get("/{plant_id}", response_model=PlantItem)
 def get_plant(plant_id: UUID, user: Annotated[User, Depends(get_current_user_session)]):
     table = get_db_table()
     response = query_by_plant_id(table, plant_id)
-    if is_user_access_allowed(user, response.user_id):
-        return response
-    raise ACCESS_NOT_ALLOWED_EXCEPTION
+    if not is_user_access_allowed(user, response.user_id):
+        raise ACCESS_NOT_ALLOWED_EXCEPTION
+    if response.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Plant not found")
+    return response
 
 
 @router.post("/create", response_model=PlantItem, status_code=status.HTTP_201_CREATED)
 async def create_plant(plant_data: PlantCreate, user: Annotated[User, Depends(get_current_user_session)]):
     LOGGER.info(f"Creating plant for user {user.google_id}")
     table = get_db_table()
-    # Query to check if a plant with the same human_id already exists for this user
-    response = table.query(
-        KeyConditionExpression=Key("PK").eq(f"USER#{user.google_id}") & Key("SK").begins_with("PLANT#"),
-        FilterExpression=Attr("human_id").eq(plant_data.human_id),
-    )
-    if response["Items"]:
-        raise HTTPException(status_code=400, detail="Duplicate Unique Plant IDs for the same user not allowed")
 
     # Create a new plant item
     plant_id = str(uuid.uuid4())
@@ -81,10 +261,192 @@ async def create_plant(plant_data: PlantCreate, user: Annotated[User, Depends(ge
         PK=f"USER#{user.google_id}", SK=f"PLANT#{plant_id}", entity_type="Plant", **plant_data.model_dump()
     )
 
-    table.put_item(Item=plant_item.dynamodb_dump())
+    # The plant is written together with the item reserving its human_id, so two concurrent creates can't both get it
+    client = table.meta.client
+    try:
+        client.transact_write_items(
+            TransactItems=[
+                {
+                    "Put": {
+                        "TableName": table.name,
+                        "Item": plant_item.dynamodb_dump(),
+                        "ConditionExpression": "attribute_not_exists(SK)",
+                    }
+                },
+                {
+                    "Put": {
+                        "TableName": table.name,
+                        "Item": make_human_id_item(plant_item),
+                        "ConditionExpression": "attribute_not_exists(SK)",
+                    }
+                },
+            ]
+        )
+    except client.exceptions.TransactionCanceledException:
+        raise HTTPException(status_code=400, detail="Duplicate Unique Plant IDs for the same user not allowed")
+    add_to_user_counters(user.google_id, n_total_plants=1, n_active_plants=0 if plant_item.sink else 1)
+    update_lineage_layout(user.google_id, None, plant_item)
     return plant_item
 
 
+def get_used_human_ids(user_id: str) -> set[int]:
+    """The human_ids of all of the user's plants, read from their human_id items"""
+    items = iterate_items(
+        get_db_table().query,
+        KeyConditionExpression=Key("PK").eq(f"USER#{user_id}") & Key("SK").begins_with("HUMANID#"),
+        ProjectionExpression="SK",
+    )
+    return {int(item["SK"].split("#")[1]) for item in items}
+
+
+def read_bulk_rows(content: str, content_type: str) -> list[tuple[int, Any]]:
+    """The (line number, row) pairs of a CSV (with a header row of PlantCreate fields) or NDJSON upload"""
+    if content_type == CSV_CONTENT_TYPE:
+        reader = csv.DictReader(io.StringIO(content))
+        return [(reader.line_num, row) for row in reader]
+    return [(line_number, line) for line_number, line in enumerate(content.splitlines(), 1) if line.strip()]
+
+
+def validate_bulk_plants(
+    rows: list[tuple[int, Any]], content_type: str, used_human_ids: set[int]
+) -> tuple[list[tuple[int, PlantCreate]], list[BulkPlantRowError]]:
+    """Validates every row of an upload, returning the valid plants with their line numbers and the errors.
+
+    Rows are checked the same way as a single create, plus their human_ids must be unused and unique in the upload.
+    """
+    validate: Callable[[Any], PlantCreate]
+    validate = PlantCreate.model_validate if content_type == CSV_CONTENT_TYPE else PlantCreate.model_validate_json
+
+    plants, errors = [], []
+    lines_by_human_id: dict[int, int] = {}
+    for line_number, row in rows:
+        try:
+            plant = validate(row)
+        except ValidationError as e:
+            messages = [f"{'.'.join(map(str, error['loc'])) or 'row'}: {error['msg']}" for error in e.errors()]
+            errors.append(BulkPlantRowError(line=line_number, errors=messages))
+            continue
+        if plant.human_id in used_human_ids:
+            errors.append(BulkPlantRowError(line=line_number, errors=[f"human_id {plant.human_id} is already used"]))
+        elif plant.human_id in lines_by_human_id:
+            errors.append(
+                BulkPlantRowError(
+                    line=line_number,
+                    errors=[f"human_id {plant.human_id} is also on line {lines_by_human_id[plant.human_id]}"],
+                )
+            )
+        else:
+            lines_by_human_id[plant.human_id] = line_number
+            plants.append((line_number, plant))
+    return plants, errors
+
+
+async def read_body_up_to(request: Request, max_bytes: int) -> bytes:
+    """Reads the request body, with a 413 as soon as it's known to be longer than `max_bytes`"""
+    too_large = HTTPException(status_code=413, detail=f"Upload can't be larger than {max_bytes} bytes.")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+
+async def write_bulk_plants(
+    table, plant_items: list[tuple[int, PlantItem]], rng: random.Random
+) -> AsyncIterator[tuple[list[PlantItem], list[BulkPlantRowError]]]:
+    """Writes plants with their human_id items, BULK_TRANSACTION_PLANTS plants per transaction, yielding the plants
+    created and the rows that failed after each transaction.
+
+    Like a single create, both items are conditional, so a human_id taken since the import was validated isn't
+    shared: that plant isn't written, and its row is reported instead, while the rest of its transaction is retried.
+    Transactions cancelled for other reasons (a conflicting write, throttling) are retried with backoff, and the last
+    error is raised once out of attempts.
+    """
+    client = table.meta.client
+    for chunk_start in range(0, len(plant_items), BULK_TRANSACTION_PLANTS):
+        chunk = plant_items[chunk_start : chunk_start + BULK_TRANSACTION_PLANTS]
+        errors: list[BulkPlantRowError] = []
+        retry = 0
+        while chunk:
+            transact_items = [
+                {"Put": {"TableName": table.name, "Item": item, "ConditionExpression": "attribute_not_exists(SK)"}}
+                for _, plant_item in chunk
+                for item in (plant_item.dynamodb_dump(), make_human_id_item(plant_item))
+            ]
+            try:
+                client.transact_write_items(TransactItems=transact_items)
+            except client.exceptions.TransactionCanceledException as e:
+                reasons = e.response.get("CancellationReasons", [])
+                failed = {i // 2 for i, reason in enumerate(reasons) if reason.get("Code") == "ConditionalCheckFailed"}
+                if failed:
+                    for i in sorted(failed):
+                        line_number, plant_item = chunk[i]
+                        error = f"human_id {plant_item.human_id} was taken while the upload was imported"
+                        errors.append(BulkPlantRowError(line=line_number, errors=[error]))
+                    chunk = [row for i, row in enumerate(chunk) if i not in failed]
+                    continue
+                if retry == BULK_TRANSACTION_RETRY_POLICY.attempts - 1:
+                    raise
+                delay = BULK_TRANSACTION_RETRY_POLICY.get_delay(retry, rng)
+                retry += 1
+                LOGGER.info(f"Retrying bulk plant transaction in {delay:.2f}s after cancellation: {reasons}")
+                await asyncio.sleep(delay)
+                continue
+            break
+        yield [plant_item for _, plant_item in chunk], errors
+
+
+@router.post("/bulk", response_model=BulkPlantImportResult, status_code=status.HTTP_201_CREATED)
+async def create_plants_in_bulk(request: Request, user: Annotated[User, Depends(get_current_user_session)]):
+    """Creates many plants from a CSV (text/csv) or NDJSON (application/x-ndjson) body.
+
+    All rows are validated before anything is written: if any row is invalid, none are created and the 422 response
+    lists the errors of each bad row. Plants are then created the same way as single creates; rows whose human_id was
+    taken by a plant created concurrently aren't created, and are listed in the result's errors.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != CSV_CONTENT_TYPE and content_type not in NDJSON_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail="Upload plants as text/csv or application/x-ndjson.")
+    try:
+        content = (await read_body_up_to(request, MAX_BULK_BODY_BYTES)).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Upload must be UTF-8 encoded.")
+
+    rows = read_bulk_rows(content, content_type)
+    if len(rows) > MAX_BULK_PLANTS:
+        raise HTTPException(status_code=400, detail=f"Can't create more than {MAX_BULK_PLANTS} plants at once.")
+    plants, errors = validate_bulk_plants(rows, content_type, get_used_human_ids(user.google_id))
+    if errors:
+        raise HTTPException(status_code=422, detail=[error.model_dump() for error in errors])
+
+    LOGGER.info(f"Creating {len(plants)} plants for user {user.google_id}")
+    plant_items = [
+        (
+            line_number,
+            PlantItem(
+                PK=f"USER#{user.google_id}", SK=f"PLANT#{uuid.uuid4()}", entity_type="Plant", **plant.model_dump()
+            ),
+        )
+        for line_number, plant in plants
+    ]
+    created: list[PlantItem] = []
+    try:
+        async for chunk_created, chunk_errors in write_bulk_plants(get_db_table(), plant_items, random.Random()):
+            created.extend(chunk_created)
+            errors.extend(chunk_errors)
+    finally:
+        # Earlier transactions are committed even if a later one raises, so count what was written either way
+        n_active = sum(1 for plant_item in created if not plant_item.sink)
+        add_to_user_counters(user.google_id, n_total_plants=len(created), n_active_plants=n_active)
+        # Cheaper to rebuild the layout once on the next view than to apply each plant to it
+        invalidate_lineage_layout(user.google_id)
+    return BulkPlantImportResult(n_created=len(created), errors=errors)
+
+
 @router.patch("/{plant_id}", response_model=PlantItem)
 async def update_plant(plant_id: UUID, new_data: PlantUpdate, user=Depends(get_current_user_session)):
     table = get_db_table()
@@ -99,33 +461,156 @@ async def update_plant(plant_id: UUID, new_data: PlantUpdate, user=Depends(get_c
     update_data = new_data.model_dump(exclude_unset=True)
     updated_item = stored_item.model_copy(update=update_data)
 
-    table.put_item(Item=updated_item.dynamodb_dump())
+    # Mustn't overwrite a tombstone written since the read
+    try:
+        table.put_item(Item=updated_item.dynamodb_dump(), ConditionExpression=NOT_DELETED_CONDITION)
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        raise HTTPException(status_code=404, detail="Plant not found")
+    # Sinking a plant (or un-sinking it) changes the user's active plant count
+    was_active, is_active = not stored_item.sink, not updated_item.sink
+    add_to_user_counters(user.google_id, n_active_plants=int(is_active) - int(was_active))
+    update_lineage_layout(user.google_id, stored_item, updated_item)
     return updated_item
 
 
-@router.delete("/{plant_id}", status_code=status.HTTP_204_NO_CONTENT)
+class PlantDeletionJob(BaseModel):
+    user_id: str
+    plant_id: UUID
+
+
+def delete_plant_and_images(job: PlantDeletionJob) -> None:
+    """Deletes a tombstoned plant's images (S3 objects, then items) a page at a time, then the plant itself.
+
+    Idempotent, so a deletion that was interrupted is finished by running it again: every step deletes what's left,
+    and the tombstoned plant item is only removed once its images are gone. Plants without a tombstone are left alone.
+    """
+    table = get_db_table()
+    response = table.get_item(Key=make_plant_query_key(job.user_id, job.plant_id), ConsistentRead=True)
+    if "Item" not in response:
+        LOGGER.info(f"Plant {job.plant_id} is already deleted")
+        return
+    plant = PlantItem(**response["Item"])
+    if plant.deleted_at is None:
+        LOGGER.warning(f"Not deleting plant {job.plant_id}: its deletion hasn't been started")
+        return
+
+    # Each page is deleted before the next query, so the first page of what's left is always the next one
+    while True:
+        response = table.query(
+            KeyConditionExpression=Key("PK").eq(f"PLANT#{job.plant_id}") & Key("SK").begins_with("IMAGE#"),
+            ConsistentRead=True,
+            Limit=DELETION_PAGE_SIZE,
+        )
+        images = TypeAdapter(list[ImageItem]).validate_python(response["Items"])
+        # S3 first: if this fails, the items are still there to find the objects by on the next run
+        delete_s3_objects(S3_BUCKET_NAME, [s3_path for image in images for s3_path in get_image_s3_paths(image)])
+        with table.batch_writer() as batch:
+            for image in images:
+                batch.delete_item(Key=make_image_query_key(job.plant_id, UUID(image.image_id)))
+                batch.delete_item(Key=make_image_owner_key(UUID(image.image_id)))
+        add_to_user_counters(job.user_id, n_images=-len(images))
+        if "LastEvaluatedKey" not in response:
+            break
+
+    # Releases the human_id along with the plant; if the plant is already gone, another run finished the deletion
+    client = table.meta.client
+    try:
+        client.transact_write_items(
+            TransactItems=[
+                {
+                    "Delete": {
+                        "TableName": table.name,
+                        "Key": make_plant_query_key(job.user_id, job.plant_id),
+                        "ConditionExpression": "attribute_type(deleted_at, :string)",
+                        "ExpressionAttributeValues": {":string": "S"},
+                    }
+                },
+                {"Delete": {"TableName": table.name, "Key": make_human_id_key(job.user_id, plant.human_id)}},
+            ]
+        )
+    except client.exceptions.TransactionCanceledException:
+        LOGGER.info(f"Plant {job.plant_id} was deleted by another run")
+        return
+    add_to_user_counters(job.user_id, n_total_plants=-1, n_active_plants=0 if plant.sink else -1)
+
+
+_plant_deletion_queue: Optional[JobQueue[PlantDeletionJob, None]] = None
+
+
+def get_plant_deletion_queue() -> JobQueue[PlantDeletionJob, None]:
+    global _plant_deletion_queue
+    if _plant_deletion_queue is None:
+        _plant_deletion_queue = create_job_queue(delete_plant_and_images)
+    return _plant_deletion_queue
+
+
+def set_plant_deletion_queue(queue: Optional[JobQueue[PlantDeletionJob, None]]) -> None:
+    """Swaps the queue plant deletions are sent to (None goes back to the configured default on next use)"""
+    global _plant_deletion_queue
+    _plant_deletion_queue = queue
+
+
+def shutdown_plant_deletion_queue() -> None:
+    if _plant_deletion_queue is not None:
+        _plant_deletion_queue.shutdown()
+    set_plant_deletion_queue(None)
+
+
+def resume_stale_plant_deletions(max_age: timedelta = STALE_DELETION_AGE) -> None:
+    """Sweep job: runs the deletion again for every plant tombstoned more than `max_age` ago.
+
+    Tombstoned plants are hidden from every read, so an interrupted deletion can't be resumed from the app; until
+    it's finished, the plant also keeps its human_id. One plant failing again doesn't stop the sweep.
+    """
+    table = get_db_table()
+    cutoff = (datetime.utcnow() - max_age).isoformat()
+    for user in get_all_users():
+        plant_items = iterate_items(
+            table.query,
+            KeyConditionExpression=Key("PK").eq(f"USER#{user.google_id}") & Key("SK").begins_with("PLANT#"),
+            FilterExpression=Attr("deleted_at").attribute_type("S") & Attr("deleted_at").lt(cutoff),
+            ProjectionExpression="plant_id",
+        )
+        for plant_item in plant_items:
+            LOGGER.info(f"Resuming the deletion of plant {plant_item['plant_id']}")
+            try:
+                delete_plant_and_images(PlantDeletionJob(user_id=user.google_id, plant_id=plant_item["plant_id"]))
+            except Exception:
+                LOGGER.exception(f"Could not finish deleting plant {plant_item['plant_id']}")
+
+
+def is_scheduled_event(event: dict) -> bool:
+    return event.get("source") == "aws.events" and event.get("detail-type") == "Scheduled Event"
+
+
+@router.delete("/{plant_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_plant(plant_id: UUID, user=Depends(get_current_user_session)):
+    """Tombstones the plant and queues the deletion of it and its images.
+
+    Deleting a plant that is already being deleted queues its deletion again, which resumes it if it was interrupted;
+    deletions left interrupted are also resumed by the sweep, `resume_stale_plant_deletions`.
+    """
     table = get_db_table()
-    pk = f"USER#{user.google_id}"
-    sk = f"PLANT#{str(plant_id)}"
+    key = make_plant_query_key(user.google_id, plant_id)
 
     # Check if the plant exists and belongs to the user
-    response = table.get_item(Key={"PK": pk, "SK": sk})
+    response = table.get_item(Key=key)
     if "Item" not in response:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Plant not found")
 
-    # Delete the plant item from DB
-    table.delete_item(Key={"PK": pk, "SK": sk})
+    plant = PlantItem(**response["Item"])
+    if plant.deleted_at is None:
+        try:
+            table.update_item(
+                Key=key,
+                UpdateExpression="SET deleted_at = :now",
+                ConditionExpression=Attr("PK").exists(),
+                ExpressionAttributeValues={":now": datetime.utcnow().isoformat()},
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Plant not found")
+        # Hidden from the lineage from now on, like from every other read
+        update_lineage_layout(user.google_id, plant, None)
 
-    # Delete all images associated with the plant from DB and S3
-    response = table.query(
-        KeyConditionExpression=Key("PK").eq(f"PLANT#{plant_id}") & Key("SK").begins_with("IMAGE#"),
-    )
-    # Parse the response out as a list of ImageItems
-    image_items = [ImageItem(**item) for item in response["Items"]]
-    for image_item in image_items:
-        table.delete_item(Key={"PK": image_item.PK, "SK": image_item.SK})
-        # delete from S3
-        delete_image_from_s3(image_item)
-
-    return {"message": "Plant deleted successfully"}
+    await get_plant_deletion_queue().submit(PlantDeletionJob(user_id=user.google_id, plant_id=plant_id))
+    return {"message": "Plant deletion started"}
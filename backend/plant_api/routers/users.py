@@ -1,13 +1,16 @@
-from typing import Annotated
+from typing import Annotated, Optional
 
+from boto3.dynamodb.conditions import Attr
 from pydantic import BaseModel
 from plant_api.routers.common import BaseRouter
 
+from plant_api.constants import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
 from plant_api.dependencies import get_current_user_session
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Query, Response
 
-from plant_api.utils.db import get_all_active_users, get_db_table, get_n_plants_for_user
-from plant_api.schema import DeAnonUser, User, UserItem
+from plant_api.utils.cache import invalidate_user_sessions
+from plant_api.utils.db import get_all_active_users, get_db_table, get_users_page
+from plant_api.schema import DeAnonUser, User
 
 router = BaseRouter(
     prefix="/users",
@@ -17,13 +20,22 @@ router = BaseRouter(
 
 
 @router.get("/", response_model=list[DeAnonUser])
-async def get_users():
-    # TODO: add get number of images for user and add to user return
-    users = get_all_active_users()
-    for user in users:
-        total_plants, active_plants = get_n_plants_for_user(user)
-        user.n_total_plants = total_plants
-        user.n_active_plants = active_plants
+async def get_users(
+    response: Response,
+    limit: Annotated[Optional[int], Query(ge=1, le=MAX_PAGE_SIZE)] = None,
+    cursor: Optional[str] = None,
+):
+    """Returns the active users; all of them, or one page if `limit`/`cursor` is given.
+
+    When paging, the cursor for the next page is returned in the X-Next-Cursor header.
+    Plant and image counts come from the counters stored on each user item.
+    """
+    if limit is None and cursor is None:
+        users = get_all_active_users()
+    else:
+        users, next_cursor = get_users_page(limit or MAX_PAGE_SIZE, cursor, active_only=True)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return [DeAnonUser(**user.model_dump()) for user in users]
 
 
@@ -39,15 +51,15 @@ class VisibilitySettings(BaseModel):
 @router.post("/settings/visibility")
 async def set_visibility(settings: VisibilitySettings, user: Annotated[User, Depends(get_current_user_session)]):
     table = get_db_table()
-    pk = f"USER#{user.google_id}"
-    sk = f"USER#{user.google_id}"
-
-    # Retrieve the existing plant
-    response = table.get_item(Key={"PK": pk, "SK": sk})
-    if "Item" not in response:
+    # Only sets the one attribute, so counter updates landing at the same time aren't overwritten
+    try:
+        table.update_item(
+            Key={"PK": f"USER#{user.google_id}", "SK": f"USER#{user.google_id}"},
+            UpdateExpression="SET is_public_profile = :is_public",
+            ConditionExpression=Attr("PK").exists(),
+            ExpressionAttributeValues={":is_public": settings.is_public},
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
         raise HTTPException(status_code=404, detail="User not found")
-    item = UserItem(**response["Item"])
-    item.is_public_profile = settings.is_public
-
-    table.put_item(Item=item.dynamodb_dump())
+    invalidate_user_sessions(user.google_id)
     return {"visibility": settings.is_public}
@@ -4,7 +4,7 @@ from typing import Any, Dict, Optional, Union
 
 from pydantic import BaseModel, Field, field_validator, model_validator
 
-from plant_api.constants import UNSET
+from plant_api.constants import ACTIVE_OWNER_ATTR, OWNER_LOCATION_ATTR, OWNER_SPECIES_ATTR, UNSET
 
 
 class ItemKeys(str, Enum):
@@ -12,6 +12,8 @@ class ItemKeys(str, Enum):
     PLANT = "PLANT"
     IMAGE = "IMAGE"
     SOURCE = "SOURCE"
+    HUMAN_ID = "HUMANID"
+    OWNER = "OWNER"
 
 
 class EntityType(str, Enum):
@@ -31,6 +33,25 @@ class SinkType(str, Enum):
     OTHER = "Other"
 
 
+class ImageProcessingStatus(str, Enum):
+    """Where an image is in the derivative (thumbnail) pipeline. Images from before the pipeline are all READY."""
+
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class PlantStatus(str, Enum):
+    ACTIVE = "active"
+    SUNK = "sunk"
+
+
+class PlantSortField(str, Enum):
+    HUMAN_ID = "human_id"
+    HUMAN_NAME = "human_name"
+    SOURCE_DATE = "source_date"
+
+
 USER_KEY_PATTERN = f"^{ItemKeys.USER.value}#"
 PLANT_KEY_PATTERN = f"^{ItemKeys.PLANT.value}#"
 IMAGE_KEY_PATTERN = f"^{ItemKeys.IMAGE.value}#"
@@ -55,6 +76,7 @@ class DeAnonUser(BaseModel):
     created_at: datetime
     n_total_plants: int
     n_active_plants: int
+    n_images: int = 0
 
 
 # TODO: try to consolidate User and UserItem
@@ -69,6 +91,7 @@ class User(BaseModel):
     is_public_profile: Optional[bool] = None
     n_total_plants: Optional[int] = None
     n_active_plants: Optional[int] = None
+    n_images: Optional[int] = None
 
     @model_validator(mode="before")
     def set_last_initial(cls, values):
@@ -91,6 +114,10 @@ class UserItem(DynamoDBMixin):
     disabled: Optional[bool] = True
     google_id: str
     created_at: datetime
+    # Counters maintained with atomic ADD updates by the plant and image routes (see utils.db.add_to_user_counters)
+    n_total_plants: int = 0
+    n_active_plants: int = 0
+    n_images: int = 0
 
     @model_validator(mode="before")
     def extract_google_id(cls, values: Dict[str, Any]) -> Dict[str, Any]:
@@ -153,6 +180,13 @@ class PlantItem(PlantCreate):
     entity_type: str = Field(EntityType.PLANT)
     plant_id: Optional[str] = None
     user_id: str = UNSET
+    # Denormalized pointer to the plant's most recent image, kept up to date by the image routes
+    latest_image_id: Optional[str] = None
+    latest_image_timestamp: Optional[datetime] = None
+    latest_image_full_photo_s3_url: Optional[str] = None
+    latest_image_thumbnail_s3_url: Optional[str] = None
+    # Tombstone: set when the plant's deletion starts; the plant item itself is deleted last
+    deleted_at: Optional[datetime] = None
 
     @model_validator(mode="before")
     def extract_plant_id(cls, values: Dict[str, Any]) -> Dict[str, Any]:
@@ -166,15 +200,65 @@ class PlantItem(PlantCreate):
         values["user_id"] = values["PK"].split("#")[1]
         return values
 
+    def get_index_attributes(self) -> dict[str, str]:
+        """Hash keys of the sparse plant indexes the plant belongs in (see constants.ACTIVE_PLANTS_INDEX)"""
+        attributes = {}
+        if self.sink is None:
+            attributes[ACTIVE_OWNER_ATTR] = self.user_id
+        if self.location is not None:
+            attributes[OWNER_LOCATION_ATTR] = f"{self.user_id}#{self.location}"
+        if self.species is not None:
+            attributes[OWNER_SPECIES_ATTR] = f"{self.user_id}#{self.species}"
+        return attributes
+
+    def dynamodb_dump(self) -> dict:
+        """Includes the index keys; ones that don't apply are left out rather than stored as NULL, which GSIs reject"""
+        return {**super().dynamodb_dump(), **self.get_index_attributes()}
+
+
+class PlantFilters(BaseModel):
+    status: Optional[PlantStatus] = None
+    location: Optional[str] = None
+    species: Optional[str] = None
+    name_prefix: Optional[str] = None
+
+
+class BulkPlantRowError(BaseModel):
+    """Why one row of a bulk plant import was rejected; `line` is the row's line number in the uploaded file"""
+
+    line: int
+    errors: list[str]
+
+
+class BulkPlantImportResult(BaseModel):
+    """`errors` lists the rows that passed validation but weren't created, as their human_id was taken meanwhile"""
+
+    n_created: int
+    errors: list[BulkPlantRowError] = []
+
 
 class ImageCreate(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 
+class ImageUploadTicket(BaseModel):
+    """Presigned POST for uploading an image straight to S3, to be followed by a call to the upload's complete route"""
+
+    image_id: str
+    s3_key: str
+    url: str
+    fields: dict[str, str]
+    expires_in: int
+
+
 class ImageBase(DynamoDBMixin):
     full_photo_s3_url: str
     thumbnail_photo_s3_url: str
     small_thumbnail_photo_s3_url: Optional[str] = None
+    webp_thumbnail_photo_s3_url: Optional[str] = None
+    original_sha256: Optional[str] = None
+    # Until processing finishes, the thumbnail fields point at the original upload
+    processing_status: ImageProcessingStatus = ImageProcessingStatus.READY
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -186,6 +270,8 @@ class ImageItem(ImageBase):
     entity_type: str = Field(EntityType.IMAGE)
     image_id: Optional[str] = None
     plant_id: Optional[str] = None
+    # Google ID of the plant's owner, stamped when the image is recorded (None on images from before that)
+    owner_user_id: Optional[str] = None
 
     @model_validator(mode="before")
     def extract_image_id(cls, values: Dict[str, Any]) -> Dict[str, Any]:
@@ -0,0 +1,84 @@
+import os
+import threading
+from typing import Any, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.credentials import Credentials
+
+MAX_POOL_CONNECTIONS_ENV_VAR = "AWS_MAX_POOL_CONNECTIONS"
+TCP_KEEPALIVE_ENV_VAR = "AWS_TCP_KEEPALIVE"
+DEFAULT_MAX_POOL_CONNECTIONS = 25
+
+# Building a boto3 client costs tens of milliseconds, so we build one per service/region and reuse it.
+# Clients are thread-safe and shared by every thread; resources aren't, so each thread gets its own.
+_clients: dict[tuple[str, Optional[str]], Any] = {}
+_clients_lock = threading.Lock()
+_thread_resources = threading.local()
+_credentials: Optional[Credentials] = None
+# Bumped on reset so threads know to drop the resources they built before it
+_generation = 0
+
+
+def get_pool_settings() -> dict[str, Any]:
+    """The connection-pool settings shared by every pooled client"""
+    return {
+        "max_pool_connections": int(os.getenv(MAX_POOL_CONNECTIONS_ENV_VAR, DEFAULT_MAX_POOL_CONNECTIONS)),
+        "tcp_keepalive": os.getenv(TCP_KEEPALIVE_ENV_VAR, "true").lower() == "true",
+        "retries": {"mode": "standard"},
+    }
+
+
+def get_boto_config() -> Config:
+    return Config(**get_pool_settings())
+
+
+def get_aws_client(service_name: str, region_name: Optional[str] = None) -> Any:
+    """Returns the shared low-level client for the service/region, creating it on first use"""
+    key = (service_name, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        # Another thread may have built it while we waited for the lock
+        if key not in _clients:
+            _clients[key] = boto3.client(  # type: ignore[call-overload]
+                service_name, region_name=region_name, config=get_boto_config()
+            )
+        return _clients[key]
+
+
+def get_aws_resource(service_name: str, region_name: Optional[str] = None) -> Any:
+    """Returns this thread's resource for the service/region, creating it on first use"""
+    resources = getattr(_thread_resources, "resources", None)
+    if resources is None or getattr(_thread_resources, "generation", None) != _generation:
+        resources = _thread_resources.resources = {}
+        _thread_resources.generation = _generation
+    key = (service_name, region_name)
+    if key not in resources:
+        resources[key] = boto3.resource(  # type: ignore[call-overload]
+            service_name, region_name=region_name, config=get_boto_config()
+        )
+    return resources[key]
+
+
+def get_aws_credentials() -> Optional[Credentials]:
+    """Returns the default credential chain's credentials (None if there are none), resolving them on first use.
+
+    Refreshable credentials (e.g. from an assumed role) refresh themselves when read, so they're safe to keep.
+    """
+    global _credentials
+    if _credentials is None:
+        with _clients_lock:
+            if _credentials is None:
+                _credentials = boto3.Session().get_credentials()
+    return _credentials
+
+
+def reset_aws_clients() -> None:
+    """Drops every pooled client, resource and credential so the next call builds fresh ones (e.g. when moto starts)"""
+    global _credentials, _generation
+    with _clients_lock:
+        _clients.clear()
+        _credentials = None
+        _generation += 1
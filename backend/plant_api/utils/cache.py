@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+from pydantic import BaseModel
+
+from plant_api.schema import User
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+SESSION_CACHE_MAX_SIZE = 1024
+SESSION_CACHE_TTL_SECONDS = 5 * 60
+
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    size: int
+
+
+class TTLCache(Generic[K, V]):
+    """Thread-safe, size-bounded LRU cache whose entries also expire after a TTL"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: K, value: V, ttl_seconds: Optional[float] = None) -> None:
+        """Stores a value, optionally with a shorter TTL than the cache default"""
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def remove_where(self, predicate: Callable[[K, V], bool]) -> int:
+        """Removes every entry matching the predicate and returns how many were removed"""
+        with self._lock:
+            keys = [key for key, (_, value) in self._entries.items() if predicate(key, value)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(hits=self.hits, misses=self.misses, size=len(self._entries))
+
+
+# Validated users keyed by the `jti` of the session token they were looked up for
+USER_SESSION_CACHE: TTLCache[str, User] = TTLCache(
+    max_size=SESSION_CACHE_MAX_SIZE, ttl_seconds=SESSION_CACHE_TTL_SECONDS
+)
+
+
+def invalidate_user_sessions(google_id: str) -> int:
+    """Drops every cached session for the user so their next request re-reads them from the DB"""
+    return USER_SESSION_CACHE.remove_where(lambda _, user: user.google_id == google_id)
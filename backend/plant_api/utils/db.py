@@ -1,23 +1,38 @@
-from typing import List, Optional, Tuple
+import base64
+import binascii
+import json
+from typing import Callable, Iterator, List, Optional, Tuple
 from uuid import UUID
 
-import boto3
 from boto3.dynamodb.conditions import Attr, Key
 from fastapi import HTTPException
 from logging import getLogger
 
-from plant_api.constants import AWS_REGION, TABLE_NAME
-from plant_api.schema import ImageItem, PlantItem, User
+from plant_api.constants import (
+    ACTIVE_OWNER_ATTR,
+    AWS_REGION,
+    OWNER_LOCATION_ATTR,
+    OWNER_SPECIES_ATTR,
+    TABLE_NAME,
+    USER_DIRECTORY_INDEX,
+)
+from plant_api.schema import EntityType, ImageItem, PlantItem, User
 from plant_api.schema import ItemKeys, UserItem
+from plant_api.utils.aws_clients import get_aws_resource
+from plant_api.utils.cache import invalidate_user_sessions
 
 from pydantic import TypeAdapter
 
 
 logger = getLogger(__name__)
 
+BATCH_GET_MAX_KEYS = 100
+# Plants whose deletion has started are hidden from reads
+NOT_DELETED_CONDITION = Attr("deleted_at").not_exists() | Attr("deleted_at").attribute_type("NULL")
+
 
 def get_db_connection():
-    return boto3.resource("dynamodb", region_name=AWS_REGION)
+    return get_aws_resource("dynamodb", AWS_REGION)
 
 
 def get_db_table():
@@ -33,10 +48,16 @@ def query_by_plant_id(table, plant_id: UUID) -> PlantItem:
     return PlantItem(**response["Items"][0])
 
 
-def get_user_id_from_images_plant(image: ImageItem) -> str:
-    table = get_db_table()
-    plant_id = image.plant_id
-    return query_by_plant_id(table, UUID(plant_id)).user_id
+def get_plant_owner(table, plant_id: UUID) -> Optional[str]:
+    """Looks up the ID of the user who owns the plant on the secondary index, reading only the key"""
+    response = table.query(
+        IndexName="SK-PK-index",
+        KeyConditionExpression=Key("SK").eq(f"PLANT#{plant_id}"),
+        ProjectionExpression="PK",
+    )
+    if not response["Items"]:
+        return None
+    return response["Items"][0]["PK"].split("#", 1)[1]
 
 
 def query_by_image_id(table, image_id: UUID) -> ImageItem:
@@ -54,26 +75,188 @@ def make_image_query_key(plant_id: UUID, image_id: UUID) -> dict:
     return {"PK": f"PLANT#{plant_id}", "SK": f"IMAGE#{image_id}"}
 
 
-def get_items_with_pk_and_sk_starting_with(table, prefix):
-    # Scan with filter expression for both PK and SK
-    response = table.scan(FilterExpression=Attr("PK").begins_with(prefix) & Attr("SK").begins_with(prefix))
+def make_plant_query_key(user_id: str, plant_id: UUID) -> dict:
+    return {"PK": f"USER#{user_id}", "SK": f"PLANT#{plant_id}"}
+
+
+def make_image_owner_key(image_id: UUID) -> dict:
+    """Key of the item that points from an image's ID to its plant and owner.
+
+    The sort key repeats the image ID so owner items spread across the SK-PK-index instead of sharing one key.
+    """
+    return {"PK": f"{ItemKeys.IMAGE.value}#{image_id}", "SK": f"{ItemKeys.OWNER.value}#{image_id}"}
+
+
+def make_image_owner_item(image: ImageItem) -> dict:
+    return {
+        **make_image_owner_key(UUID(image.image_id)),
+        "plant_id": image.plant_id,
+        "owner_user_id": image.owner_user_id,
+    }
+
+
+def get_image_owner(table, image_id: UUID) -> tuple[str, UUID]:
+    """Returns the (user_id, plant_id) an image belongs to, from one strongly consistent read of its owner item.
+
+    Images recorded before they had an owner item are looked up through the secondary index instead.
+    """
+    response = table.get_item(Key=make_image_owner_key(image_id), ConsistentRead=True)
+    if "Item" in response:
+        return response["Item"]["owner_user_id"], UUID(response["Item"]["plant_id"])
+    image = query_by_image_id(table, image_id)
+    return query_by_plant_id(table, UUID(image.plant_id)).user_id, UUID(image.plant_id)
+
+
+def make_human_id_key(user_id: str, human_id: int) -> dict:
+    """Key of the item that reserves a human_id for one of the user's plants and points to that plant"""
+    return {"PK": f"{ItemKeys.USER.value}#{user_id}", "SK": f"{ItemKeys.HUMAN_ID.value}#{human_id}"}
+
 
-    return response["Items"]
+def make_human_id_item(plant: PlantItem) -> dict:
+    return {**make_human_id_key(plant.user_id, plant.human_id), "plant_id": plant.plant_id}
 
 
-def get_all_users() -> List[User]:
-    """Queries DB for all entries where both PK and SK begin with USER#"""
+def get_plant_by_human_id(user_id: str, human_id: int) -> Optional[PlantItem]:
+    """Looks the plant up through its human_id item instead of scanning the user's plants"""
     table = get_db_table()
-    response = get_items_with_pk_and_sk_starting_with(table, ItemKeys.USER)
-    user_items = [UserItem(**item) for item in response]
-    users = [User(**user_item.model_dump()) for user_item in user_items]
+    response = table.get_item(Key=make_human_id_key(user_id, human_id))
+    if "Item" not in response:
+        return None
+    response = table.get_item(Key=make_plant_query_key(user_id, UUID(response["Item"]["plant_id"])))
+    if "Item" not in response:
+        return None
+    return PlantItem(**response["Item"])
+
+
+def batch_get_plants(user_id: str, plant_ids: list[UUID]) -> list[PlantItem]:
+    """Fetches the given plants of a user with BatchGetItem (100 keys per request), in the order requested.
+
+    Plant IDs that don't belong to the user are skipped.
+    """
+    keys = [make_plant_query_key(user_id, plant_id) for plant_id in dict.fromkeys(plant_ids)]
+    items: dict[str, dict] = {}
+    db = get_db_connection()
+    for start in range(0, len(keys), BATCH_GET_MAX_KEYS):
+        request_items: dict = {TABLE_NAME: {"Keys": keys[start : start + BATCH_GET_MAX_KEYS]}}
+        while request_items:
+            response = db.batch_get_item(RequestItems=request_items)
+            for item in response["Responses"].get(TABLE_NAME, []):
+                items[item["SK"]] = item
+            # DynamoDB may throttle part of a batch, so keep going until nothing is left unprocessed
+            request_items = response.get("UnprocessedKeys") or {}
+    return [PlantItem(**items[key["SK"]]) for key in keys if key["SK"] in items]
+
+
+def paginate(operation: Callable[..., dict], **kwargs) -> Iterator[list[dict]]:
+    """Calls a query/scan operation (e.g. `table.query`) and yields every page of items, following LastEvaluatedKey.
+
+    A single DynamoDB call returns at most 1 MB of data, so anything that needs *all* matching items must go through
+    here rather than reading `response["Items"]` once.
+    """
+    for response in _iterate_responses(operation, **kwargs):
+        yield response["Items"]
+
+
+def count_items(operation: Callable[..., dict], **kwargs) -> int:
+    """Counts the items matched by a query/scan operation across every page without transferring them"""
+    return sum(response["Count"] for response in _iterate_responses(operation, Select="COUNT", **kwargs))
 
-    return users
+
+def _iterate_responses(operation: Callable[..., dict], **kwargs) -> Iterator[dict]:
+    while True:
+        response = operation(**kwargs)
+        yield response
+        last_evaluated_key = response.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            return
+        kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+
+def iterate_items(operation: Callable[..., dict], **kwargs) -> Iterator[dict]:
+    """Yields the items of every page of a query/scan operation"""
+    for page in paginate(operation, **kwargs):
+        yield from page
+
+
+def encode_cursor(last_evaluated_key: Optional[dict], scope: Optional[dict] = None) -> Optional[str]:
+    """Turns a LastEvaluatedKey into an opaque cursor token for clients.
+
+    A `scope` (e.g. the index and filters of the query) is stored in the token, and decoding then requires the same one.
+    """
+    if not last_evaluated_key:
+        return None
+    token = last_evaluated_key if scope is None else {"key": last_evaluated_key, "scope": scope}
+    # Index keys can be numbers (e.g. human_id), which boto3 reads as Decimals
+    return base64.urlsafe_b64encode(json.dumps(token, default=int).encode()).decode()
+
+
+def decode_cursor(cursor: str, pk_value: str, pk_name: str = "PK", scope: Optional[dict] = None) -> dict:
+    """Turns a client's cursor token back into an ExclusiveStartKey, checking that it belongs to the partition.
+
+    A start key from another index or filters is invalid for the query, so a cursor from a different scope is refused.
+    """
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if scope is None:
+        start_key = token
+    elif isinstance(token, dict) and token.get("scope") == scope:
+        start_key = token.get("key")
+    else:
+        raise HTTPException(status_code=400, detail="Cursor is from a different query.")
+    if not isinstance(start_key, dict) or start_key.get(pk_name) != pk_value:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return start_key
+
+
+def query_page(
+    table, pk_value: str, sk_prefix: str, limit: int, cursor: Optional[str]
+) -> Tuple[list[dict], Optional[str]]:
+    """Returns up to `limit` items of the partition whose SK starts with the prefix, plus the next page's cursor.
+
+    The returned cursor is None on the last page.
+    """
+    kwargs: dict = {
+        "KeyConditionExpression": Key("PK").eq(pk_value) & Key("SK").begins_with(sk_prefix),
+        "Limit": limit,
+    }
+    if cursor is not None:
+        kwargs["ExclusiveStartKey"] = decode_cursor(cursor, pk_value)
+    response = table.query(**kwargs)
+    return response["Items"], encode_cursor(response.get("LastEvaluatedKey"))
+
+
+def _user_directory_query_kwargs(active_only: bool) -> dict:
+    kwargs: dict = {
+        "IndexName": USER_DIRECTORY_INDEX,
+        "KeyConditionExpression": Key("entity_type").eq(EntityType.USER.value),
+    }
+    if active_only:
+        kwargs["FilterExpression"] = Attr("disabled").ne(True)
+    return kwargs
+
+
+def get_all_users(active_only: bool = False) -> List[User]:
+    """Returns every user, read from the sparse user directory index (only user items have `created_at`)"""
+    table = get_db_table()
+    items = iterate_items(table.query, **_user_directory_query_kwargs(active_only))
+    return [User(**UserItem(**item).model_dump()) for item in items]
+
+
+def get_users_page(limit: int, cursor: Optional[str], active_only: bool = False) -> Tuple[List[User], Optional[str]]:
+    """Returns one page of users from the user directory index, oldest first, and the cursor for the next page"""
+    kwargs = _user_directory_query_kwargs(active_only)
+    kwargs["Limit"] = limit
+    if cursor is not None:
+        kwargs["ExclusiveStartKey"] = decode_cursor(cursor, EntityType.USER.value, pk_name="entity_type")
+    response = get_db_table().query(**kwargs)
+    users = [User(**UserItem(**item).model_dump()) for item in response["Items"]]
+    return users, encode_cursor(response.get("LastEvaluatedKey"))
 
 
 def get_all_active_users() -> List[User]:
-    all_users = get_all_users()
-    return [user for user in all_users if not user.disabled]
+    return get_all_users(active_only=True)
 
 
 def get_user_by_google_id(google_id: Optional[str]) -> Optional[UserItem]:
@@ -90,19 +273,165 @@ def get_user_by_google_id(google_id: Optional[str]) -> Optional[UserItem]:
     return UserItem(**response["Items"][0])
 
 
-def get_n_plants_for_user(user: User) -> Tuple[int, int]:
-    """Returns the number of plants for the given user"""
-    pk_sk_val = f"{ItemKeys.USER.value}#{user.google_id}"
-    response = get_db_table().query(
-        KeyConditionExpression=Key("PK").eq(pk_sk_val) & Key("SK").begins_with(ItemKeys.PLANT)
+def set_user_disabled(google_id: str, disabled: bool) -> None:
+    """Enables or disables a user and drops any of their cached sessions so the change applies immediately"""
+    pk_sk_val = f"{ItemKeys.USER.value}#{google_id}"
+    get_db_table().update_item(
+        Key={"PK": pk_sk_val, "SK": pk_sk_val},
+        UpdateExpression="SET disabled = :disabled",
+        ConditionExpression=Attr("PK").exists(),
+        ExpressionAttributeValues={":disabled": disabled},
+    )
+    invalidate_user_sessions(google_id)
+
+
+def add_to_user_counters(google_id: str, n_total_plants: int = 0, n_active_plants: int = 0, n_images: int = 0) -> None:
+    """Atomically adjusts the user's plant/image counters with a DynamoDB ADD expression.
+
+    The counters are best-effort: if the update fails the plant/image write still stands and
+    `recompute_user_counters` can repair the totals later.
+    """
+    deltas = {"n_total_plants": n_total_plants, "n_active_plants": n_active_plants, "n_images": n_images}
+    deltas = {name: delta for name, delta in deltas.items() if delta != 0}
+    if not deltas:
+        return
+    pk_sk_val = f"{ItemKeys.USER.value}#{google_id}"
+    table = get_db_table()
+    try:
+        table.update_item(
+            Key={"PK": pk_sk_val, "SK": pk_sk_val},
+            UpdateExpression="ADD " + ", ".join(f"{name} :{name}" for name in deltas),
+            # Don't create a partial user item if the user doesn't exist
+            ConditionExpression=Attr("PK").exists(),
+            ExpressionAttributeValues={f":{name}": delta for name, delta in deltas.items()},
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        logger.warning(f"Could not update counters for missing user {google_id}")
+
+
+def recompute_user_counters(google_id: str) -> None:
+    """Recounts the user's plants and images from scratch and overwrites the stored counters"""
+    pk_sk_val = f"{ItemKeys.USER.value}#{google_id}"
+    table = get_db_table()
+    plant_items = iterate_items(
+        table.query, KeyConditionExpression=Key("PK").eq(pk_sk_val) & Key("SK").begins_with("PLANT#")
+    )
+    plants = TypeAdapter(list[PlantItem]).validate_python(list(plant_items))
+    n_images = sum(
+        count_items(
+            table.query,
+            KeyConditionExpression=Key("PK").eq(f"PLANT#{plant.plant_id}") & Key("SK").begins_with("IMAGE#"),
+        )
+        for plant in plants
+    )
+    table.update_item(
+        Key={"PK": pk_sk_val, "SK": pk_sk_val},
+        UpdateExpression="SET n_total_plants = :total, n_active_plants = :active, n_images = :images",
+        ConditionExpression=Attr("PK").exists(),
+        ExpressionAttributeValues={
+            ":total": len(plants),
+            ":active": len([plant for plant in plants if not plant.sink]),
+            ":images": n_images,
+        },
     )
-    parsed_plants = TypeAdapter(list[PlantItem]).validate_python(response["Items"])
-    total_plants = len(parsed_plants)
-    unsunk_plants = len([plant for plant in parsed_plants if not plant.sink])
-    return total_plants, unsunk_plants
 
 
-# TODO: add get number of images for user and add to user return
+def recompute_all_user_counters() -> None:
+    """Repair job: recomputes the counters of every user (e.g. after a backfill or a failed counter update)"""
+    for user in get_all_users():
+        recompute_user_counters(user.google_id)
+
+
+def backfill_human_id_items() -> None:
+    """Migration job: writes the human_id item of every plant created before plants had one.
+
+    If a user already has two plants with the same human_id, the first one keeps it and the other is logged.
+    """
+    table = get_db_table()
+    for user in get_all_users():
+        plant_items = iterate_items(
+            table.query,
+            KeyConditionExpression=Key("PK").eq(f"{ItemKeys.USER.value}#{user.google_id}")
+            & Key("SK").begins_with(f"{ItemKeys.PLANT.value}#"),
+        )
+        for plant in TypeAdapter(list[PlantItem]).validate_python(list(plant_items)):
+            try:
+                table.put_item(Item=make_human_id_item(plant), ConditionExpression=Attr("SK").not_exists())
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                existing = table.get_item(Key=make_human_id_key(plant.user_id, plant.human_id))["Item"]
+                if existing["plant_id"] != plant.plant_id:
+                    logger.warning(
+                        f"Plant {plant.plant_id} of user {plant.user_id} duplicates human_id {plant.human_id} of "
+                        f"plant {existing['plant_id']}"
+                    )
+
+
+def backfill_image_owner_items() -> None:
+    """Migration job: stamps the owner on every image recorded before images had one, and writes its owner item.
+
+    Also removes owner items written under the old shared "OWNER" sort key.
+    """
+    table = get_db_table()
+    for user in get_all_users():
+        plant_items = iterate_items(
+            table.query,
+            KeyConditionExpression=Key("PK").eq(f"{ItemKeys.USER.value}#{user.google_id}")
+            & Key("SK").begins_with(f"{ItemKeys.PLANT.value}#"),
+        )
+        for plant_item in plant_items:
+            image_items = iterate_items(
+                table.query,
+                KeyConditionExpression=Key("PK").eq(f"{ItemKeys.PLANT.value}#{PlantItem(**plant_item).plant_id}")
+                & Key("SK").begins_with(f"{ItemKeys.IMAGE.value}#"),
+            )
+            for image in TypeAdapter(list[ImageItem]).validate_python(list(image_items)):
+                if image.owner_user_id is None:
+                    image = image.model_copy(update={"owner_user_id": user.google_id})
+                    try:
+                        table.update_item(
+                            Key=make_image_query_key(UUID(image.plant_id), UUID(image.image_id)),
+                            UpdateExpression="SET owner_user_id = :owner",
+                            ConditionExpression=Attr("PK").exists(),
+                            ExpressionAttributeValues={":owner": user.google_id},
+                        )
+                    except table.meta.client.exceptions.ConditionalCheckFailedException:
+                        # Deleted since the query
+                        continue
+                table.put_item(Item=make_image_owner_item(image))
+                table.delete_item(Key={"PK": f"{ItemKeys.IMAGE.value}#{image.image_id}", "SK": ItemKeys.OWNER.value})
+
+
+def backfill_plant_index_attributes() -> None:
+    """Migration job: sets the sparse index keys (see PlantItem.get_index_attributes) on plants written before them"""
+    table = get_db_table()
+    index_attributes = [ACTIVE_OWNER_ATTR, OWNER_LOCATION_ATTR, OWNER_SPECIES_ATTR]
+    for user in get_all_users():
+        plant_items = iterate_items(
+            table.query,
+            KeyConditionExpression=Key("PK").eq(f"{ItemKeys.USER.value}#{user.google_id}")
+            & Key("SK").begins_with(f"{ItemKeys.PLANT.value}#"),
+        )
+        for plant in TypeAdapter(list[PlantItem]).validate_python(list(plant_items)):
+            attributes = plant.get_index_attributes()
+            clauses = []
+            if attributes:
+                clauses.append("SET " + ", ".join(f"{name} = :{name}" for name in attributes))
+            removed = [name for name in index_attributes if name not in attributes]
+            if removed:
+                clauses.append("REMOVE " + ", ".join(removed))
+            values = {f":{name}": value for name, value in attributes.items()}
+            try:
+                table.update_item(
+                    Key=make_plant_query_key(user.google_id, UUID(plant.plant_id)),
+                    UpdateExpression=" ".join(clauses),
+                    ConditionExpression=Attr("PK").exists(),
+                    **({"ExpressionAttributeValues": values} if values else {}),
+                )
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                # Deleted since the query
+                continue
+
+
 def is_user_access_allowed(requesting_user: User, target_user_id: str) -> bool:
     """Check if the requesting_user is allowed to access the target_user's data.
 
@@ -120,24 +449,3 @@ def is_user_access_allowed(requesting_user: User, target_user_id: str) -> bool:
     if target_user.is_public_profile:
         return True
     return False
-
-
-async def deserialize_dynamodb_item(item: dict) -> dict:
-    """
-    Convert a DynamoDB item to a regular Python dictionary.
-    This function handles only string (S) and number (N) types for simplicity.
-    Extend this function based on your specific needs.
-    """
-    python_item = {}
-    for key, value in item.items():
-        if "S" in value:
-            python_item[key] = value["S"]
-        elif "N" in value:
-            python_item[key] = int(value["N"])  # or float(value['N']) if dealing with floating numbers
-        elif "BOOL" in value:
-            python_item[key] = value["BOOL"]
-        elif "NULL" in value and value["NULL"]:
-            python_item[key] = None
-        # Add more types as needed, such as L (list), M (map), etc.
-
-    return python_item
@@ -0,0 +1,78 @@
+import io
+from enum import Enum
+from typing import Union
+
+from PIL import Image as img, ImageOps
+from PIL.Image import Image
+
+MAX_THUMB_X_PIXELS = 500
+MAX_SMALL_THUMB_X_PIXELS = 150
+
+
+class ImageSuffixes(str, Enum):
+    ORIGINAL = "original"
+    THUMB = "thumb"
+    SMALL_THUMB = "small_thumb"
+    THUMB_WEBP = "thumb_webp"
+
+    def __str__(self) -> str:
+        # Python 3.11+ formats str-mixin enums as "ImageSuffixes.ORIGINAL" in f-strings; S3 keys need the value
+        return self.value
+
+
+# Derivatives made for every uploaded image: suffix -> (max width, PIL format, file extension)
+DERIVATIVE_SPECS: dict[ImageSuffixes, tuple[int, str, str]] = {
+    ImageSuffixes.THUMB: (MAX_THUMB_X_PIXELS, "JPEG", "jpg"),
+    ImageSuffixes.SMALL_THUMB: (MAX_SMALL_THUMB_X_PIXELS, "JPEG", "jpg"),
+    ImageSuffixes.THUMB_WEBP: (MAX_THUMB_X_PIXELS, "WEBP", "webp"),
+}
+
+
+def orient_image(image: Image) -> Image:
+    return ImageOps.exif_transpose(image)
+
+
+def resize_to_max_width(image: Image, max_x_pixels: int) -> Image:
+    """Shrinks the image to the given width, keeping its aspect ratio. Smaller images are returned unchanged."""
+    if image.width <= max_x_pixels:
+        return image
+    ratio = max_x_pixels / float(image.width)
+    new_size = (max_x_pixels, int(image.height * ratio))
+    return image.resize(new_size, img.Resampling.LANCZOS)
+
+
+def encode_image(image: Image, image_format: str) -> bytes:
+    buf = io.BytesIO()
+    # JPEG has no alpha channel (and WebP is smaller without one), so flatten PNGs etc. first
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(buf, format=image_format)
+    return buf.getvalue()
+
+
+def open_for_derivatives(original: Union[bytes, str]) -> Image:
+    """Opens an image (bytes or a file path) for making derivatives.
+
+    JPEGs are decoded at the smallest DCT scale still at least as large as the biggest derivative, so a 12 MP photo is
+    never fully decoded in memory.
+    """
+    image = img.open(io.BytesIO(original) if isinstance(original, bytes) else original)
+    # Square request so the draft is big enough whichever way EXIF orientation turns the image
+    image.draft("RGB", (MAX_THUMB_X_PIXELS, MAX_THUMB_X_PIXELS))
+    return orient_image(image)
+
+
+def render_derivatives(original: Union[bytes, str]) -> dict[ImageSuffixes, bytes]:
+    """Decodes an uploaded image once and renders every derivative in DERIVATIVE_SPECS from that one decoded copy.
+
+    Pure CPU work on bytes (or a file path) in and bytes out, so it can run in a worker thread or process.
+    """
+    image = open_for_derivatives(original)
+    derivatives = {}
+    # Resize largest-first so each smaller derivative is made from the previous (cheaper) resize of the same width
+    resized: dict[int, Image] = {}
+    for suffix, (max_x_pixels, image_format, _) in DERIVATIVE_SPECS.items():
+        if max_x_pixels not in resized:
+            resized[max_x_pixels] = resize_to_max_width(image, max_x_pixels)
+        derivatives[suffix] = encode_image(resized[max_x_pixels], image_format)
+    return derivatives
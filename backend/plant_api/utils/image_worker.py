@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from pydantic import BaseModel
+
+from plant_api.constants import AWS_DEPLOYMENT_ENV
+from plant_api.utils.deployment import get_deployment_env
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+IMAGE_WORKER_PROCESSES_ENV_VAR = "IMAGE_WORKER_PROCESSES"
+IMAGE_WORKER_MAX_CONCURRENCY_ENV_VAR = "IMAGE_WORKER_MAX_CONCURRENCY"
+
+
+class ImageWorkerStats(BaseModel):
+    processes: int
+    max_concurrency: int
+    queued: int
+    running: int
+    completed: int
+    failed: int
+
+
+class ImageWorker:
+    """Runs CPU-bound PIL work (decode, orient, resize, encode) in a process pool so it uses every core and never
+    holds the GIL of the process serving requests.
+
+    At most `max_concurrency` jobs are submitted to the pool at once; further callers wait for a slot, which bounds how
+    many decoded photos can be in memory. With `processes=0` the work runs on threads instead (e.g. on Lambda, which
+    has no /dev/shm for multiprocessing).
+    """
+
+    def __init__(self, processes: int, max_concurrency: Optional[int] = None):
+        self.processes = processes
+        self.max_concurrency = max_concurrency or max(processes, 1) * 2
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.processes > 0:
+                    # Spawn rather than fork: the API process has threads (job queues, AWS clients) that fork would copy
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency, thread_name_prefix="image-worker"
+                    )
+            return self._executor
+
+    def submit(self, fn: Callable[..., T], *args: Any) -> "Future[T]":
+        """Submits the work once a concurrency slot is free (blocking until then)"""
+        with self._lock:
+            self._queued += 1
+        self._slots.acquire()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._on_done(None)
+            raise
+        future.add_done_callback(self._on_done)
+        LOGGER.debug("Image worker: %s", self.stats())
+        return future
+
+    def _on_done(self, future: Optional[Future]) -> None:
+        with self._lock:
+            self._running -= 1
+            if future is None or future.cancelled() or future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+        self._slots.release()
+
+    def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Runs the work in the pool and waits for its result"""
+        return self.submit(fn, *args).result()
+
+    async def run_async(self, fn: Callable[..., T], *args: Any) -> T:
+        """Runs the work in the pool without blocking the event loop (waiting for a slot happens off the loop too)"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, fn, *args)
+
+    def stats(self) -> ImageWorkerStats:
+        with self._lock:
+            return ImageWorkerStats(
+                processes=self.processes,
+                max_concurrency=self.max_concurrency,
+                queued=self._queued,
+                running=self._running,
+                completed=self._completed,
+                failed=self._failed,
+            )
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def get_default_image_worker_processes() -> int:
+    if get_deployment_env() == AWS_DEPLOYMENT_ENV:
+        return 0
+    return os.cpu_count() or 1
+
+
+def create_image_worker() -> ImageWorker:
+    processes = int(os.getenv(IMAGE_WORKER_PROCESSES_ENV_VAR, get_default_image_worker_processes()))
+    max_concurrency = os.getenv(IMAGE_WORKER_MAX_CONCURRENCY_ENV_VAR)
+    return ImageWorker(processes, int(max_concurrency) if max_concurrency else None)
+
+
+_image_worker: Optional[ImageWorker] = None
+_image_worker_lock = threading.Lock()
+
+
+def get_image_worker() -> ImageWorker:
+    global _image_worker
+    with _image_worker_lock:
+        if _image_worker is None:
+            _image_worker = create_image_worker()
+        return _image_worker
+
+
+def shutdown_image_worker() -> None:
+    global _image_worker
+    with _image_worker_lock:
+        worker, _image_worker = _image_worker, None
+    if worker is not None:
+        worker.shutdown()
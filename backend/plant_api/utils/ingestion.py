@@ -0,0 +1,169 @@
+"""Bulk ingestion pipeline for migrations (e.g. moving the photo archive off Google Drive).
+
+Items are downloaded and uploaded by separate pools of workers joined by bounded queues, so both sides stay busy and a
+slow upload side stops downloads instead of piling photos up in memory. Finished items are appended to a checkpoint
+file, so a rerun after a crash (or after fixing the items that failed) skips everything already done.
+"""
+import asyncio
+import logging
+import os
+import random
+from typing import Awaitable, Callable, Generic, Iterable, Optional, TypeVar
+
+from pydantic import BaseModel
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+D = TypeVar("D")
+R = TypeVar("R")
+
+DEFAULT_N_DOWNLOADS = 8
+DEFAULT_N_UPLOADS = 4
+DEFAULT_MAX_BUFFERED = 16
+
+# Tells a worker there's nothing left to do
+_DONE = object()
+
+
+class RetryPolicy(BaseModel):
+    """Exponential backoff with full jitter: the n-th retry waits a random time up to min(max, base * 2**n)"""
+
+    attempts: int = 5
+    base_delay_sec: float = 1.0
+    max_delay_sec: float = 30.0
+
+    def get_delay(self, retry: int, rng: random.Random) -> float:
+        return rng.uniform(0, min(self.max_delay_sec, self.base_delay_sec * 2**retry))
+
+
+async def call_with_retries(
+    func: Callable[[], R],
+    retry_policy: RetryPolicy,
+    rng: random.Random,
+    sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+) -> R:
+    """Runs the blocking call in a thread, retrying it if it raises. Raises the last error once out of attempts."""
+    for retry in range(retry_policy.attempts):
+        try:
+            return await asyncio.to_thread(func)
+        except Exception as e:
+            if retry == retry_policy.attempts - 1:
+                raise
+            delay = retry_policy.get_delay(retry, rng)
+            LOGGER.info(f"Retrying in {delay:.1f}s after error: {e}")
+            await sleep(delay)
+    raise ValueError("RetryPolicy.attempts must be at least 1")
+
+
+class IngestionCheckpoint:
+    """Keys of finished items, one per line, appended (and flushed) as each item finishes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.done = {line.strip() for line in file if line.strip()}
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def mark_done(self, key: str) -> None:
+        self._file.write(f"{key}\n")
+        self._file.flush()
+        self.done.add(key)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class IngestionResult(BaseModel):
+    n_done: int = 0
+    n_skipped: int = 0
+    # Error of each item that failed all of its attempts, by key; they aren't checkpointed so a rerun tries them again
+    failed: dict[str, str] = {}
+
+
+class IngestionPipeline(Generic[T, D]):
+    """Downloads and uploads items concurrently, with at most `max_buffered` downloaded items waiting for an upload.
+
+    `download` and `upload` are blocking calls (run on threads); `key` identifies an item in the checkpoint file.
+    """
+
+    def __init__(
+        self,
+        key: Callable[[T], str],
+        download: Callable[[T], D],
+        upload: Callable[[T, D], object],
+        checkpoint_path: str,
+        n_downloads: int = DEFAULT_N_DOWNLOADS,
+        n_uploads: int = DEFAULT_N_UPLOADS,
+        max_buffered: int = DEFAULT_MAX_BUFFERED,
+        retry_policy: Optional[RetryPolicy] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        self.key = key
+        self.download = download
+        self.upload = upload
+        self.checkpoint_path = checkpoint_path
+        self.n_downloads = n_downloads
+        self.n_uploads = n_uploads
+        self.max_buffered = max_buffered
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rng = rng or random.Random()
+
+    async def run(self, items: Iterable[T]) -> IngestionResult:
+        result = IngestionResult()
+        checkpoint = IngestionCheckpoint(self.checkpoint_path)
+        # Both queues are bounded: a full upload queue blocks the downloaders, which stops the feed in turn
+        download_queue: asyncio.Queue = asyncio.Queue(maxsize=self.n_downloads)
+        upload_queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_buffered)
+
+        async def feed() -> None:
+            for item in items:
+                if self.key(item) in checkpoint:
+                    result.n_skipped += 1
+                    continue
+                await download_queue.put(item)
+            for _ in range(self.n_downloads):
+                await download_queue.put(_DONE)
+
+        async def download_worker() -> None:
+            while (item := await download_queue.get()) is not _DONE:
+                try:
+                    data = await call_with_retries(lambda: self.download(item), self.retry_policy, self.rng)
+                except Exception as e:
+                    self._fail(result, item, "download", e)
+                    continue
+                await upload_queue.put((item, data))
+
+        async def upload_worker() -> None:
+            while (entry := await upload_queue.get()) is not _DONE:
+                item, data = entry
+                try:
+                    await call_with_retries(lambda: self.upload(item, data), self.retry_policy, self.rng)
+                except Exception as e:
+                    self._fail(result, item, "upload", e)
+                    continue
+                checkpoint.mark_done(self.key(item))
+                result.n_done += 1
+
+        uploaders = [asyncio.create_task(upload_worker()) for _ in range(self.n_uploads)]
+        try:
+            await asyncio.gather(feed(), *(download_worker() for _ in range(self.n_downloads)))
+            for _ in range(self.n_uploads):
+                await upload_queue.put(_DONE)
+            await asyncio.gather(*uploaders)
+        finally:
+            for uploader in uploaders:
+                uploader.cancel()
+            checkpoint.close()
+        LOGGER.info(f"Ingested {result.n_done} items, skipped {result.n_skipped}, {len(result.failed)} failed")
+        return result
+
+    def _fail(self, result: IngestionResult, item: T, step: str, error: Exception) -> None:
+        key = self.key(item)
+        LOGGER.error(f"Could not {step} {key}: {error}")
+        result.failed[key] = f"{step}: {error}"
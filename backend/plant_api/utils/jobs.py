@@ -0,0 +1,97 @@
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Generic, Optional, TypeVar
+
+from starlette.concurrency import run_in_threadpool
+
+from plant_api.constants import AWS_DEPLOYMENT_ENV
+from plant_api.utils.deployment import get_deployment_env
+
+LOGGER = logging.getLogger(__name__)
+
+J = TypeVar("J")
+R = TypeVar("R")
+
+JOB_QUEUE_BACKEND_ENV_VAR = "JOB_QUEUE_BACKEND"
+JOB_QUEUE_WORKERS_ENV_VAR = "JOB_QUEUE_WORKERS"
+LOCAL_JOB_QUEUE_BACKEND = "local"
+INLINE_JOB_QUEUE_BACKEND = "inline"
+DEFAULT_JOB_QUEUE_WORKERS = 2
+
+
+class JobQueue(ABC, Generic[J, R]):
+    """Hands jobs to a handler outside of the request that created them"""
+
+    def __init__(self, handler: Callable[[J], R]):
+        self.handler = handler
+
+    @abstractmethod
+    async def submit(self, job: J) -> Optional[R]:
+        """Queues the job. Returns the handler's result if the backend ran it before returning, else None"""
+
+    def join(self) -> None:
+        """Blocks until every job submitted so far has finished"""
+
+    def shutdown(self) -> None:
+        """Finishes outstanding jobs and releases the backend's workers"""
+
+
+class InlineJobQueue(JobQueue[J, R]):
+    """Runs each job to completion (off the event loop) before `submit` returns.
+
+    Used where nothing may run after the response is sent (Lambda freezes the process), and in tests.
+    """
+
+    async def submit(self, job: J) -> Optional[R]:
+        return await run_in_threadpool(self.handler, job)
+
+
+class LocalJobQueue(JobQueue[J, R]):
+    """In-process queue drained by a small pool of background worker threads"""
+
+    def __init__(self, handler: Callable[[J], R], max_workers: int = DEFAULT_JOB_QUEUE_WORKERS):
+        super().__init__(handler)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-queue")
+        self._pending: set[Future] = set()
+        self._lock = threading.Lock()
+
+    async def submit(self, job: J) -> Optional[R]:
+        future = self._executor.submit(self.handler, job)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+        return None
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            LOGGER.error("Background job failed: %s", future.exception())
+
+    def join(self) -> None:
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            # Failures are already logged by _on_done
+            future.exception()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def get_default_job_queue_backend() -> str:
+    """Lambda can't run work after the response is returned, so jobs run inline there unless configured otherwise"""
+    default = INLINE_JOB_QUEUE_BACKEND if get_deployment_env() == AWS_DEPLOYMENT_ENV else LOCAL_JOB_QUEUE_BACKEND
+    return os.getenv(JOB_QUEUE_BACKEND_ENV_VAR, default)
+
+
+def create_job_queue(handler: Callable[[J], R], backend: Optional[str] = None) -> JobQueue[J, R]:
+    backend = backend or get_default_job_queue_backend()
+    if backend == INLINE_JOB_QUEUE_BACKEND:
+        return InlineJobQueue(handler)
+    if backend == LOCAL_JOB_QUEUE_BACKEND:
+        return LocalJobQueue(handler, int(os.getenv(JOB_QUEUE_WORKERS_ENV_VAR, DEFAULT_JOB_QUEUE_WORKERS)))
+    raise ValueError(f"Unknown job queue backend: {backend}")
@@ -0,0 +1,662 @@
+import hashlib
+import json
+import logging
+import zlib
+from collections import Counter, defaultdict
+from datetime import date
+from functools import cached_property
+from typing import Iterable, Literal, Optional, Sequence
+from uuid import uuid4
+
+from boto3.dynamodb.conditions import Key
+from pydantic import BaseModel, TypeAdapter
+
+from plant_api.schema import PlantItem
+from plant_api.utils.cache import TTLCache
+from plant_api.utils.db import NOT_DELETED_CONDITION, get_db_table, iterate_items
+from plant_api.utils.lineage_graph import (  # noqa: F401 (LineageDiagnostics and DanglingParent are re-exported)
+    PLANT,
+    SINK,
+    SOURCE,
+    DanglingParent,
+    LineageDiagnostics,
+    LineageGraph,
+    id_sort_key,
+)
+
+logger = logging.getLogger(__name__)
+
+LINEAGE_LAYOUT_SK = "LINEAGE#layout"
+LINEAGE_VERSION_SK = "LINEAGE#version"
+# Stored layouts are split into chunks (see LineageLayout): plants by blocks of human_ids, levels into slices of about
+# LINEAGE_SLICE_NODES nodes. Both keep every chunk well under DynamoDB's 400 KB item limit.
+LINEAGE_PLANT_BUCKET_SIZE = 64
+LINEAGE_SLICE_NODES = 64
+LINEAGE_INDEX_CACHE_MAX_SIZE = 32
+LINEAGE_INDEX_CACHE_TTL_SECONDS = 10 * 60
+
+
+class PlantLineageNode(BaseModel):
+    id: int | str  # this is the human_id or a source/sink name
+    node_name: str = "fake_name"
+    plant_id: Optional[str] = None
+
+    source: Optional[str] = None
+    source_date: Optional[date] = None
+    sink: Optional[str] = None
+
+    node_type: Literal["source", "sink", "plant"]
+    # Graph building properties
+    generation: int = -1  # -1 is placeholder generation value
+    parents: Optional[Sequence[int | str]] = None
+
+
+class LineagePlant(BaseModel):
+    """The fields of a plant that the lineage graph is built from"""
+
+    plant_id: str
+    human_id: int
+    human_name: str
+    parent_id: Optional[list[int]] = None
+    source: str
+    source_date: date
+    sink: Optional[str] = None
+    sink_date: Optional[date] = None
+
+    @classmethod
+    def from_plant(cls, plant: PlantItem) -> "LineagePlant":
+        return cls(**plant.model_dump(include=set(cls.model_fields)))
+
+
+def create_nodes_for_sources(plants: Sequence[LineagePlant]) -> list[PlantLineageNode]:
+    """Creates a new node for each (non-plant)  source in the list of plants"""
+    source_ids = []
+    for plant in plants:
+        # If the plant has no parent_id, then extract its source name to create a new node
+        if plant.parent_id is None:
+            source_ids.append(plant.source)
+    # Dedeplicate sources and create a new plant node for each source
+    source_ids = list(set(source_ids))
+    return [
+        PlantLineageNode(id=source_id, node_name=f"Src: {source_id}", node_type="source") for source_id in source_ids
+    ]
+
+
+def create_nodes_for_sinks(plants: Sequence[LineagePlant]) -> list[PlantLineageNode]:
+    """Creates a new node for each sink in the list of plants
+
+    For each sink, it assigns all plants that sunk to it as parents
+    """
+    sinks = defaultdict(list)
+
+    for plant in plants:
+        if plant.sink is not None:
+            sinks[plant.sink].append(plant.human_id)
+    return [PlantLineageNode(id=sink, node_name=f"Sk: {sink}", parents=sinks[sink], node_type="sink") for sink in sinks]
+
+
+def create_nodes_for_plants(plants: Sequence[LineagePlant]) -> list[PlantLineageNode]:
+    """Creates a new node for each plant in the list of plants"""
+    return [
+        PlantLineageNode(
+            id=plant.human_id,
+            plant_id=plant.plant_id,
+            node_name=plant.human_name,
+            source=plant.source,
+            source_date=plant.source_date,
+            parents=plant.parent_id,
+            node_type="plant",
+        )
+        for plant in plants
+    ]
+
+
+def _is_sink(node: PlantLineageNode) -> bool:
+    return node.node_type == "sink" or (isinstance(node.id, str) and node.parents is not None)
+
+
+def _node_kind(node: PlantLineageNode) -> int:
+    if _is_sink(node):
+        return SINK
+    return SOURCE if node.node_type == "source" else PLANT
+
+
+def assign_generations_and_source_parents(nodes: list[PlantLineageNode]) -> LineageDiagnostics:
+    """Creates generations from a list of node nodes.
+
+    Generations are grouping of plants based on the hierarchy of their parents.
+
+    We set the generation of source nodes to be 0 and set the generation of sink nodes to be one more than the maximum
+    generation of their parents. Parents that don't exist are dropped and plants without parents get their source as
+    parent. See LineageGraph, which does the work, for how parent cycles are handled.
+    """
+    graph = LineageGraph.build((node.id, _node_kind(node), node.parents, node.source, None) for node in nodes)
+    diagnostics = graph.assign_generations()
+    for index, node in enumerate(nodes):
+        node.generation = graph.generations[index]
+        if graph.kinds[index] != SINK:
+            node.parents = graph.parent_ids(index) or None
+    return diagnostics
+
+
+def get_parent_counts(nodes: list[PlantLineageNode]) -> dict:
+    """Returns a dictionary mapping parent IDs to the count of their occurrences as a parent."""
+    all_parents = [parent for node in nodes for parent in (node.parents or [])]
+    return Counter(all_parents)
+
+
+def _level_sort_key(node: PlantLineageNode, parent_counts: dict) -> tuple:
+    first_parent = min(node.parents, key=id_sort_key) if node.parents else None
+    return (
+        # Primary sort key: Negative count of plants per parent_id to have larger groups first
+        parent_counts[first_parent] if first_parent is not None else 0,
+        # Secondary sort key: Parent_id (min for plants with multiple parents)
+        id_sort_key(first_parent) if first_parent is not None else id_sort_key("0"),
+        # Tertiary sort key: Plant's own id
+        id_sort_key(node.id),
+    )
+
+
+def assign_levels_to_generations(plants: list[PlantLineageNode]) -> list[list[PlantLineageNode]]:
+    """Groups plants into levels based on their generation"""
+
+    for plant in plants:
+        if plant.generation is None:
+            raise ValueError("Generation must be assigned to all plants before assigning levels.")
+
+    max_generation = max(plant.generation for plant in plants)
+    # Create placeholder list of lists
+    levels: list = [[] for _ in range(max_generation + 1)]
+    # Assign each plant to a level based on its generation
+    for plant in plants:
+        levels[plant.generation].append(plant)
+
+    # Sort within levels
+    parent_counts = get_parent_counts(plants)
+    for level in levels:
+        level.sort(key=lambda node: _level_sort_key(node, parent_counts))
+
+    return levels
+
+
+def _node_dicts(graph: LineageGraph, plants: Sequence[LineagePlant], include_sinks: bool) -> list[list[dict]]:
+    """Renders the levels of a laid out graph built with one node per plant (in order, followed by any sources and
+    sinks) as PlantLineageNode dicts
+    """
+    ids, kinds, generations, n_plants = graph.ids, graph.kinds, graph.generations, len(plants)
+    levels = []
+    for level in graph.levels(include_sinks):
+        nodes = []
+        for index in level:
+            if index < n_plants:
+                plant = plants[index]
+                node = {
+                    "id": plant.human_id,
+                    "node_name": plant.human_name,
+                    "plant_id": plant.plant_id,
+                    "source": plant.source,
+                    "source_date": plant.source_date.isoformat(),
+                    "node_type": "plant",
+                }
+            elif kinds[index] == SINK:
+                node = {"id": ids[index], "node_name": f"Sk: {ids[index]}", "node_type": "sink"}
+            else:
+                node = {"id": ids[index], "node_name": f"Src: {ids[index]}", "node_type": "source"}
+            node["generation"] = generations[index]
+            parents = graph.parents(index)
+            if parents:
+                node["parents"] = [ids[parent] for parent in parents]
+            nodes.append(node)
+        levels.append(nodes)
+    return levels
+
+
+def _build_lineage_graph(plants: Sequence[LineagePlant]) -> LineageGraph:
+    graph = LineageGraph.build((plant.human_id, PLANT, plant.parent_id, plant.source, plant.sink) for plant in plants)
+    graph.assign_generations()
+    return graph
+
+
+def compute_lineage_level_dicts(
+    plants: Sequence[LineagePlant], include_sinks: bool = False
+) -> tuple[list[list[dict]], LineageDiagnostics]:
+    """The plants, their sources and optionally their sinks grouped into levels by generation, as dicts shaped like
+    PlantLineageNode
+    """
+    graph = _build_lineage_graph(plants)
+    return _node_dicts(graph, plants, include_sinks), graph.diagnostics
+
+
+def compute_lineage_levels(
+    plants: Sequence[LineagePlant], include_sinks: bool = False
+) -> tuple[list[list[PlantLineageNode]], LineageDiagnostics]:
+    levels, diagnostics = compute_lineage_level_dicts(plants, include_sinks)
+    return TypeAdapter(list[list[PlantLineageNode]]).validate_python(levels), diagnostics
+
+
+class LineageIndex:
+    """Adjacency of a user's plants by human_id, parent -> children and child -> parents, from their parent_ids.
+
+    Parents that don't exist are left out, like in the full graph. Plants are kept as their stored lineage fields and
+    only validated when one is asked for, so laying out a neighbourhood costs what the neighbourhood does.
+    """
+
+    def __init__(self, plant_fields: Iterable[dict]):
+        self._plant_fields = {fields["human_id"]: fields for fields in plant_fields}
+        self.parents: dict[int, list[int]] = {}
+        self.children: dict[int, list[int]] = defaultdict(list)
+        for human_id, fields in self._plant_fields.items():
+            parent_ids = dict.fromkeys(fields.get("parent_id") or [])
+            parents = [parent_id for parent_id in parent_ids if parent_id in self._plant_fields]
+            self.parents[human_id] = parents
+            for parent_id in parents:
+                self.children[parent_id].append(human_id)
+
+    def __contains__(self, human_id: int) -> bool:
+        return human_id in self._plant_fields
+
+    def get_plant(self, human_id: int) -> LineagePlant:
+        return LineagePlant.model_validate(self._plant_fields[human_id])
+
+    def neighbourhood(self, human_id: int, up: int, down: int) -> set[int]:
+        """The plant plus its ancestors up to `up` generations back and descendants up to `down` generations on"""
+        included = {human_id}
+        for adjacency, depth in ((self.parents, up), (self.children, down)):
+            frontier = {human_id}
+            for _ in range(depth):
+                frontier = {neighbour for node_id in frontier for neighbour in adjacency.get(node_id, [])} - included
+                if not frontier:
+                    break
+                included |= frontier
+        return included
+
+
+def compute_subgraph_levels(index: LineageIndex, human_id: int, up: int, down: int) -> list[list[PlantLineageNode]]:
+    """Lays out just the neighbourhood of one plant (see LineageIndex.neighbourhood).
+
+    Plants with no parents hang off their source as in the full graph. Ancestors whose own parents are beyond `up` are
+    placed at the top instead, as roots; they keep their source field, but no source node is added above them.
+    """
+    included = index.neighbourhood(human_id, up, down)
+    plants = [index.get_plant(plant_id) for plant_id in sorted(included)]
+    graph = LineageGraph.build(
+        (
+            plant.human_id,
+            PLANT,
+            [parent_id for parent_id in index.parents[plant.human_id] if parent_id in included],
+            # Cut off ancestors are laid out as roots rather than under their source
+            None if index.parents[plant.human_id] else plant.source,
+            None,
+        )
+        for plant in plants
+    )
+    graph.assign_generations()
+    levels = _node_dicts(graph, plants, include_sinks=False)
+    return TypeAdapter(list[list[PlantLineageNode]]).validate_python(levels)
+
+
+# Indexes keyed by (user_id, lineage_version); a lineage write bumps the version, so an entry is never out of date
+LINEAGE_INDEX_CACHE: TTLCache[tuple[str, int], LineageIndex] = TTLCache(
+    max_size=LINEAGE_INDEX_CACHE_MAX_SIZE, ttl_seconds=LINEAGE_INDEX_CACHE_TTL_SECONDS
+)
+
+
+class LineageLayout(BaseModel):
+    """A user's computed lineage levels, stored next to their plants as named chunks of JSON.
+
+    "P<n>" chunks hold the lineage fields of the plants with human_id // LINEAGE_PLANT_BUCKET_SIZE == n, so plant
+    writes can lay the graph out again without re-reading the user's plants. "L<level>.<n>" and "S<level>.<n>" are
+    slices of each level's nodes, without and with sinks, and "D" holds the diagnostics. Levels are sliced where the
+    nodes' content says to (see _slice_level), so a plant write changes only a few chunks, and only those are stored
+    again. `lineage_version` is the user's lineage version (see bump_lineage_version) the layout reflects; a layout
+    behind the current version is stale and gets rebuilt.
+    """
+
+    user_id: str
+    lineage_version: int
+    chunks: dict[str, str]
+
+    @cached_property
+    def plants(self) -> dict[str, LineagePlant]:
+        adapter = TypeAdapter(dict[str, LineagePlant])
+        plants: dict[str, LineagePlant] = {}
+        for name, text in self.chunks.items():
+            if name.startswith("P"):
+                plants.update(adapter.validate_json(text))
+        return plants
+
+    @cached_property
+    def diagnostics(self) -> LineageDiagnostics:
+        return LineageDiagnostics.model_validate_json(self.chunks["D"])
+
+    @cached_property
+    def index(self) -> LineageIndex:
+        return LineageIndex(
+            fields
+            for name, text in self.chunks.items()
+            if name.startswith("P")
+            for fields in json.loads(text).values()
+        )
+
+    @cached_property
+    def levels_json(self) -> str:
+        return self._join_levels("L")
+
+    @cached_property
+    def sink_levels_json(self) -> str:
+        return self._join_levels("S")
+
+    def _join_levels(self, prefix: str) -> str:
+        slices: dict[int, dict[int, str]] = defaultdict(dict)
+        for name, text in self.chunks.items():
+            if name.startswith(prefix):
+                level, n = name[1:].split(".")
+                slices[int(level)][int(n)] = text
+        levels = (
+            "[" + ",".join(text for _, text in sorted(slices[level].items()) if text) + "]" for level in sorted(slices)
+        )
+        return "[" + ",".join(levels) + "]"
+
+    def get_levels_json(self, include_sinks: bool = False) -> str:
+        return self.sink_levels_json if include_sinks else self.levels_json
+
+    def get_etag(self, include_sinks: bool = False) -> str:
+        return '"' + hashlib.sha256(self.get_levels_json(include_sinks).encode("utf-8")).hexdigest()[:32] + '"'
+
+    @classmethod
+    def build(cls, user_id: str, plants: dict[str, LineagePlant], lineage_version: int = 0) -> "LineageLayout":
+        """Lays out the plants once and renders the levels both with and without sinks"""
+        # In a fixed order, so the same plants always give the same chunks
+        plant_list = sorted(plants.values(), key=lambda plant: (plant.human_id, plant.plant_id))
+        graph = _build_lineage_graph(plant_list)
+
+        buckets: dict[int, dict[str, dict]] = defaultdict(dict)
+        for plant in plant_list:
+            buckets[plant.human_id // LINEAGE_PLANT_BUCKET_SIZE][plant.plant_id] = plant.model_dump(mode="json")
+        chunks = {f"P{bucket}": _dumps(bucket_plants) for bucket, bucket_plants in buckets.items()}
+        for prefix, include_sinks in (("L", False), ("S", True)):
+            for level, nodes in enumerate(_node_dicts(graph, plant_list, include_sinks)):
+                for n, text in enumerate(_slice_level([_dumps(node) for node in nodes])):
+                    chunks[f"{prefix}{level}.{n}"] = text
+        chunks["D"] = graph.diagnostics.model_dump_json()
+        return cls(user_id=user_id, lineage_version=lineage_version, chunks=chunks)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _slice_level(node_jsons: list[str]) -> list[str]:
+    """Joins a level's nodes into slices of LINEAGE_SLICE_NODES nodes on average (and always at least one slice).
+
+    A slice ends after a node whose hash says so, rather than after a fixed number of nodes, so adding or removing a
+    node changes its own slice but leaves the boundaries (and contents) of the others where they were.
+    """
+    slices, current = [], []
+    for node_json in node_jsons:
+        current.append(node_json)
+        if len(current) >= 4 * LINEAGE_SLICE_NODES or zlib.crc32(node_json.encode()) % LINEAGE_SLICE_NODES == 0:
+            slices.append(",".join(current))
+            current = []
+    if current or not slices:
+        slices.append(",".join(current))
+    return slices
+
+
+def make_lineage_layout_key(user_id: str) -> dict:
+    return {"PK": f"USER#{user_id}", "SK": LINEAGE_LAYOUT_SK}
+
+
+def make_lineage_chunk_key(user_id: str, chunk_ref: str) -> dict:
+    """Key of a stored chunk; its ref is the ID of the write that stored it and the hash of its contents"""
+    return {"PK": f"USER#{user_id}", "SK": f"{LINEAGE_LAYOUT_SK}#{chunk_ref}"}
+
+
+def make_lineage_version_key(user_id: str) -> dict:
+    return {"PK": f"USER#{user_id}", "SK": LINEAGE_VERSION_SK}
+
+
+def bump_lineage_version(user_id: str) -> int:
+    """Counts a change to the user's lineage and returns the new lineage version.
+
+    Every write that changes a plant's lineage fields bumps it after the plant is written, which marks stored layouts
+    built from the plants before the write as stale.
+    """
+    response = get_db_table().update_item(
+        Key=make_lineage_version_key(user_id),
+        UpdateExpression="ADD #version :one",
+        ExpressionAttributeNames={"#version": "version"},
+        ExpressionAttributeValues={":one": 1},
+        ReturnValues="UPDATED_NEW",
+    )
+    return int(response["Attributes"]["version"])
+
+
+def get_lineage_version(user_id: str) -> int:
+    item = get_db_table().get_item(Key=make_lineage_version_key(user_id), ConsistentRead=True).get("Item")
+    return int(item["version"]) if item else 0
+
+
+def read_lineage_items(user_id: str) -> tuple[Optional[dict], int, dict[str, dict]]:
+    """Reads all of the user's lineage items in one query: the stored layout's header item, the user's lineage version
+    and the items of every stored chunk (by SK)
+    """
+    items = {
+        item["SK"]: item
+        for item in iterate_items(
+            get_db_table().query,
+            KeyConditionExpression=Key("PK").eq(f"USER#{user_id}") & Key("SK").begins_with("LINEAGE#"),
+            ConsistentRead=True,
+        )
+    }
+    version_item = items.get(LINEAGE_VERSION_SK)
+    return items.get(LINEAGE_LAYOUT_SK), int(version_item["version"]) if version_item else 0, items
+
+
+def read_lineage_layout(user_id: str, header: dict, items: dict[str, dict]) -> Optional[LineageLayout]:
+    """Reads the layout whose header item is given, or None if it's in an old format or its chunks are gone"""
+    if "chunk_refs" not in header:
+        return None
+    chunks = {}
+    for name, chunk_ref in header["chunk_refs"].items():
+        item = items.get(make_lineage_chunk_key(user_id, chunk_ref)["SK"])
+        if item is None:
+            return None
+        chunks[name] = zlib.decompress(item["data"].value).decode("utf-8")
+    return LineageLayout(user_id=user_id, lineage_version=int(header["lineage_version"]), chunks=chunks)
+
+
+def store_lineage_layout(
+    layout: LineageLayout,
+    old_header: Optional[dict],
+    condition: str,
+    values: dict,
+    check_version: bool = False,
+    reuse_chunks: bool = True,
+) -> bool:
+    """Stores the layout in place of the one with `old_header`, if the header item meets `condition`.
+
+    Chunks with the same contents as one of the old layout's are kept rather than written again, unless
+    `reuse_chunks` is off. With `check_version`, it's only stored if the user's lineage version is still the layout's.
+    Returns whether it was stored.
+    """
+    table = get_db_table()
+    client = table.meta.client
+    user_id, write_id = layout.user_id, uuid4().hex[:8]
+    old_refs = set((old_header or {}).get("chunk_refs", {}).values())
+    old_refs_by_hash = {chunk_ref.split("#")[1]: chunk_ref for chunk_ref in old_refs} if reuse_chunks else {}
+
+    chunk_refs, new_chunks = {}, {}
+    for name, text in layout.chunks.items():
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        chunk_ref = old_refs_by_hash.get(digest)
+        if chunk_ref is None:
+            chunk_ref = f"{write_id}#{digest}"
+            new_chunks[chunk_ref] = data
+        chunk_refs[name] = chunk_ref
+    # The new chunks go first, so the header never points at chunks that aren't there yet
+    with table.batch_writer() as batch:
+        for chunk_ref, data in new_chunks.items():
+            batch.put_item(Item={**make_lineage_chunk_key(user_id, chunk_ref), "data": zlib.compress(data)})
+
+    header = {**make_lineage_layout_key(user_id), "lineage_version": layout.lineage_version, "chunk_refs": chunk_refs}
+    transact_items: list[dict] = [
+        {
+            "Put": {
+                "TableName": table.name,
+                "Item": header,
+                "ConditionExpression": condition,
+                "ExpressionAttributeValues": values,
+            }
+        }
+    ]
+    if check_version:
+        if layout.lineage_version == 0:
+            version_condition: dict = {"ConditionExpression": "attribute_not_exists(SK)"}
+        else:
+            version_condition = {
+                "ConditionExpression": "#version = :version",
+                "ExpressionAttributeNames": {"#version": "version"},
+                "ExpressionAttributeValues": {":version": layout.lineage_version},
+            }
+        transact_items.append(
+            {"ConditionCheck": {"TableName": table.name, "Key": make_lineage_version_key(user_id), **version_condition}}
+        )
+    try:
+        client.transact_write_items(TransactItems=transact_items)
+    except client.exceptions.TransactionCanceledException:
+        delete_lineage_chunks(table, user_id, new_chunks)
+        return False
+
+    delete_lineage_chunks(table, user_id, old_refs - set(chunk_refs.values()))
+    return True
+
+
+def delete_lineage_chunks(table, user_id: str, chunk_refs: Iterable[str]) -> None:
+    with table.batch_writer() as batch:
+        for chunk_ref in chunk_refs:
+            batch.delete_item(Key=make_lineage_chunk_key(user_id, chunk_ref))
+
+
+def drop_lineage_layout(user_id: str) -> None:
+    """Deletes the stored layout, with all of its chunks, so the next view rebuilds it"""
+    table = get_db_table()
+    _, _, items = read_lineage_items(user_id)
+    with table.batch_writer() as batch:
+        for sk in items:
+            if sk.startswith(LINEAGE_LAYOUT_SK):
+                batch.delete_item(Key={"PK": f"USER#{user_id}", "SK": sk})
+
+
+def get_stored_lineage_layout(user_id: str) -> Optional[LineageLayout]:
+    """Returns the stored layout if it's up to date with the user's plants"""
+    header, lineage_version, items = read_lineage_items(user_id)
+    if header is None or int(header.get("lineage_version", -1)) != lineage_version:
+        return None
+    return read_lineage_layout(user_id, header, items)
+
+
+def build_lineage_layout(
+    user_id: str, lineage_version: Optional[int] = None, old_header: Optional[dict] = None
+) -> LineageLayout:
+    """Builds the user's layout from all of their plants (but not ones being deleted) and stores it.
+
+    `lineage_version` must be read before the plants are. The layout is only stored if no lineage write has bumped the
+    version since (its plants could be missing that write) and no newer layout was stored meanwhile. All of its
+    chunks are written, as the old layout's may not all be there.
+    """
+    table = get_db_table()
+    if lineage_version is None:
+        lineage_version = get_lineage_version(user_id)
+    items = iterate_items(
+        table.query,
+        KeyConditionExpression=Key("PK").eq(f"USER#{user_id}") & Key("SK").begins_with("PLANT#"),
+        FilterExpression=NOT_DELETED_CONDITION,
+        ConsistentRead=True,
+    )
+    plants = {plant.plant_id: plant for plant in (LineagePlant.from_plant(PlantItem(**item)) for item in items)}
+    layout = LineageLayout.build(user_id, plants, lineage_version)
+    stored = store_lineage_layout(
+        layout,
+        old_header,
+        # Layouts in an older format can be replaced whatever their version
+        "attribute_not_exists(chunk_refs) OR lineage_version < :version",
+        {":version": lineage_version},
+        check_version=True,
+        reuse_chunks=False,
+    )
+    if not stored:
+        logger.debug(f"Lineage of {user_id} changed while its layout was built; not storing it")
+    return layout
+
+
+def get_lineage_layout(user_id: str) -> LineageLayout:
+    """Returns the user's stored layout, (re)building it if there is none or it's stale"""
+    header, lineage_version, items = read_lineage_items(user_id)
+    if header is not None and int(header.get("lineage_version", -1)) == lineage_version:
+        layout = read_lineage_layout(user_id, header, items)
+        if layout is not None:
+            return layout
+    return build_lineage_layout(user_id, lineage_version, header)
+
+
+def get_lineage_index(user_id: str) -> LineageIndex:
+    """Returns the index of the user's current plants, reusing the one built for their lineage version if cached"""
+    index = LINEAGE_INDEX_CACHE.get((user_id, get_lineage_version(user_id)))
+    if index is None:
+        layout = get_lineage_layout(user_id)
+        index = layout.index
+        LINEAGE_INDEX_CACHE.set((user_id, layout.lineage_version), index)
+    return index
+
+
+def invalidate_lineage_layout(user_id: str) -> None:
+    """Marks the stored layout stale so the next view rebuilds it from the user's plants (e.g. after a bulk import)"""
+    bump_lineage_version(user_id)
+
+
+def update_lineage_layout(user_id: str, old_plant: Optional[PlantItem], new_plant: Optional[PlantItem]) -> None:
+    """Applies a plant create (old_plant=None), update or delete (new_plant=None) to the user's stored layout.
+
+    Writes that don't touch lineage fields are skipped. Others bump the lineage version; the stored layout is then
+    laid out again from its stored plants with the change applied, and only the chunks that changed are written. If
+    there's no layout, or another write got in between, it's left stale and rebuilt on the next view. The plant is
+    already written, so failures here are logged rather than raised.
+    """
+    old = LineagePlant.from_plant(old_plant) if old_plant else None
+    new = LineagePlant.from_plant(new_plant) if new_plant else None
+    if old == new:
+        return
+    bumped = False
+    try:
+        lineage_version = bump_lineage_version(user_id)
+        bumped = True
+        header, _, items = read_lineage_items(user_id)
+        if header is None or int(header.get("lineage_version", -1)) != lineage_version - 1:
+            return
+        layout = read_lineage_layout(user_id, header, items)
+        if layout is None:
+            return
+
+        plants = dict(layout.plants)
+        if new is None:
+            if old is not None:
+                plants.pop(old.plant_id, None)
+        else:
+            plants[new.plant_id] = new
+        updated_layout = LineageLayout.build(user_id, plants, lineage_version)
+        if not store_lineage_layout(
+            updated_layout, header, "lineage_version = :previous", {":previous": lineage_version - 1}
+        ):
+            logger.info(f"Lineage layout for {user_id} changed concurrently; leaving it to be rebuilt")
+    except Exception:
+        if bumped:
+            # The bump has already made the stored layout stale: the next view rebuilds it and replaces its chunks
+            logger.exception(f"Could not update the lineage layout for {user_id}; leaving it to be rebuilt")
+            return
+        logger.exception(f"Could not count a lineage change for {user_id}; dropping its layout to be rebuilt")
+        try:
+            drop_lineage_layout(user_id)
+        except Exception:
+            logger.exception(f"Could not drop the lineage layout for {user_id}")
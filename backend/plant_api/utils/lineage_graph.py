@@ -0,0 +1,210 @@
+"""Compact graph the lineage layout is computed on.
+
+Nodes are integer indices into parallel arrays and parents are stored CSR-style: the parents of node i are
+`parent_indices[parent_offsets[i]:parent_offsets[i + 1]]`. Laying out a lineage this way doesn't build (or validate, or
+mutate) a pydantic model per plant; those are only made for the response, if at all.
+"""
+import logging
+from array import array
+from collections import Counter, deque
+from typing import Iterable, Optional, Sequence
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+NodeId = int | str
+
+SOURCE = 0
+PLANT = 1
+SINK = 2
+
+
+class DanglingParent(BaseModel):
+    node_id: int | str
+    parent_id: int | str
+
+
+class LineageDiagnostics(BaseModel):
+    """Problems found in the lineage data; the graph is still laid out around them"""
+
+    dangling_parents: list[DanglingParent] = []
+    cycles: list[list[int | str]] = []
+
+
+def id_sort_key(node_id: NodeId) -> tuple[bool, NodeId]:
+    """Orders ids of mixed types (plant human_ids first, then source/sink names) without comparing ints to strs"""
+    return isinstance(node_id, str), node_id
+
+
+class LineageGraph:
+    """Lineage nodes (plants, sources and sinks) and their parents, as arrays of node indices"""
+
+    __slots__ = ("ids", "kinds", "parent_offsets", "parent_indices", "generations", "diagnostics")
+
+    def __init__(self) -> None:
+        self.ids: list[NodeId] = []
+        self.kinds = array("b")
+        self.parent_offsets = array("l", [0])
+        self.parent_indices = array("l")
+        self.generations = array("l")
+        self.diagnostics = LineageDiagnostics()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def parents(self, index: int) -> array:
+        return self.parent_indices[self.parent_offsets[index] : self.parent_offsets[index + 1]]
+
+    def parent_ids(self, index: int) -> list[NodeId]:
+        return [self.ids[parent] for parent in self.parents(index)]
+
+    @classmethod
+    def build(
+        cls, nodes: Iterable[tuple[NodeId, int, Optional[Sequence[NodeId]], Optional[str], Optional[str]]]
+    ) -> "LineageGraph":
+        """Builds the graph from (id, kind, parent ids, source, sink) tuples; node i is the i-th tuple.
+
+        Parents that don't exist (or are sinks) are dropped and reported in `diagnostics`. A plant left without parents
+        gets its source as its only parent, and a source node is added after the given nodes if there isn't one. Nodes
+        with a sink get a sink node (added last) with all of the nodes that went to it as its parents.
+        """
+        graph = cls()
+        nodes = list(nodes)
+        ids, kinds = graph.ids, graph.kinds
+        for node_id, kind, _, _, _ in nodes:
+            ids.append(node_id)
+            kinds.append(kind)
+        index_of = {node_id: index for index, node_id in enumerate(ids) if kinds[index] != SINK}
+
+        sink_parents: dict[str, list[int]] = {}
+        for index, (node_id, kind, parent_ids, source, sink) in enumerate(nodes):
+            parents = []
+            for parent_id in parent_ids or ():
+                parent = index_of.get(parent_id)
+                if parent is None:
+                    graph.diagnostics.dangling_parents.append(DanglingParent(node_id=node_id, parent_id=parent_id))
+                else:
+                    parents.append(parent)
+            if not parents and kind != SINK and source is not None:
+                if source not in index_of:
+                    index_of[source] = len(ids)
+                    ids.append(source)
+                    kinds.append(SOURCE)
+                parents.append(index_of[source])
+            graph.parent_indices.extend(parents)
+            graph.parent_offsets.append(len(graph.parent_indices))
+            if sink is not None:
+                sink_parents.setdefault(sink, []).append(index)
+        # Added sources have no parents
+        graph.parent_offsets.extend([len(graph.parent_indices)] * (len(ids) - len(nodes)))
+        for sink, parents in sink_parents.items():
+            ids.append(sink)
+            kinds.append(SINK)
+            graph.parent_indices.extend(parents)
+            graph.parent_offsets.append(len(graph.parent_indices))
+        return graph
+
+    def assign_generations(self) -> LineageDiagnostics:
+        """Sets each node's generation: 0 for nodes without parents, otherwise one more than its latest parent.
+
+        Runs Kahn's topological sort, so it's iterative and O(V + E). Nodes in (or downstream of) a parent cycle are
+        placed just below their resolved parents and reported in `diagnostics`. Sinks go one below their last parent.
+        """
+        n_nodes = len(self.ids)
+        kinds, parent_offsets, parent_indices = self.kinds, self.parent_offsets, self.parent_indices
+
+        # Children in CSR form too, by counting sort of the (non-sink) parent links
+        n_unprocessed_parents = array("l", [0]) * n_nodes
+        child_offsets = array("l", [0]) * (n_nodes + 1)
+        for index in range(n_nodes):
+            if kinds[index] == SINK:
+                continue
+            n_unprocessed_parents[index] = parent_offsets[index + 1] - parent_offsets[index]
+            for parent in parent_indices[parent_offsets[index] : parent_offsets[index + 1]]:
+                child_offsets[parent + 1] += 1
+        for index in range(n_nodes):
+            child_offsets[index + 1] += child_offsets[index]
+        child_indices = array("l", [0]) * child_offsets[n_nodes]
+        next_child = child_offsets[:n_nodes]
+        for index in range(n_nodes):
+            if kinds[index] == SINK:
+                continue
+            for parent in parent_indices[parent_offsets[index] : parent_offsets[index + 1]]:
+                child_indices[next_child[parent]] = index
+                next_child[parent] += 1
+
+        generations = self.generations = array("l", [0]) * n_nodes
+        queue = deque(index for index in range(n_nodes) if kinds[index] != SINK and not n_unprocessed_parents[index])
+        while queue:
+            index = queue.popleft()
+            child_generation = generations[index] + 1
+            for child in child_indices[child_offsets[index] : child_offsets[index + 1]]:
+                if generations[child] < child_generation:
+                    generations[child] = child_generation
+                n_unprocessed_parents[child] -= 1
+                if not n_unprocessed_parents[child]:
+                    queue.append(child)
+
+        unresolved = {index for index in range(n_nodes) if n_unprocessed_parents[index]}
+        if unresolved:
+            self.diagnostics.cycles = self._find_cycles(unresolved)
+            for index in unresolved:
+                generations[index] = max(generations[index], 1)
+        if self.diagnostics.dangling_parents or self.diagnostics.cycles:
+            logger.warning(f"Lineage has problems: {self.diagnostics}")
+
+        # Sinks only have (non-sink) parents, so they're placed once everything else is
+        for index in range(n_nodes):
+            if kinds[index] == SINK:
+                parents = parent_indices[parent_offsets[index] : parent_offsets[index + 1]]
+                generations[index] = max((generations[parent] for parent in parents), default=0) + 1
+        return self.diagnostics
+
+    def _find_cycles(self, unresolved: set[int]) -> list[list[NodeId]]:
+        """Finds the distinct cycles among nodes Kahn's algorithm couldn't resolve.
+
+        Every unresolved node has at least one unresolved parent, so following those parents always ends in a cycle.
+        """
+        cycles = []
+        visited: set[int] = set()
+        for start in sorted(unresolved, key=lambda index: str(self.ids[index])):
+            path: list[int] = []
+            on_path: set[int] = set()
+            index = start
+            while index not in visited:
+                visited.add(index)
+                path.append(index)
+                on_path.add(index)
+                index = min((p for p in self.parents(index) if p in unresolved), key=lambda p: str(self.ids[p]))
+            if index in on_path:
+                cycles.append([self.ids[node] for node in path[path.index(index) :]])
+        return cycles
+
+    def levels(self, include_sinks: bool = True) -> list[list[int]]:
+        """Groups node indices into levels by generation, ordered within each level for drawing"""
+        indices = [index for index in range(len(self.ids)) if include_sinks or self.kinds[index] != SINK]
+        if not indices:
+            return []
+        id_keys = [id_sort_key(node_id) for node_id in self.ids]
+        if include_sinks:
+            parent_counts = Counter(self.parent_indices)
+        else:
+            parent_counts = Counter(parent for index in indices for parent in self.parents(index))
+        no_parent_key = (0, id_sort_key("0"))
+
+        def level_sort_key(index: int) -> tuple:
+            parents = self.parents(index)
+            if not parents:
+                return no_parent_key + (id_keys[index],)
+            first_parent = min(parents, key=id_keys.__getitem__)
+            # Larger groups of siblings first, then by parent (the first for plants with multiple parents), then by id
+            return parent_counts[first_parent], id_keys[first_parent], id_keys[index]
+
+        generations = self.generations
+        levels: list[list[int]] = [[] for _ in range(max(generations[index] for index in indices) + 1)]
+        for index in indices:
+            levels[generations[index]].append(index)
+        for level in levels:
+            level.sort(key=level_sort_key)
+        return levels
@@ -1,19 +1,128 @@
+import hashlib
+import hmac
 import logging
-import boto3
-from botocore.exceptions import ClientError
+import os
+import time
+from datetime import datetime, timezone
+from typing import BinaryIO, Optional
+from urllib.parse import quote
+
+from botocore.exceptions import ClientError, NoCredentialsError
+from pydantic import BaseModel
 
 from plant_api.constants import S3_BUCKET_NAME
 from plant_api.schema import ImageItem
+from plant_api.utils.aws_clients import get_aws_client, get_aws_credentials
+from plant_api.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# S3 multipart parts must be at least 5 MiB (apart from the last one)
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+
+PRESIGNED_URL_EXPIRATION_SEC = 86400
+# A signed URL is reused until this fraction of its lifetime has passed, so it's always handed out with at least
+# (1 - fraction) of its lifetime left
+PRESIGNED_URL_REUSE_FRACTION_ENV_VAR = "PRESIGNED_URL_REUSE_FRACTION"
+DEFAULT_PRESIGNED_URL_REUSE_FRACTION = 0.5
+PRESIGNED_URL_CACHE_MAX_SIZE = 10_000
+# Most keys S3 takes in one DeleteObjects request
+DELETE_OBJECTS_MAX_KEYS = 1000
+
+# Signed URLs keyed by (bucket, key, expiration)
+PRESIGNED_URL_CACHE: TTLCache[tuple[str, str, int], str] = TTLCache(
+    max_size=PRESIGNED_URL_CACHE_MAX_SIZE, ttl_seconds=PRESIGNED_URL_EXPIRATION_SEC
+)
+
+
+def get_presigned_url_reuse_seconds(expiration_sec: int) -> float:
+    fraction = float(os.getenv(PRESIGNED_URL_REUSE_FRACTION_ENV_VAR, DEFAULT_PRESIGNED_URL_REUSE_FRACTION))
+    return expiration_sec * fraction
+
+
+def get_presigned_url_cache_ttl(expiration_sec: int, now: Optional[float] = None) -> float:
+    """Seconds until the end of the current reuse window.
+
+    Windows are aligned to wall-clock multiples of the reuse period, so every URL signed within a window is replaced at
+    the same moment instead of each key churning on its own schedule.
+    """
+    reuse_seconds = get_presigned_url_reuse_seconds(expiration_sec)
+    now = time.time() if now is None else now
+    return reuse_seconds - (now % reuse_seconds)
+
 
 def get_s3_client():
-    return boto3.client("s3")
+    return get_aws_client("s3")
+
+
+class StreamedUpload(BaseModel):
+    s3_key: str
+    size: int
+    sha256: str
+    parts: int
+    peak_buffered_bytes: int
+
+
+def stream_upload_to_s3(
+    fileobj: BinaryIO,
+    bucket_name: str,
+    object_name: str,
+    content_type: Optional[str] = None,
+    chunk_size: int = MULTIPART_CHUNK_SIZE,
+) -> StreamedUpload:
+    """Copies a file-like object to S3 one chunk at a time, hashing it on the way.
+
+    At most one chunk is held in memory. Files that fit in a single chunk are sent with one PutObject, and larger
+    ones with a multipart upload (aborted if anything fails, so no orphaned parts are left behind).
+    """
+    s3_client = get_s3_client()
+    digest = hashlib.sha256()
+    extra_args = {"ContentType": content_type} if content_type else {}
+
+    chunk = fileobj.read(chunk_size)
+    digest.update(chunk)
+    if len(chunk) < chunk_size:
+        s3_client.put_object(Bucket=bucket_name, Key=object_name, Body=chunk, **extra_args)
+        return StreamedUpload(
+            s3_key=object_name, size=len(chunk), sha256=digest.hexdigest(), parts=1, peak_buffered_bytes=len(chunk)
+        )
+
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=object_name, **extra_args)["UploadId"]
+    parts: list[dict] = []
+    size, peak_buffered_bytes = 0, 0
+    try:
+        while chunk:
+            part_number = len(parts) + 1
+            response = s3_client.upload_part(
+                Bucket=bucket_name, Key=object_name, UploadId=upload_id, PartNumber=part_number, Body=chunk
+            )
+            parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+            size += len(chunk)
+            peak_buffered_bytes = max(peak_buffered_bytes, len(chunk))
+            chunk = fileobj.read(chunk_size)
+            digest.update(chunk)
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name, Key=object_name, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket_name, Key=object_name, UploadId=upload_id)
+        raise
+
+    return StreamedUpload(
+        s3_key=object_name,
+        size=size,
+        sha256=digest.hexdigest(),
+        parts=len(parts),
+        peak_buffered_bytes=peak_buffered_bytes,
+    )
 
 
-def create_presigned_url(bucket_name: str, object_name: str, expiration_sec=86400):
-    """Generate a presigned URL to share an S3 object"""
+def create_presigned_url(bucket_name: str, object_name: str, expiration_sec=PRESIGNED_URL_EXPIRATION_SEC):
+    """Generate a presigned URL to share an S3 object (reusing a cached one while it's fresh enough)"""
+    cache_key = (bucket_name, object_name, expiration_sec)
+    cached_url = PRESIGNED_URL_CACHE.get(cache_key)
+    if cached_url is not None:
+        return cached_url
 
     s3_client = get_s3_client()
     try:
@@ -24,36 +133,173 @@ def create_presigned_url(bucket_name: str, object_name: str, expiration_sec=8640
         logging.error(e)
         return None
 
+    PRESIGNED_URL_CACHE.set(cache_key, response, ttl_seconds=get_presigned_url_cache_ttl(expiration_sec))
     return response
 
 
-async def create_async_presigned_url(session, bucket_name: str, object_name: str, expiration_sec=86400):
-    """Generate a presigned URL to share an S3 object"""
+def create_presigned_image_post(
+    bucket_name: str,
+    object_name: str,
+    max_bytes: int,
+    expiration_sec: int,
+    metadata: Optional[dict[str, str]] = None,
+) -> dict:
+    """Generate a presigned POST that lets a client upload one image (up to `max_bytes`) straight to S3
 
-    async with session.create_client("s3") as s3:
-        try:
-            response = await s3.generate_presigned_url(
-                "get_object", Params={"Bucket": bucket_name, "Key": object_name}, ExpiresIn=expiration_sec
-            )
-        except ClientError as e:
-            logging.error(e)
+    Returns the URL and the form fields the client must send along with the file. `metadata` is stored on the object
+    as user metadata (x-amz-meta-*) and is part of the signed policy, so the client can't change or leave it out.
+    """
+    fields = {f"x-amz-meta-{name}": value for name, value in (metadata or {}).items()}
+    return get_s3_client().generate_presigned_post(
+        bucket_name,
+        object_name,
+        Fields=fields,
+        Conditions=[
+            ["content-length-range", 1, max_bytes],
+            ["starts-with", "$Content-Type", "image/"],
+            *({name: value} for name, value in fields.items()),
+        ],
+        ExpiresIn=expiration_sec,
+    )
+
+
+def delete_s3_objects(bucket_name: str, object_names: list[str]) -> None:
+    """Deletes the objects with DeleteObjects, 1000 keys per request. Keys that don't exist count as deleted.
+
+    Raises if any object couldn't be deleted, after trying all of them.
+    """
+    s3_client = get_s3_client()
+    failed = []
+    for start in range(0, len(object_names), DELETE_OBJECTS_MAX_KEYS):
+        batch = object_names[start : start + DELETE_OBJECTS_MAX_KEYS]
+        response = s3_client.delete_objects(
+            Bucket=bucket_name, Delete={"Objects": [{"Key": name} for name in batch], "Quiet": True}
+        )
+        failed.extend(response.get("Errors", []))
+    if failed:
+        logger.error(f"Could not delete S3 objects: {failed}")
+        raise RuntimeError(f"Could not delete {len(failed)} of {len(object_names)} S3 objects")
+
+
+def get_s3_object_metadata(bucket_name: str, object_name: str) -> Optional[dict[str, str]]:
+    """The object's user metadata (without the x-amz-meta- prefix), or None if it doesn't exist"""
+    try:
+        response = get_s3_client().head_object(Bucket=bucket_name, Key=object_name)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
             return None
+        raise e
+    return response.get("Metadata", {})
+
 
-        return response
+def s3_object_exists(bucket_name: str, object_name: str) -> bool:
+    try:
+        get_s3_client().head_object(Bucket=bucket_name, Key=object_name)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise e
+    return True
 
 
-# TODO switch this over to baby thumbnail
-def create_presigned_thumbnail_url(image: ImageItem) -> None:
-    image.signed_thumbnail_photo_url = create_presigned_url(S3_BUCKET_NAME, image.thumbnail_photo_s3_url)
+def _hmac_sha256(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
 
 
-async def create_async_presigned_thumbnail_url(session, image: ImageItem) -> None:
-    logger.debug(f"Creating presigned URL for image {image.image_id}")
-    image.signed_thumbnail_photo_url = await create_async_presigned_url(
-        session, S3_BUCKET_NAME, image.thumbnail_photo_s3_url
-    )
+def get_presign_signing_time(expiration_sec: int, now: Optional[float] = None) -> float:
+    """The start of the current reuse window, used as the signing time for batch-signed URLs.
+
+    Every process signs with the same timestamp within a window, so the same key gives byte-identical URLs everywhere
+    until the window rolls over.
+    """
+    now = time.time() if now is None else now
+    return now - (now % get_presigned_url_reuse_seconds(expiration_sec))
 
 
-def create_presigned_urls_for_image(image: ImageItem) -> None:
-    image.signed_full_photo_url = create_presigned_url(S3_BUCKET_NAME, image.full_photo_s3_url)
+def presign_get_urls(
+    bucket_name: str,
+    object_names: list[str],
+    expiration_sec: int = PRESIGNED_URL_EXPIRATION_SEC,
+    signing_time: Optional[float] = None,
+) -> dict[str, str]:
+    """Generate presigned GET URLs for many objects at once, without a botocore signing round per URL.
+
+    This is SigV4 query-string auth as botocore's S3SigV4QueryAuth does it, but the signing key, credential scope and
+    the canonical query string (identical for every URL in the batch) are built once. Each URL then only costs a path
+    quote, one SHA-256 and one HMAC.
+
+    Raises NoCredentialsError if there are no AWS credentials, as botocore's own presigning does.
+    """
+    aws_credentials = get_aws_credentials()
+    if aws_credentials is None:
+        raise NoCredentialsError()
+    # Frozen so all URLs in the batch are signed with the same ones, even if they're refreshed meanwhile
+    credentials = aws_credentials.get_frozen_credentials()
+    region = get_s3_client().meta.region_name
+    host = f"{bucket_name}.s3.{region}.amazonaws.com"
+
+    if signing_time is None:
+        signing_time = get_presign_signing_time(expiration_sec)
+    signed_at = datetime.fromtimestamp(signing_time, tz=timezone.utc)
+    amz_date = signed_at.strftime("%Y%m%dT%H%M%SZ")
+    datestamp = signed_at.strftime("%Y%m%d")
+    scope = f"{datestamp}/{region}/s3/aws4_request"
+
+    signing_key = _hmac_sha256(f"AWS4{credentials.secret_key}".encode("utf-8"), datestamp)
+    for scope_part in (region, "s3", "aws4_request"):
+        signing_key = _hmac_sha256(signing_key, scope_part)
+
+    auth_params = {
+        "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+        "X-Amz-Credential": f"{credentials.access_key}/{scope}",
+        "X-Amz-Date": amz_date,
+        "X-Amz-Expires": str(expiration_sec),
+        "X-Amz-SignedHeaders": "host",
+    }
+    if credentials.token is not None:
+        auth_params["X-Amz-Security-Token"] = credentials.token
+    query_string = "&".join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(auth_params.items()))
+    canonical_suffix = f"\n{query_string}\nhost:{host}\n\nhost\nUNSIGNED-PAYLOAD"
+    string_to_sign_prefix = f"AWS4-HMAC-SHA256\n{amz_date}\n{scope}\n"
+
+    urls = {}
+    for object_name in object_names:
+        path = "/" + quote(object_name, safe="/-_.~")
+        canonical_request_hash = hashlib.sha256(f"GET\n{path}{canonical_suffix}".encode("utf-8")).hexdigest()
+        signature = hmac.new(
+            signing_key, (string_to_sign_prefix + canonical_request_hash).encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+        urls[object_name] = f"https://{host}{path}?{query_string}&X-Amz-Signature={signature}"
+    return urls
+
+
+def create_presigned_urls_for_images(images: list[ImageItem], thumbnails_only: bool = False) -> None:
+    """Sets the signed URLs on every image, signing whatever isn't cached in one batch"""
+    object_names = {image.thumbnail_photo_s3_url for image in images}
+    if not thumbnails_only:
+        object_names.update(image.full_photo_s3_url for image in images)
+
+    urls: dict[str, str] = {}
+    to_sign = []
+    for object_name in object_names:
+        cached_url = PRESIGNED_URL_CACHE.get((S3_BUCKET_NAME, object_name, PRESIGNED_URL_EXPIRATION_SEC))
+        if cached_url is None:
+            to_sign.append(object_name)
+        else:
+            urls[object_name] = cached_url
+    if to_sign:
+        signed_urls = presign_get_urls(S3_BUCKET_NAME, to_sign)
+        ttl_seconds = get_presigned_url_cache_ttl(PRESIGNED_URL_EXPIRATION_SEC)
+        for object_name, url in signed_urls.items():
+            PRESIGNED_URL_CACHE.set((S3_BUCKET_NAME, object_name, PRESIGNED_URL_EXPIRATION_SEC), url, ttl_seconds)
+        urls.update(signed_urls)
+
+    for image in images:
+        image.signed_thumbnail_photo_url = urls[image.thumbnail_photo_s3_url]
+        if not thumbnails_only:
+            image.signed_full_photo_url = urls[image.full_photo_s3_url]
+
+
+# TODO switch this over to baby thumbnail
+def create_presigned_thumbnail_url(image: ImageItem) -> None:
     image.signed_thumbnail_photo_url = create_presigned_url(S3_BUCKET_NAME, image.thumbnail_photo_s3_url)
@@ -1,20 +1,125 @@
 import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
 
-import boto3
 from botocore.exceptions import ClientError
 
+from plant_api.utils.aws_clients import get_aws_client
 
-def get_aws_secret(secret_name: str):
-    region_name = "us-west-2"
+LOGGER = logging.getLogger(__name__)
 
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
+SECRETS_REGION = "us-west-2"
+CURRENT_VERSION_STAGE = "AWSCURRENT"
+PREVIOUS_VERSION_STAGE = "AWSPREVIOUS"
+
+# How long a fetched secret is served from memory, and how long before expiry a background refresh is kicked off
+SECRET_TTL_SECONDS = 15 * 60
+SECRET_REFRESH_MARGIN_SECONDS = 60
+
+
+def get_aws_secret(secret_name: str, version_stage: str = CURRENT_VERSION_STAGE) -> str:
+    """Fetches a secret straight from AWS Secrets Manager (uncached)"""
+    client = get_aws_client("secretsmanager", SECRETS_REGION)
 
     try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
+        get_secret_value_response = client.get_secret_value(SecretId=secret_name, VersionStage=version_stage)
     except ClientError as e:
         logging.error("Could not get secret from AWS Secrets Manager.")
         raise e
 
     return get_secret_value_response["SecretString"]
+
+
+def get_previous_aws_secret(secret_name: str) -> Optional[str]:
+    """Returns the previous version of a rotated secret, or None if the secret has never been rotated"""
+    try:
+        return get_aws_secret(secret_name, PREVIOUS_VERSION_STAGE)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ResourceNotFoundException":
+            return None
+        raise e
+
+
+@dataclass
+class CachedSecret:
+    current: str
+    previous: Optional[str]
+    expires_at: float
+    refreshing: bool = field(default=False)
+
+    def versions(self) -> list[str]:
+        """Returns the usable versions of the secret, newest first"""
+        return [self.current] if self.previous is None else [self.current, self.previous]
+
+
+class SecretsProvider:
+    """Per-process TTL cache in front of AWS Secrets Manager.
+
+    Secrets are refreshed in a background thread once they get within `refresh_margin_seconds` of expiring, so
+    callers only block on Secrets Manager for the very first fetch (or if a secret has fully expired).
+    Both the current and previous versions are kept so that values signed before a rotation still verify.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = SECRET_TTL_SECONDS,
+        refresh_margin_seconds: float = SECRET_REFRESH_MARGIN_SECONDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._cache: dict[str, CachedSecret] = {}
+        self._lock = threading.Lock()
+
+    def get_secret(self, secret_name: str) -> str:
+        """Returns the current version of the secret"""
+        return self._get_cached_secret(secret_name).current
+
+    def get_secret_versions(self, secret_name: str) -> list[str]:
+        """Returns the current and (if it exists) previous versions of the secret, newest first"""
+        return self._get_cached_secret(secret_name).versions()
+
+    def invalidate(self, secret_name: Optional[str] = None) -> None:
+        """Drops one (or every) secret from the cache so the next read goes to Secrets Manager"""
+        with self._lock:
+            if secret_name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(secret_name, None)
+
+    def _get_cached_secret(self, secret_name: str) -> CachedSecret:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(secret_name)
+            if cached is not None and now < cached.expires_at:
+                if now >= cached.expires_at - self.refresh_margin_seconds and not cached.refreshing:
+                    cached.refreshing = True
+                    threading.Thread(target=self._background_refresh, args=(secret_name,), daemon=True).start()
+                return cached
+        # Missing or fully expired, so fetch synchronously
+        return self._refresh(secret_name)
+
+    def _refresh(self, secret_name: str) -> CachedSecret:
+        cached = CachedSecret(
+            current=get_aws_secret(secret_name),
+            previous=get_previous_aws_secret(secret_name),
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        with self._lock:
+            self._cache[secret_name] = cached
+        return cached
+
+    def _background_refresh(self, secret_name: str) -> None:
+        try:
+            self._refresh(secret_name)
+        except Exception as e:
+            # Keep serving the cached value until it fully expires; the next read will retry
+            LOGGER.error("Background refresh of secret %s failed: %s", secret_name, e)
+            with self._lock:
+                cached = self._cache.get(secret_name)
+                if cached is not None:
+                    cached.refreshing = False
+
+
+SECRETS_PROVIDER = SecretsProvider()
@@ -6,11 +6,28 @@ from google.oauth2 import id_token
 from moto import mock_dynamodb, mock_s3, mock_secretsmanager
 from starlette.testclient import TestClient
 
-from plant_api.constants import S3_BUCKET_NAME, TABLE_NAME
+from plant_api.constants import (
+    ACTIVE_OWNER_ATTR,
+    ACTIVE_PLANTS_INDEX,
+    OWNER_LOCATION_ATTR,
+    OWNER_SPECIES_ATTR,
+    PLANT_LOCATION_INDEX,
+    PLANT_SPECIES_INDEX,
+    S3_BUCKET_NAME,
+    TABLE_NAME,
+    USER_DIRECTORY_INDEX,
+)
 from plant_api.dependencies import get_current_user_session
 from tests.lib import DEFAULT_TEST_USER, OTHER_TEST_USER, TEST_JWT_SECRET
 from plant_api.constants import JWT_KEY_IN_SECRETS_MANAGER, AWS_REGION
-from plant_api.schema import DbModelType, User, UserItem
+from plant_api.schema import DbModelType, ImageItem, PlantItem, User, UserItem
+from plant_api.utils.aws_clients import reset_aws_clients
+from plant_api.utils.cache import USER_SESSION_CACHE
+from plant_api.utils.db import make_human_id_item, make_image_owner_item
+from plant_api.utils.image_worker import IMAGE_WORKER_PROCESSES_ENV_VAR
+from plant_api.utils.lineage import LINEAGE_INDEX_CACHE
+from plant_api.utils.s3 import PRESIGNED_URL_CACHE
+from plant_api.utils.jobs import INLINE_JOB_QUEUE_BACKEND, JOB_QUEUE_BACKEND_ENV_VAR
 from tests.lib import image_in_s3_factory, image_record_factory, plant_record_factory
 
 
@@ -36,6 +53,20 @@ def set_mock_aws_env_vars():
     os.environ["AWS_SECURITY_TOKEN"] = "testing"
     os.environ["AWS_SESSION_TOKEN"] = "testing"
     os.environ["AWS_DEFAULT_REGION"] = AWS_REGION
+    # moto 4 stores aws-chunked (flexible checksum) multipart bodies verbatim, so only send checksums when required
+    os.environ["AWS_REQUEST_CHECKSUM_CALCULATION"] = "when_required"
+    # Run background jobs before the request returns so tests can check their results straight away
+    os.environ[JOB_QUEUE_BACKEND_ENV_VAR] = INLINE_JOB_QUEUE_BACKEND
+    # Image work runs on threads; TestImageWorker covers the process pool
+    os.environ[IMAGE_WORKER_PROCESSES_ENV_VAR] = "0"
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    USER_SESSION_CACHE.clear()
+    PRESIGNED_URL_CACHE.clear()
+    LINEAGE_INDEX_CACHE.clear()
+    yield
 
 
 @pytest.fixture
@@ -52,8 +83,8 @@ def create_plants_for_user(mock_db, user: User, n_plants: int):
     return plants
 
 
-def create_and_insert_image_record(mock_db, plant_id=None, timestamp=None):
-    image = image_record_factory(plant_id=plant_id, timestamp=timestamp)
+def create_and_insert_image_record(mock_db, plant_id=None, timestamp=None, owner_user_id=None):
+    image = image_record_factory(plant_id=plant_id, timestamp=timestamp, owner_user_id=owner_user_id)
     mock_db.insert_mock_data(image)
     return image
 
@@ -66,7 +97,7 @@ def image_record(mock_db):
 @pytest.fixture
 def plant_with_image_record(mock_db, default_user_plant):
     plant = default_user_plant
-    image = create_and_insert_image_record(mock_db, plant_id=plant.plant_id)
+    image = create_and_insert_image_record(mock_db, plant_id=plant.plant_id, owner_user_id=plant.user_id)
     return plant, image
 
 
@@ -97,6 +128,12 @@ class BaseMockDB:
             "AttributeDefinitions": [
                 {"AttributeName": "PK", "AttributeType": "S"},
                 {"AttributeName": "SK", "AttributeType": "S"},
+                {"AttributeName": "entity_type", "AttributeType": "S"},
+                {"AttributeName": "created_at", "AttributeType": "S"},
+                {"AttributeName": "human_id", "AttributeType": "N"},
+                {"AttributeName": ACTIVE_OWNER_ATTR, "AttributeType": "S"},
+                {"AttributeName": OWNER_LOCATION_ATTR, "AttributeType": "S"},
+                {"AttributeName": OWNER_SPECIES_ATTR, "AttributeType": "S"},
             ],
             "GlobalSecondaryIndexes": [
                 {
@@ -107,6 +144,29 @@ class BaseMockDB:
                     ],
                     "Projection": {"ProjectionType": "ALL"},
                 },
+                {
+                    "IndexName": USER_DIRECTORY_INDEX,
+                    "KeySchema": [
+                        {"AttributeName": "entity_type", "KeyType": "HASH"},
+                        {"AttributeName": "created_at", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+                *(
+                    {
+                        "IndexName": index_name,
+                        "KeySchema": [
+                            {"AttributeName": hash_key, "KeyType": "HASH"},
+                            {"AttributeName": "human_id", "KeyType": "RANGE"},
+                        ],
+                        "Projection": {"ProjectionType": "ALL"},
+                    }
+                    for index_name, hash_key in [
+                        (ACTIVE_PLANTS_INDEX, ACTIVE_OWNER_ATTR),
+                        (PLANT_LOCATION_INDEX, OWNER_LOCATION_ATTR),
+                        (PLANT_SPECIES_INDEX, OWNER_SPECIES_ATTR),
+                    ]
+                ),
             ],
             "ProvisionedThroughput": {"ReadCapacityUnits": 1, "WriteCapacityUnits": 1},
         }
@@ -121,7 +181,13 @@ class MockDB(BaseMockDB):
         self.dynamodb.create_table(**self.get_table_schema())
 
     def insert_mock_data(self, db_item: DbModelType):
-        self.dynamodb.Table(self.table_name).put_item(Item=db_item.dynamodb_dump())
+        table = self.dynamodb.Table(self.table_name)
+        table.put_item(Item=db_item.dynamodb_dump())
+        if isinstance(db_item, PlantItem):
+            # Plants are always created along with the item reserving their human_id
+            table.put_item(Item=make_human_id_item(db_item))
+        if isinstance(db_item, ImageItem) and db_item.owner_user_id is not None:
+            table.put_item(Item=make_image_owner_item(db_item))
 
     def delete_table(self):
         table = self.dynamodb.Table(self.table_name)
@@ -131,6 +197,7 @@ class MockDB(BaseMockDB):
 @pytest.fixture
 def mock_db():
     with mock_dynamodb():
+        reset_aws_clients()
         mock_db = MockDB()
         mock_db.create_table()
 
@@ -142,6 +209,7 @@ def mock_db():
 @pytest.fixture
 def fake_s3():
     with mock_s3():
+        reset_aws_clients()
         client = boto3.client("s3", region_name=AWS_REGION)
         client.create_bucket(Bucket=S3_BUCKET_NAME, CreateBucketConfiguration={"LocationConstraint": AWS_REGION})
         yield client
@@ -11,7 +11,7 @@ from PIL.Image import Image
 from plant_api.routers.images import ImageSuffixes, make_s3_path_for_image, upload_image_to_s3
 
 # from plant_api.main import app
-from plant_api.schema import EntityType, ImageItem, ItemKeys, PlantItem, User
+from plant_api.schema import EntityType, ImageItem, ItemKeys, PlantItem, User, UserItem
 
 TEST_FIXTURE_DIR = "./tests/fixture_data/"
 TEST_JWT_SECRET = "test_secret_d151f3b184e25d3318551697d9d62cb7a6ed86035bc60ace38b5bb510802ba37"
@@ -72,12 +72,29 @@ def plant_record_factory(
     )
 
 
+def user_record_factory(google_id: Optional[str] = None, disabled: bool = False) -> UserItem:
+    if google_id is None:
+        google_id = str(fake.random_int(min=1000, max=100000))
+    return UserItem(
+        PK=f"{ItemKeys.USER.value}#{google_id}",
+        SK=f"{ItemKeys.USER.value}#{google_id}",
+        entity_type=EntityType.USER,
+        google_id=google_id,
+        email=fake.email(),
+        given_name=fake.first_name(),
+        family_name=fake.last_name(),
+        created_at=fake.date_time(),
+        disabled=disabled,
+    )
+
+
 def image_record_factory(
     plant_id: Optional[uuid.UUID] = None,
     image_id: Optional[uuid.UUID] = None,
     full_photo_s3_url: Optional[str] = None,
     thumbnail_photo_s3_url: Optional[str] = None,
     timestamp: Optional[datetime] = None,
+    owner_user_id: Optional[str] = None,
 ) -> ImageItem:
     if plant_id is None:
         plant_id = fake.uuid4()
@@ -94,6 +111,7 @@ def image_record_factory(
             thumbnail_photo_s3_url or make_s3_path_for_image(image_id, plant_id, ImageSuffixes.THUMB)
         ),
         timestamp=timestamp,
+        owner_user_id=owner_user_id,
     )
 
 
@@ -1,6 +1,8 @@
 import uuid
 from datetime import datetime, timedelta
 
+import boto3
+import pytest
 from jose import jwt
 
 from plant_api.dependencies import decode_jwt_token
@@ -10,11 +12,16 @@ from tests.lib import DEFAULT_TEST_USER, TEST_JWT_SECRET
 from plant_api.constants import (
     ALGORITHM,
     GoogleOauthPayload,
+    AWS_REGION,
     JWT_KEY_IN_SECRETS_MANAGER,
     JwtPayload,
     get_jwt_secret,
 )
-from plant_api.utils.secrets import get_aws_secret
+from plant_api.utils.cache import USER_SESSION_CACHE, TTLCache
+from plant_api.utils.db import set_user_disabled
+from plant_api.utils.secrets import SECRETS_PROVIDER, SecretsProvider, get_aws_secret
+
+ROTATED_JWT_SECRET = "rotated_test_secret_0b1e2f"
 
 
 def create_current_access_token() -> str:
@@ -54,12 +61,67 @@ def create_expired_session_token(user: User) -> str:
     )
 
 
+@pytest.fixture
+def rotated_jwt_secret():
+    """Rotates the JWT key so TEST_JWT_SECRET becomes the previous version, then rotates it back"""
+    client = boto3.client("secretsmanager", region_name=AWS_REGION)
+    client.put_secret_value(SecretId=JWT_KEY_IN_SECRETS_MANAGER, SecretString=ROTATED_JWT_SECRET)
+    SECRETS_PROVIDER.invalidate()
+    yield ROTATED_JWT_SECRET
+    client.put_secret_value(SecretId=JWT_KEY_IN_SECRETS_MANAGER, SecretString=TEST_JWT_SECRET)
+    SECRETS_PROVIDER.invalidate()
+
+
 class TestAWSAccess:
     def test_get_jwt_key(self):
         secret = get_aws_secret(JWT_KEY_IN_SECRETS_MANAGER)
         assert secret == TEST_JWT_SECRET
 
 
+class TestSecretsProvider:
+    def test_secret_is_cached(self, monkeypatch):
+        provider = SecretsProvider()
+        assert provider.get_secret(JWT_KEY_IN_SECRETS_MANAGER) == TEST_JWT_SECRET
+
+        def fail_fetch(*args, **kwargs):
+            raise AssertionError("Secrets Manager should not be called for a cached secret")
+
+        monkeypatch.setattr("plant_api.utils.secrets.get_aws_secret", fail_fetch)
+        assert provider.get_secret(JWT_KEY_IN_SECRETS_MANAGER) == TEST_JWT_SECRET
+
+    def test_expired_secret_is_refetched(self, rotated_jwt_secret):
+        provider = SecretsProvider(ttl_seconds=0)
+        assert provider.get_secret(JWT_KEY_IN_SECRETS_MANAGER) == rotated_jwt_secret
+        boto3.client("secretsmanager", region_name=AWS_REGION).put_secret_value(
+            SecretId=JWT_KEY_IN_SECRETS_MANAGER, SecretString="another_secret"
+        )
+        assert provider.get_secret(JWT_KEY_IN_SECRETS_MANAGER) == "another_secret"
+
+    def test_get_secret_versions_after_rotation(self, rotated_jwt_secret):
+        provider = SecretsProvider()
+        assert provider.get_secret_versions(JWT_KEY_IN_SECRETS_MANAGER) == [rotated_jwt_secret, TEST_JWT_SECRET]
+
+
+class TestKeyRotation:
+    def test_token_signed_with_previous_key_still_decodes(self, rotated_jwt_secret):
+        old_token = jwt.encode(
+            JwtPayload(
+                email=DEFAULT_TEST_USER.email,
+                google_id=DEFAULT_TEST_USER.google_id,
+                exp=datetime.utcnow() + timedelta(days=1),
+                jti=str(uuid.uuid4()),
+            ).model_dump(),
+            TEST_JWT_SECRET,
+            algorithm=ALGORITHM,
+        )
+        assert decode_jwt_token(old_token).google_id == DEFAULT_TEST_USER.google_id
+
+    def test_new_tokens_use_current_key(self, rotated_jwt_secret):
+        token = create_current_access_token()
+        decoded = jwt.decode(token, rotated_jwt_secret, algorithms=[ALGORITHM])
+        assert decoded["google_id"] == DEFAULT_TEST_USER.google_id
+
+
 class TestTokenFlow:
     def test_get_jwt_on_login(self, client_no_session, mock_google_oauth, default_enabled_user_in_db, mock_db):
         mock_oauth2_token = "mock_oauth2_token"
@@ -94,3 +156,52 @@ class TestTokenFlow:
         response = client_no_session().get("/check_token", headers={"Authorization": f"Bearer {current_session_token}"})
 
         assert response.status_code == 401
+
+
+class TestSessionCache:
+    def test_repeat_token_is_served_from_cache(self, client_no_session, default_enabled_user_in_db):
+        token = create_current_session_token(default_enabled_user_in_db)
+        headers = {"Authorization": f"Bearer {token}"}
+        client = client_no_session()
+
+        assert client.get("/check_token", headers=headers).status_code == 200
+        assert client.get("/check_token", headers=headers).status_code == 200
+        stats = USER_SESSION_CACHE.stats()
+        assert stats.misses == 1
+        assert stats.hits == 1
+
+    def test_visibility_change_invalidates_cached_session(self, client_no_session, default_enabled_user_in_db):
+        token = create_current_session_token(default_enabled_user_in_db)
+        headers = {"Authorization": f"Bearer {token}"}
+        client = client_no_session()
+
+        client.post("/users/settings/visibility", json={"is_public": False}, headers=headers)
+        response = client.get("/check_token", headers=headers)
+        assert response.json()["is_public_profile"] is False
+
+    def test_disabled_user_is_rejected_despite_cache(self, client_no_session, default_enabled_user_in_db):
+        token = create_current_session_token(default_enabled_user_in_db)
+        headers = {"Authorization": f"Bearer {token}"}
+        client = client_no_session()
+
+        assert client.get("/check_token", headers=headers).status_code == 200
+        set_user_disabled(default_enabled_user_in_db.google_id, True)
+        assert client.get("/check_token", headers=headers).status_code == 401
+
+
+class TestTTLCache:
+    def test_evicts_least_recently_used(self):
+        cache: TTLCache[str, int] = TTLCache(max_size=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_entries_expire(self):
+        cache: TTLCache[str, int] = TTLCache(max_size=2, ttl_seconds=60)
+        cache.set("a", 1, ttl_seconds=0)
+        assert cache.get("a") is None
+        assert cache.stats().size == 0
@@ -0,0 +1,32 @@
+from plant_api.constants import AWS_REGION
+from plant_api.utils.aws_clients import (
+    MAX_POOL_CONNECTIONS_ENV_VAR,
+    get_aws_client,
+    get_aws_resource,
+    reset_aws_clients,
+)
+from plant_api.utils.db import get_db_table
+from plant_api.utils.s3 import get_s3_client
+
+
+class TestClientPool:
+    def test_client_is_reused(self):
+        assert get_s3_client() is get_s3_client()
+        assert get_aws_client("s3", AWS_REGION) is not get_aws_client("dynamodb", AWS_REGION)
+
+    def test_resource_is_reused(self, mock_db):
+        assert get_aws_resource("dynamodb", AWS_REGION) is get_aws_resource("dynamodb", AWS_REGION)
+        assert get_db_table().meta.client is get_db_table().meta.client
+
+    def test_reset_builds_new_clients(self):
+        client = get_s3_client()
+        resource = get_aws_resource("dynamodb", AWS_REGION)
+        reset_aws_clients()
+        assert get_s3_client() is not client
+        assert get_aws_resource("dynamodb", AWS_REGION) is not resource
+
+    def test_pool_size_is_configurable(self, monkeypatch):
+        monkeypatch.setenv(MAX_POOL_CONNECTIONS_ENV_VAR, "7")
+        reset_aws_clients()
+        assert get_aws_client("s3", AWS_REGION).meta.config.max_pool_connections == 7
+        reset_aws_clients()
@@ -1,16 +1,51 @@
+import asyncio
+import hashlib
+import io
+import os
 import tempfile
+import threading
+import time
 import uuid
 from datetime import datetime
+from urllib.parse import quote
 
+import boto3
+import botocore.auth
+import pytest
+from botocore.awsrequest import AWSRequest
+from botocore.exceptions import ClientError, NoCredentialsError
 from PIL import Image as img
 from pydantic import TypeAdapter
 from starlette import status
 
-from tests.conftest import create_and_insert_image_record
-from plant_api.constants import S3_BUCKET_NAME
-from plant_api.routers.images import MAX_THUMB_X_PIXELS, _orient_image
-from plant_api.utils.db import make_image_query_key, is_user_access_allowed
-from plant_api.schema import ImageItem
+from tests.conftest import create_and_insert_image_record, create_plants_for_user
+from plant_api.constants import NEXT_CURSOR_HEADER, S3_BUCKET_NAME
+from plant_api.utils.image_processing import MAX_THUMB_X_PIXELS, orient_image
+from plant_api.utils.db import (
+    backfill_image_owner_items,
+    is_user_access_allowed,
+    make_image_owner_key,
+    make_image_query_key,
+)
+from plant_api.routers.images import (
+    backfill_latest_image_pointers,
+    generate_image_derivatives,
+    handle_s3_upload_event,
+    set_image_job_queue,
+)
+from plant_api.schema import ImageItem, ImageProcessingStatus, ImageUploadTicket
+from plant_api.utils.db import get_user_by_google_id
+from plant_api.utils.image_processing import ImageSuffixes, render_derivatives
+from plant_api.utils.image_worker import ImageWorker
+from plant_api.utils.jobs import LocalJobQueue
+from plant_api.utils.s3 import (
+    PRESIGNED_URL_CACHE,
+    create_presigned_url,
+    get_presigned_url_cache_ttl,
+    get_s3_client,
+    presign_get_urls,
+    stream_upload_to_s3,
+)
 from tests.lib import (
     check_object_exists_in_s3,
     create_test_image,
@@ -58,6 +93,21 @@ class TestImageRead:
         for image in parsed_response:
             assert image.PK == f"PLANT#{plant.plant_id}"
 
+    def test_pages_through_images_for_plant(self, client_mock_session, mock_db, default_user_plant):
+        plant = default_user_plant
+        for _ in range(5):
+            create_and_insert_image_record(mock_db, plant_id=plant.plant_id)
+
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        first_page = test_client.get(f"/images/plants/{plant.plant_id}", params={"limit": 3})
+        assert len(first_page.json()) == 3
+        cursor = first_page.headers[NEXT_CURSOR_HEADER]
+
+        second_page = test_client.get(f"/images/plants/{plant.plant_id}", params={"limit": 3, "cursor": cursor})
+        assert second_page.status_code == 200
+        assert len(second_page.json()) == 2
+        assert NEXT_CURSOR_HEADER not in second_page.headers
+
     def test_get_plant_wo_images(self, mock_db, client_mock_session, default_user_plant):
         plant = default_user_plant
 
@@ -65,32 +115,126 @@ class TestImageRead:
         response = test_client.get(f"/images/plants/{plant.plant_id}")
         assert response.status_code == 404
 
-    # TODO: make these tests work with the new async dynamodb and s3 client
-    # def test_get_most_recent_image_for_plant(self, mock_db, client_mock_session, default_user_plant):
-    #     plant = default_user_plant
-    #     timestamps = [
-    #         datetime(2020, 1, 1, 12, 0, 0),
-    #         datetime(2020, 1, 1, 12, 0, 2),
-    #         datetime(2020, 1, 1, 12, 0, 1),
-    #     ]
-    #     for timestamp in timestamps:
-    #         create_and_insert_image_record(mock_db, plant_id=plant.plant_id, timestamp=timestamp)
-    #
-    #     test_client = client_mock_session(DEFAULT_TEST_USER)
-    #     response = test_client.post(f"/images/plants/most_recent", json=[plant.plant_id])
-    #     assert response.status_code == 200
-    #     parsed_response = TypeAdapter(list[ImageItem]).validate_python(response.json())
-    #     assert parsed_response[0].plant_id == plant.plant_id
-    #     assert parsed_response[0].timestamp == timestamps[1]
-    #
-    # def test_get_most_recent_image_for_plant_with_no_images(self, mock_db, client_mock_session, default_user_plant):
-    #     plant = default_user_plant
-    #
-    #     test_client = client_mock_session(DEFAULT_TEST_USER)
-    #     response = test_client.post(f"/images/plants/most_recent", json=[plant.plant_id])
-    #     assert response.status_code == 200
-    #     parsed_response = TypeAdapter(list[ImageItem]).validate_python(response.json())
-    #     assert parsed_response == []
+
+def upload_image_via_api(test_client, plant_id, timestamp: datetime) -> ImageItem:
+    response = test_client.post(
+        f"/images/plants/{plant_id}",
+        data={"timestamp": timestamp.isoformat()},
+        files={"image_file": ("filename", create_test_image(), "image/png")},
+    )
+    assert response.status_code == 200
+    return ImageItem(**response.json())
+
+
+class TestMostRecentImage:
+    def test_get_most_recent_image_for_plant(self, mock_db, fake_s3, client_mock_session, default_user_plant):
+        plant = default_user_plant
+        timestamps = [
+            datetime(2020, 1, 1, 12, 0, 0),
+            datetime(2020, 1, 1, 12, 0, 2),
+            datetime(2020, 1, 1, 12, 0, 1),
+        ]
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        for timestamp in timestamps:
+            upload_image_via_api(test_client, plant.plant_id, timestamp)
+
+        response = test_client.post("/images/plants/most_recent", json=[plant.plant_id])
+        assert response.status_code == 200
+        parsed_response = TypeAdapter(list[ImageItem]).validate_python(response.json())
+        assert parsed_response[0].plant_id == plant.plant_id
+        assert parsed_response[0].timestamp == timestamps[1]
+        assert parsed_response[0].signed_thumbnail_photo_url is not None
+
+    def test_get_most_recent_image_for_plant_with_no_images(self, mock_db, client_mock_session, default_user_plant):
+        plant = default_user_plant
+
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        response = test_client.post("/images/plants/most_recent", json=[plant.plant_id])
+        assert response.status_code == 200
+        parsed_response = TypeAdapter(list[ImageItem]).validate_python(response.json())
+        assert parsed_response == []
+
+    def test_most_recent_images_keep_request_order(self, mock_db, fake_s3, client_mock_session):
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        plants = create_plants_for_user(mock_db, DEFAULT_TEST_USER, 3)
+        for plant in plants:
+            upload_image_via_api(test_client, plant.plant_id, datetime(2020, 1, 1))
+
+        plant_ids = [plant.plant_id for plant in reversed(plants)]
+        response = test_client.post("/images/plants/most_recent", json=plant_ids)
+        parsed_response = TypeAdapter(list[ImageItem]).validate_python(response.json())
+        assert [image.plant_id for image in parsed_response] == plant_ids
+
+    def test_deleting_latest_image_falls_back_to_next_newest(
+        self, mock_db, fake_s3, client_mock_session, default_user_plant
+    ):
+        plant = default_user_plant
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        older = upload_image_via_api(test_client, plant.plant_id, datetime(2020, 1, 1))
+        newer = upload_image_via_api(test_client, plant.plant_id, datetime(2021, 1, 1))
+
+        test_client.delete(f"/images/{newer.image_id}")
+        response = test_client.post("/images/plants/most_recent", json=[plant.plant_id])
+        assert response.json()[0]["image_id"] == older.image_id
+
+        test_client.delete(f"/images/{older.image_id}")
+        response = test_client.post("/images/plants/most_recent", json=[plant.plant_id])
+        assert response.json() == []
+
+    def test_updating_timestamp_moves_latest_image(self, mock_db, fake_s3, client_mock_session, default_user_plant):
+        plant = default_user_plant
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        older = upload_image_via_api(test_client, plant.plant_id, datetime(2020, 1, 1))
+        upload_image_via_api(test_client, plant.plant_id, datetime(2021, 1, 1))
+
+        older.timestamp = datetime(2022, 1, 1)
+        test_client.patch(f"/images/{older.image_id}", json=older.dynamodb_dump())
+        response = test_client.post("/images/plants/most_recent", json=[plant.plant_id])
+        assert response.json()[0]["image_id"] == older.image_id
+
+    def test_cant_get_most_recent_images_of_private_user(
+        self, mock_db, client_mock_session, default_private_user_in_db, default_user_plant
+    ):
+        response = client_mock_session(OTHER_TEST_USER).post(
+            f"/images/plants/most_recent?user_id={DEFAULT_TEST_USER.google_id}", json=[default_user_plant.plant_id]
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_owner_is_found_from_the_plants(
+        self, mock_db, fake_s3, client_mock_session, default_enabled_user_in_db, default_user_plant
+    ):
+        upload_image_via_api(client_mock_session(DEFAULT_TEST_USER), default_user_plant.plant_id, datetime(2020, 1, 1))
+        other_users_plant = create_plants_for_user(mock_db, OTHER_TEST_USER, 1)[0]
+        upload_image_via_api(client_mock_session(OTHER_TEST_USER), other_users_plant.plant_id, datetime(2020, 1, 1))
+
+        # Viewing another (public) user's plant grid, which doesn't send user_id
+        plant_ids = [default_user_plant.plant_id, str(uuid.uuid4()), other_users_plant.plant_id]
+        response = client_mock_session(OTHER_TEST_USER).post("/images/plants/most_recent", json=plant_ids)
+        assert [image["plant_id"] for image in response.json()] == [
+            default_user_plant.plant_id,
+            other_users_plant.plant_id,
+        ]
+
+    def test_cant_get_most_recent_images_of_private_users_plants(
+        self, mock_db, client_mock_session, default_private_user_in_db, default_user_plant
+    ):
+        response = client_mock_session(OTHER_TEST_USER).post(
+            "/images/plants/most_recent", json=[default_user_plant.plant_id]
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_backfilled_latest_image_pointers(
+        self, mock_db, fake_s3, client_mock_session, default_enabled_user_in_db, default_user_plant
+    ):
+        # Recorded before plants had a latest image pointer
+        create_and_insert_image_record(mock_db, default_user_plant.plant_id, datetime(2020, 1, 1))
+        newest = create_and_insert_image_record(mock_db, default_user_plant.plant_id, datetime(2021, 1, 1))
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        assert test_client.post("/images/plants/most_recent", json=[default_user_plant.plant_id]).json() == []
+
+        backfill_latest_image_pointers()
+        response = test_client.post("/images/plants/most_recent", json=[default_user_plant.plant_id])
+        assert [image["image_id"] for image in response.json()] == [newest.image_id]
 
 
 class TestImageUpload:
@@ -174,6 +318,273 @@ class TestImageUpload:
         assert parsed_response.dynamodb_dump()["timestamp"] == timestamp
 
 
+class TestDerivativePipeline:
+    def test_upload_creates_all_derivatives(self, client_mock_session, mock_db, fake_s3, default_user_plant):
+        image = upload_image_via_api(client_mock_session(), default_user_plant.plant_id, datetime(2024, 1, 1))
+
+        assert image.processing_status == ImageProcessingStatus.READY
+        assert image.thumbnail_photo_s3_url != image.full_photo_s3_url
+        for s3_path in [
+            image.thumbnail_photo_s3_url,
+            image.small_thumbnail_photo_s3_url,
+            image.webp_thumbnail_photo_s3_url,
+        ]:
+            assert check_object_exists_in_s3(fake_s3, S3_BUCKET_NAME, s3_path) is True
+
+    def test_latest_image_pointer_gets_processed_thumbnail(
+        self, client_mock_session, mock_db, fake_s3, default_user_plant
+    ):
+        test_client = client_mock_session()
+        image = upload_image_via_api(test_client, default_user_plant.plant_id, datetime(2024, 1, 1))
+
+        response = test_client.post("/images/plants/most_recent", json=[default_user_plant.plant_id])
+        assert response.json()[0]["thumbnail_photo_s3_url"] == image.thumbnail_photo_s3_url
+
+    def test_unreadable_upload_is_marked_failed(self, client_mock_session, mock_db, fake_s3, default_user_plant):
+        response = client_mock_session().post(
+            f"/images/plants/{default_user_plant.plant_id}",
+            files={"image_file": ("filename", b"not an image", "image/png")},
+        )
+        assert response.status_code == 200
+        image = ImageItem(**response.json())
+        assert image.processing_status == ImageProcessingStatus.FAILED
+        # The original is kept so it can be reprocessed
+        assert check_object_exists_in_s3(fake_s3, S3_BUCKET_NAME, image.full_photo_s3_url) is True
+
+    def test_failed_derivative_upload_is_marked_failed(
+        self, client_mock_session, mock_db, fake_s3, default_user_plant, monkeypatch
+    ):
+        def failing_upload(content, s3_path, content_type=None):
+            raise ConnectionError("S3 is down")
+
+        monkeypatch.setattr("plant_api.routers.images.upload_bytes_to_s3", failing_upload)
+        image = upload_image_via_api(client_mock_session(), default_user_plant.plant_id, datetime(2024, 1, 1))
+        assert image.processing_status == ImageProcessingStatus.FAILED
+
+    def test_local_queue_processes_in_background(self, client_mock_session, mock_db, fake_s3, default_user_plant):
+        queue = LocalJobQueue(generate_image_derivatives)
+        set_image_job_queue(queue)
+        try:
+            pending_image = upload_image_via_api(
+                client_mock_session(), default_user_plant.plant_id, datetime(2024, 1, 1)
+            )
+            assert pending_image.processing_status == ImageProcessingStatus.PENDING
+            # Until processing finishes the thumbnail falls back to the original
+            assert pending_image.thumbnail_photo_s3_url == pending_image.full_photo_s3_url
+
+            queue.join()
+        finally:
+            queue.shutdown()
+            set_image_job_queue(None)
+
+        image_in_db = mock_db.dynamodb.Table(mock_db.table_name).get_item(
+            Key=make_image_query_key(default_user_plant.plant_id, uuid.UUID(pending_image.image_id))
+        )["Item"]
+        assert ImageItem(**image_in_db).processing_status == ImageProcessingStatus.READY
+
+    def test_delete_removes_derivatives(self, client_mock_session, mock_db, fake_s3, default_user_plant):
+        test_client = client_mock_session()
+        image = upload_image_via_api(test_client, default_user_plant.plant_id, datetime(2024, 1, 1))
+
+        test_client.delete(f"/images/{image.image_id}")
+        for s3_path in [image.small_thumbnail_photo_s3_url, image.webp_thumbnail_photo_s3_url]:
+            assert check_object_exists_in_s3(fake_s3, S3_BUCKET_NAME, s3_path) is False
+
+
+class TestStreamingUpload:
+    CHUNK_SIZE = 5 * 1024 * 1024
+
+    def test_small_file_is_single_put(self, fake_s3):
+        content = create_test_image().read()
+        upload = stream_upload_to_s3(io.BytesIO(content), S3_BUCKET_NAME, "small.png", chunk_size=self.CHUNK_SIZE)
+
+        assert (upload.parts, upload.size) == (1, len(content))
+        assert upload.sha256 == hashlib.sha256(content).hexdigest()
+        assert fake_s3.get_object(Bucket=S3_BUCKET_NAME, Key="small.png")["Body"].read() == content
+
+    def test_large_file_is_multipart_with_bounded_buffer(self, fake_s3):
+        content = os.urandom(2 * self.CHUNK_SIZE + 1024)
+        upload = stream_upload_to_s3(io.BytesIO(content), S3_BUCKET_NAME, "large.jpg", chunk_size=self.CHUNK_SIZE)
+
+        assert upload.parts == 3
+        assert upload.peak_buffered_bytes <= self.CHUNK_SIZE
+        assert upload.sha256 == hashlib.sha256(content).hexdigest()
+        assert fake_s3.get_object(Bucket=S3_BUCKET_NAME, Key="large.jpg")["Body"].read() == content
+
+    def test_create_image_records_hash(self, client_mock_session, mock_db, fake_s3, default_user_plant):
+        content = create_test_image().read()
+        image = upload_image_via_api(client_mock_session(), default_user_plant.plant_id, datetime(2024, 1, 1))
+        assert image.original_sha256 == hashlib.sha256(content).hexdigest()
+
+
+def make_s3_event(*s3_keys: str) -> dict:
+    return {
+        "Records": [
+            {"eventSource": "aws:s3", "s3": {"bucket": {"name": S3_BUCKET_NAME}, "object": {"key": s3_key}}}
+            for s3_key in s3_keys
+        ]
+    }
+
+
+class TestDirectUpload:
+    def get_ticket(self, test_client, plant_id) -> ImageUploadTicket:
+        response = test_client.post(f"/images/plants/{plant_id}/uploads")
+        assert response.status_code == 200
+        return ImageUploadTicket(**response.json())
+
+    def upload_with_ticket(self, fake_s3, ticket: ImageUploadTicket) -> None:
+        """Stands in for the browser's POST to S3, which stores the ticket's x-amz-meta-* fields as metadata"""
+        metadata = {
+            name.removeprefix("x-amz-meta-"): value
+            for name, value in ticket.fields.items()
+            if name.startswith("x-amz-meta-")
+        }
+        fake_s3.put_object(Bucket=S3_BUCKET_NAME, Key=ticket.s3_key, Body=create_test_image().read(), Metadata=metadata)
+
+    def test_ticket_is_presigned_post_for_original(self, client_mock_session, mock_db, fake_s3, default_user_plant):
+        ticket = self.get_ticket(client_mock_session(), default_user_plant.plant_id)
+
+        assert ticket.s3_key == f"new_images/{default_user_plant.plant_id}/{ticket.image_id}_original.jpg"
+        assert ticket.fields["key"] == ticket.s3_key
+        assert ticket.fields["x-amz-meta-upload-source"] == "presigned-post"
+        assert "policy" in ticket.fields
+
+    def test_no_ticket_for_other_users_plant(self, client_mock_session, mock_db, fake_s3, default_user_plant):
+        response = client_mock_session(OTHER_TEST_USER).post(f"/images/plants/{default_user_plant.plant_id}/uploads")
+        assert response.status_code == 404
+
+    def test_complete_records_and_processes_image(
+        self, client_mock_session, mock_db, fake_s3, default_enabled_user_in_db, default_user_plant
+    ):
+        test_client = client_mock_session()
+        ticket = self.get_ticket(test_client, default_user_plant.plant_id)
+        self.upload_with_ticket(fake_s3, ticket)
+
+        complete_url = f"/images/plants/{default_user_plant.plant_id}/uploads/{ticket.image_id}/complete"
+        response = test_client.post(complete_url, json={"timestamp": "2024-01-01T00:00:00"})
+        assert response.status_code == 200
+        image = ImageItem(**response.json())
+        assert image.image_id == ticket.image_id
+        assert image.processing_status == ImageProcessingStatus.READY
+        assert image.timestamp == datetime(2024, 1, 1)
+
+        # Completing twice doesn't double count
+        assert test_client.post(complete_url).status_code == 200
+        assert get_user_by_google_id(DEFAULT_TEST_USER.google_id).n_images == 1
+
+    def test_complete_without_upload_is_404(self, client_mock_session, mock_db, fake_s3, default_user_plant):
+        response = client_mock_session().post(
+            f"/images/plants/{default_user_plant.plant_id}/uploads/{uuid.uuid4()}/complete"
+        )
+        assert response.status_code == 404
+
+    def test_s3_event_records_upload(
+        self, client_mock_session, mock_db, fake_s3, default_enabled_user_in_db, default_user_plant
+    ):
+        ticket = self.get_ticket(client_mock_session(), default_user_plant.plant_id)
+        self.upload_with_ticket(fake_s3, ticket)
+
+        images = handle_s3_upload_event(make_s3_event(ticket.s3_key))
+        assert [image.image_id for image in images] == [ticket.image_id]
+        assert images[0].processing_status == ImageProcessingStatus.READY
+
+        # Derivatives written by processing, and repeats of the same upload, are ignored
+        assert handle_s3_upload_event(make_s3_event(images[0].thumbnail_photo_s3_url)) == []
+        handle_s3_upload_event(make_s3_event(ticket.s3_key))
+        assert get_user_by_google_id(DEFAULT_TEST_USER.google_id).n_images == 1
+
+    def test_s3_event_ignores_api_uploads(
+        self, client_mock_session, mock_db, fake_s3, default_enabled_user_in_db, default_user_plant
+    ):
+        # The event for an original uploaded through the API can arrive before the API records it
+        image_id = uuid.uuid4()
+        s3_key = f"new_images/{default_user_plant.plant_id}/{image_id}_original.jpg"
+        fake_s3.put_object(Bucket=S3_BUCKET_NAME, Key=s3_key, Body=create_test_image().read())
+        assert handle_s3_upload_event(make_s3_event(s3_key)) == []
+        assert get_user_by_google_id(DEFAULT_TEST_USER.google_id).n_images == 0
+
+    def test_completing_after_s3_event_keeps_client_timestamp(
+        self, client_mock_session, mock_db, fake_s3, default_enabled_user_in_db, default_user_plant
+    ):
+        test_client = client_mock_session()
+        ticket = self.get_ticket(test_client, default_user_plant.plant_id)
+        self.upload_with_ticket(fake_s3, ticket)
+        handle_s3_upload_event(make_s3_event(ticket.s3_key))
+
+        complete_url = f"/images/plants/{default_user_plant.plant_id}/uploads/{ticket.image_id}/complete"
+        image = ImageItem(**test_client.post(complete_url, json={"timestamp": "2020-01-01T00:00:00"}).json())
+        assert image.timestamp == datetime(2020, 1, 1)
+        assert image.processing_status == ImageProcessingStatus.READY
+        assert get_user_by_google_id(DEFAULT_TEST_USER.google_id).n_images == 1
+        image_in_db = mock_db.dynamodb.Table(mock_db.table_name).get_item(
+            Key=make_image_query_key(default_user_plant.plant_id, ticket.image_id)
+        )["Item"]
+        assert image_in_db["timestamp"] == "2020-01-01T00:00:00"
+
+
+class TestPresignedUrlCache:
+    def test_urls_are_reused_across_requests(self, client_mock_session, mock_db, fake_s3, plant_with_image_record):
+        plant, _ = plant_with_image_record
+        test_client = client_mock_session()
+
+        first = test_client.get(f"/images/plants/{plant.plant_id}").json()
+        second = test_client.get(f"/images/plants/{plant.plant_id}").json()
+        assert first[0]["signed_full_photo_url"] == second[0]["signed_full_photo_url"]
+        assert first[0]["signed_thumbnail_photo_url"] == second[0]["signed_thumbnail_photo_url"]
+        assert PRESIGNED_URL_CACHE.stats().hits == 2
+
+    def test_cache_is_per_key(self, fake_s3):
+        assert create_presigned_url(S3_BUCKET_NAME, "a.jpg") != create_presigned_url(S3_BUCKET_NAME, "b.jpg")
+
+    def test_reuse_windows_are_aligned(self):
+        # With a 24h URL reused for half its life, every window ends on a 12h boundary
+        assert get_presigned_url_cache_ttl(86400, now=0) == 43200
+        assert get_presigned_url_cache_ttl(86400, now=43200 - 1) == 1
+        assert get_presigned_url_cache_ttl(86400, now=43200 + 100) == 43100
+
+    def test_reuse_fraction_is_configurable(self, monkeypatch):
+        monkeypatch.setenv("PRESIGNED_URL_REUSE_FRACTION", "0.25")
+        assert get_presigned_url_cache_ttl(86400, now=0) == 21600
+
+
+class TestBatchPresigner:
+    SIGNING_TIME = 1_700_000_000
+
+    def sign_with_botocore(self, monkeypatch, object_name: str) -> str:
+        s3_client = get_s3_client()
+        region = s3_client.meta.region_name
+        monkeypatch.setattr(
+            botocore.auth, "get_current_datetime", lambda: datetime.utcfromtimestamp(self.SIGNING_TIME)
+        )
+        # botocore's S3 serializer quotes the key into the path before signing
+        path = quote(object_name, safe="/~")
+        request = AWSRequest(method="GET", url=f"https://{S3_BUCKET_NAME}.s3.{region}.amazonaws.com/{path}")
+        credentials = boto3.Session().get_credentials()
+        assert credentials is not None
+        signer = botocore.auth.S3SigV4QueryAuth(credentials.get_frozen_credentials(), "s3", region, expires=86400)
+        signer.add_auth(request)
+        assert request.url is not None
+        return request.url
+
+    def test_signature_matches_botocore(self, fake_s3, monkeypatch):
+        object_names = ["new_images/plant/image_thumb.jpg", "odd name+chars/é.jpg"]
+        urls = presign_get_urls(S3_BUCKET_NAME, object_names, signing_time=self.SIGNING_TIME)
+
+        for object_name in object_names:
+            expected_signature = self.sign_with_botocore(monkeypatch, object_name).split("X-Amz-Signature=")[1]
+            assert urls[object_name].split("X-Amz-Signature=")[1] == expected_signature
+
+    def test_urls_identical_within_window(self, fake_s3):
+        first = presign_get_urls(S3_BUCKET_NAME, ["a.jpg"])
+        PRESIGNED_URL_CACHE.clear()
+        assert presign_get_urls(S3_BUCKET_NAME, ["a.jpg"]) == first
+
+    def test_no_credentials(self, fake_s3, monkeypatch):
+        monkeypatch.setattr("plant_api.utils.s3.get_aws_credentials", lambda: None)
+        with pytest.raises(NoCredentialsError):
+            presign_get_urls(S3_BUCKET_NAME, ["a.jpg"])
+
+
 class TestImageDelete:
     def test_delete_image_from_db(self, mock_db, client_mock_session, fake_s3, plant_with_image_record):
         plant, image = plant_with_image_record
@@ -241,14 +652,148 @@ class TestImageUpdate:
         assert response.status_code == status.HTTP_403_FORBIDDEN
 
 
+class TestImageOwner:
+    def test_upload_records_owner(self, client_mock_session, mock_db, fake_s3, default_user_plant):
+        plant = default_user_plant
+        response = client_mock_session(DEFAULT_TEST_USER).post(
+            f"/images/plants/{plant.plant_id}",
+            files={"image_file": ("filename", create_test_image(), "image/png")},
+        )
+        image = ImageItem(**response.json())
+        assert image.owner_user_id == DEFAULT_TEST_USER.google_id
+
+        table = mock_db.dynamodb.Table(mock_db.table_name)
+        owner_item = table.get_item(Key=make_image_owner_key(uuid.UUID(image.image_id)))["Item"]
+        assert owner_item["owner_user_id"] == DEFAULT_TEST_USER.google_id
+        assert owner_item["plant_id"] == plant.plant_id
+
+    def test_delete_removes_owner_item(self, mock_db, client_mock_session, fake_s3, plant_with_image_record):
+        _, image = plant_with_image_record
+        table = mock_db.dynamodb.Table(mock_db.table_name)
+        assert "Item" in table.get_item(Key=make_image_owner_key(uuid.UUID(image.image_id)))
+
+        response = client_mock_session(DEFAULT_TEST_USER).delete(f"/images/{image.image_id}")
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert "Item" not in table.get_item(Key=make_image_owner_key(uuid.UUID(image.image_id)))
+
+    def test_s3_failure_keeps_image_items(
+        self, mock_db, client_mock_session, fake_s3, plant_with_image_in_s3, monkeypatch
+    ):
+        _, image = plant_with_image_in_s3
+
+        def fail_s3_delete(image):
+            raise ClientError({"Error": {"Code": "InternalError"}}, "DeleteObject")
+
+        monkeypatch.setattr("plant_api.routers.images.delete_image_from_s3", fail_s3_delete)
+        with pytest.raises(ClientError):
+            client_mock_session(DEFAULT_TEST_USER).delete(f"/images/{image.image_id}")
+
+        # Still there to find the S3 objects by when the delete is retried
+        table = mock_db.dynamodb.Table(mock_db.table_name)
+        assert "Item" in table.get_item(Key={"PK": image.PK, "SK": image.SK})
+        assert "Item" in table.get_item(Key=make_image_owner_key(uuid.UUID(image.image_id)))
+
+    def test_update_cant_change_owner(self, mock_db, client_mock_session, plant_with_image_record):
+        _, image = plant_with_image_record
+
+        response = client_mock_session(DEFAULT_TEST_USER).patch(
+            f"/images/{image.image_id}", json={**image.dynamodb_dump(), "owner_user_id": OTHER_TEST_USER.google_id}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["owner_user_id"] == DEFAULT_TEST_USER.google_id
+
+    def test_image_without_owner_item(self, mock_db, client_mock_session, fake_s3, default_user_plant):
+        # Recorded before images had an owner
+        image = create_and_insert_image_record(mock_db, plant_id=default_user_plant.plant_id)
+
+        response = client_mock_session(OTHER_TEST_USER).delete(f"/images/{image.image_id}")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        response = client_mock_session(DEFAULT_TEST_USER).delete(f"/images/{image.image_id}")
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    def test_backfill_image_owner_items(self, mock_db, default_enabled_user_in_db, default_user_plant):
+        image = create_and_insert_image_record(mock_db, plant_id=default_user_plant.plant_id)
+        table = mock_db.dynamodb.Table(mock_db.table_name)
+        legacy_owner_key = {"PK": f"IMAGE#{image.image_id}", "SK": "OWNER"}
+        table.put_item(Item={**legacy_owner_key, "plant_id": image.plant_id, "owner_user_id": image.owner_user_id})
+
+        backfill_image_owner_items()
+
+        image_in_db = ImageItem(**table.get_item(Key={"PK": image.PK, "SK": image.SK})["Item"])
+        assert image_in_db.owner_user_id == DEFAULT_TEST_USER.google_id
+        owner_item = table.get_item(Key=make_image_owner_key(uuid.UUID(image.image_id)))["Item"]
+        assert owner_item["owner_user_id"] == DEFAULT_TEST_USER.google_id
+        assert owner_item["plant_id"] == default_user_plant.plant_id
+        assert owner_item["SK"] == f"OWNER#{image.image_id}"
+        assert "Item" not in table.get_item(Key=legacy_owner_key)
+
+
 class TestUtils:
     def test_set_orientation_from_exif(self):
         # Open the image, apply EXIF orientation, and save to a temporary file
         with img.open(TEST_FIXTURE_DIR + "photo_w_portrait_exif.jpeg") as image:
-            reoriented_img = _orient_image(image)
+            reoriented_img = orient_image(image)
             with tempfile.NamedTemporaryFile(suffix=".jpeg", mode="w+b", delete=False) as tmp_file:
                 reoriented_img.save(tmp_file)
 
         with img.open(tmp_file.name) as saved_img:
             # Add assertions based on the expected orientation
             assert saved_img.width < saved_img.height  # Example assertion
+
+
+_in_flight = 0
+_max_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _track_concurrency() -> None:
+    global _in_flight, _max_in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+        _max_in_flight = max(_max_in_flight, _in_flight)
+    time.sleep(0.02)
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+def _fail() -> None:
+    raise ValueError("bad image")
+
+
+class TestImageWorker:
+    def test_renders_in_process_pool(self):
+        worker = ImageWorker(processes=1)
+        try:
+            derivatives = worker.run(render_derivatives, create_test_image((600, 300)).read())
+        finally:
+            worker.shutdown()
+
+        assert set(derivatives) == {ImageSuffixes.THUMB, ImageSuffixes.SMALL_THUMB, ImageSuffixes.THUMB_WEBP}
+        assert worker.stats().completed == 1
+
+    def test_caps_concurrency(self):
+        worker = ImageWorker(processes=0, max_concurrency=2)
+        threads = [threading.Thread(target=worker.run, args=(_track_concurrency,)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        worker.shutdown()
+
+        assert _max_in_flight <= 2
+        stats = worker.stats()
+        assert (stats.queued, stats.running, stats.completed) == (0, 0, 6)
+
+    def test_run_async_and_failure_metrics(self):
+        worker = ImageWorker(processes=0)
+
+        async def run_jobs():
+            await worker.run_async(_track_concurrency)
+            try:
+                await worker.run_async(_fail)
+            except ValueError:
+                pass
+
+        asyncio.run(run_jobs())
+        worker.shutdown()
+        assert (worker.stats().completed, worker.stats().failed) == (1, 1)
@@ -0,0 +1,111 @@
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+from plant_api.utils.ingestion import IngestionPipeline, RetryPolicy, call_with_retries
+
+NO_WAIT = RetryPolicy(attempts=3, base_delay_sec=0)
+
+
+def make_pipeline(tmp_path, download, upload, **kwargs) -> IngestionPipeline:
+    return IngestionPipeline(
+        key=str,
+        download=download,
+        upload=upload,
+        checkpoint_path=str(tmp_path / "checkpoint.txt"),
+        retry_policy=NO_WAIT,
+        **kwargs,
+    )
+
+
+class TestIngestionPipeline:
+    def test_uploads_every_item_and_checkpoints(self, tmp_path):
+        uploaded = {}
+        pipeline = make_pipeline(tmp_path, download=lambda item: item * 10, upload=uploaded.__setitem__)
+
+        result = asyncio.run(pipeline.run(range(50)))
+        assert (result.n_done, result.n_skipped, result.failed) == (50, 0, {})
+        assert uploaded == {item: item * 10 for item in range(50)}
+        assert sorted((tmp_path / "checkpoint.txt").read_text().split()) == sorted(str(item) for item in range(50))
+
+    def test_rerun_skips_checkpointed_items(self, tmp_path):
+        asyncio.run(make_pipeline(tmp_path, download=lambda item: item, upload=lambda item, data: None).run(range(5)))
+
+        uploaded = []
+        pipeline = make_pipeline(tmp_path, download=lambda item: item, upload=lambda item, data: uploaded.append(item))
+        result = asyncio.run(pipeline.run(range(8)))
+        assert (result.n_done, result.n_skipped) == (3, 5)
+        assert sorted(uploaded) == [5, 6, 7]
+
+    def test_retries_flaky_download(self, tmp_path):
+        n_calls = {item: 0 for item in range(4)}
+
+        def flaky_download(item):
+            n_calls[item] += 1
+            if n_calls[item] < NO_WAIT.attempts:
+                raise ConnectionError("dropped")
+            return item
+
+        pipeline = make_pipeline(tmp_path, download=flaky_download, upload=lambda item, data: None)
+        result = asyncio.run(pipeline.run(range(4)))
+        assert result.n_done == 4
+        assert set(n_calls.values()) == {NO_WAIT.attempts}
+
+    def test_failed_items_are_not_checkpointed(self, tmp_path):
+        def upload(item, data):
+            if item == 3:
+                raise ValueError("rejected")
+
+        result = asyncio.run(make_pipeline(tmp_path, download=lambda item: item, upload=upload).run(range(5)))
+        assert result.n_done == 4
+        assert result.failed == {"3": "upload: rejected"}
+        assert "3" not in (tmp_path / "checkpoint.txt").read_text().split()
+
+    def test_downloads_wait_for_slow_uploads(self, tmp_path):
+        lock = threading.Lock()
+        n_buffered = max_buffered = 0
+
+        def download(item):
+            nonlocal n_buffered, max_buffered
+            with lock:
+                n_buffered += 1
+                max_buffered = max(max_buffered, n_buffered)
+            return item
+
+        def slow_upload(item, data):
+            nonlocal n_buffered
+            time.sleep(0.005)
+            with lock:
+                n_buffered -= 1
+
+        pipeline = make_pipeline(tmp_path, download, slow_upload, n_downloads=4, n_uploads=2, max_buffered=3)
+        assert asyncio.run(pipeline.run(range(60))).n_done == 60
+        # Downloaded photos are either queued, being uploaded or held by a downloader waiting for room in the queue
+        assert max_buffered <= 3 + 2 + 4
+
+
+class TestRetries:
+    def test_delays_are_jittered_and_capped(self):
+        policy = RetryPolicy(attempts=10, base_delay_sec=1, max_delay_sec=5)
+        rng = random.Random(0)
+        delays = [policy.get_delay(retry, rng) for retry in range(10) for _ in range(20)]
+        assert all(0 <= delay <= 5 for delay in delays)
+        assert all(policy.get_delay(0, rng) <= 1 for _ in range(20))
+
+    def test_gives_up_after_attempts(self):
+        delays = []
+
+        async def record_sleep(delay):
+            delays.append(delay)
+
+        def always_fail():
+            raise ConnectionError("down")
+
+        policy = RetryPolicy(attempts=3, base_delay_sec=2)
+        with pytest.raises(ConnectionError):
+            asyncio.run(call_with_retries(always_fail, policy, random.Random(0), sleep=record_sleep))
+        assert len(delays) == 2
+        assert delays[0] <= 2 and delays[1] <= 4
@@ -1,10 +1,20 @@
+from datetime import date
+from typing import Optional
+
 from plant_api.routers.lineages import (
     PlantLineageNode,
     assign_generations_and_source_parents,
     assign_levels_to_generations,
 )
-from tests.lib import plant_record_factory
+from plant_api.schema import PlantItem, PlantUpdate
+from boto3.dynamodb.conditions import Key
+
+from plant_api.utils.db import get_db_table, iterate_items
+from plant_api.utils.lineage import build_lineage_layout, get_stored_lineage_layout
+from plant_api.utils.lineage_graph import PLANT, SINK, LineageGraph
+from tests.lib import DEFAULT_TEST_USER, OTHER_TEST_USER, plant_record_factory
 
+import pytest
 from pydantic import TypeAdapter
 
 
@@ -68,6 +78,78 @@ class TestGenerationAssignment:
         assert child_plant.generation == 1
         assert sink.generation == 2
 
+    def test_sink_generation_follows_its_parents(self):
+        root_plant = PlantLineageNode(id=0, node_type="plant")
+        child_plant = PlantLineageNode(id=1, parents=[root_plant.id], node_type="plant")
+        grandchild_plant = PlantLineageNode(id=2, parents=[child_plant.id], node_type="plant")
+        sink = PlantLineageNode(id="sink", parents=[root_plant.id], node_type="sink")
+
+        assign_generations_and_source_parents([root_plant, child_plant, grandchild_plant, sink])
+        assert sink.generation == 1
+
+    def test_cycle_is_reported(self):
+        source = PlantLineageNode(id="source", node_type="source")
+        root_plant = PlantLineageNode(id=0, parents=[source.id], node_type="plant")
+        plant_1 = PlantLineageNode(id=1, parents=[2], node_type="plant")
+        plant_2 = PlantLineageNode(id=2, parents=[1], node_type="plant")
+        child_plant = PlantLineageNode(id=3, parents=[plant_2.id], node_type="plant")
+
+        diagnostics = assign_generations_and_source_parents([source, root_plant, plant_1, plant_2, child_plant])
+        assert diagnostics.cycles == [[1, 2]]
+        assert root_plant.generation == 1
+        assert {plant_1.generation, plant_2.generation, child_plant.generation} == {1}
+
+    def test_dangling_parent_is_reported(self):
+        source = PlantLineageNode(id="source", node_type="source")
+        root_plant = PlantLineageNode(id=0, parents=[source.id], node_type="plant")
+        orphan = PlantLineageNode(id=1, parents=[404], source="source", node_type="plant")
+        half_orphan = PlantLineageNode(id=2, parents=[root_plant.id, 405], node_type="plant")
+
+        diagnostics = assign_generations_and_source_parents([source, root_plant, orphan, half_orphan])
+        assert [(dangling.node_id, dangling.parent_id) for dangling in diagnostics.dangling_parents] == [
+            (1, 404),
+            (2, 405),
+        ]
+        assert diagnostics.cycles == []
+        assert orphan.parents == [source.id] and orphan.generation == 1
+        assert half_orphan.parents == [root_plant.id] and half_orphan.generation == 2
+
+    def test_deep_chain(self):
+        depth = 5000
+        # Newest first, so each plant's whole ancestry is unresolved when it's reached
+        nodes = [PlantLineageNode(id=i, parents=[i - 1], node_type="plant") for i in range(depth - 1, 0, -1)] + [
+            PlantLineageNode(id=0, node_type="plant")
+        ]
+
+        assign_generations_and_source_parents(nodes)
+        assert nodes[0].generation == depth - 1
+
+
+class TestLineageGraph:
+    def test_build_and_layout(self):
+        graph = LineageGraph.build(
+            [
+                (1, PLANT, None, "nursery", None),
+                (2, PLANT, [1, 404], "nursery", None),
+                (3, PLANT, [1, 2], "nursery", None),
+                ("compost", SINK, [3], None, None),
+            ]
+        )
+        # The nursery is added as node 4 and is the first plant's parent
+        assert graph.ids == [1, 2, 3, "compost", "nursery"]
+        assert [graph.parent_ids(index) for index in range(len(graph))] == [["nursery"], [1], [1, 2], [3], []]
+        assert [(dangling.node_id, dangling.parent_id) for dangling in graph.diagnostics.dangling_parents] == [(2, 404)]
+
+        graph.assign_generations()
+        assert list(graph.generations) == [1, 2, 3, 4, 0]
+        assert [[graph.ids[index] for index in level] for level in graph.levels()] == [
+            ["nursery"],
+            [1],
+            [2],
+            [3],
+            ["compost"],
+        ]
+
 
 class TestAssignLevels:
     def test_assign_levels(self):
@@ -105,3 +187,279 @@ class TestPlantLineages:
         assert parsed_response[0][0].parents is None
         assert parsed_response[1][0].parents == [root_plant.source]
         assert parsed_response[2][0].parents == [root_plant.human_id]
+
+
+class TestStoredLineageLayout:
+    def get_lineage(self, test_client, **headers):
+        return test_client.get(f"/lineages/user/{DEFAULT_TEST_USER.google_id}", headers=headers)
+
+    def create_plant(self, test_client, **kwargs) -> PlantItem:
+        plant = plant_record_factory(sink=None, sink_date=None, **kwargs)
+        return PlantItem(**test_client.post("/plants/create", json=plant.dynamodb_dump()).json())
+
+    def test_repeat_view_is_304_with_etag(self, mock_db, client_mock_session, default_enabled_user_in_db):
+        test_client = client_mock_session()
+        self.create_plant(test_client, human_id=1, parent_id=None)
+
+        first = self.get_lineage(test_client)
+        assert first.status_code == 200
+        assert self.get_lineage(test_client, **{"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    def test_repeat_view_reads_only_the_layout_items(
+        self, mock_db, client_mock_session, default_enabled_user_in_db, monkeypatch
+    ):
+        test_client = client_mock_session()
+        self.create_plant(test_client, human_id=1, parent_id=None)
+        first = self.get_lineage(test_client).json()
+
+        table = get_db_table()
+        queries = []
+        query = table.query
+
+        def recording_query(**kwargs):
+            # The SK prefix of the PK = ... AND begins_with(SK, ...) key condition
+            queries.append(kwargs["KeyConditionExpression"].get_expression()["values"][1].get_expression()["values"][1])
+            return query(**kwargs)
+
+        table.query = recording_query
+        monkeypatch.setattr("plant_api.utils.lineage.get_db_table", lambda: table)
+        assert self.get_lineage(test_client).json() == first
+        # One query of the lineage items, and none of the user's plants
+        assert queries == ["LINEAGE#"]
+
+    def test_plant_writes_update_layout(self, mock_db, client_mock_session, default_enabled_user_in_db):
+        test_client = client_mock_session()
+        root = self.create_plant(test_client, human_id=1, parent_id=None)
+        first = self.get_lineage(test_client)
+
+        # Created after the layout was stored, so it must be applied to the stored layout
+        child = self.create_plant(test_client, human_id=2, parent_id=[root.human_id])
+        levels = self.get_lineage(test_client).json()
+        assert [[node["id"] for node in level] for level in levels] == [[root.source], [1], [2]]
+
+        moved_child = PlantUpdate(**child.model_dump())
+        moved_child.parent_id = None
+        test_client.patch(f"/plants/{child.plant_id}", json=moved_child.dynamodb_dump())
+        moved = self.get_lineage(test_client)
+        assert moved.headers["ETag"] != first.headers["ETag"]
+        assert len(moved.json()) == 2
+
+        test_client.delete(f"/plants/{child.plant_id}")
+        assert self.get_lineage(test_client).headers["ETag"] == first.headers["ETag"]
+
+    def test_non_lineage_update_keeps_layout(self, mock_db, client_mock_session, default_enabled_user_in_db):
+        test_client = client_mock_session()
+        plant = self.create_plant(test_client, human_id=1, parent_id=None)
+        self.get_lineage(test_client)
+
+        layout = get_stored_lineage_layout(DEFAULT_TEST_USER.google_id)
+        assert layout is not None
+
+        updated_plant = PlantUpdate(**plant.model_dump())
+        updated_plant.notes = "watered"
+        test_client.patch(f"/plants/{plant.plant_id}", json=updated_plant.dynamodb_dump())
+        assert get_stored_lineage_layout(DEFAULT_TEST_USER.google_id) == layout
+
+    def test_user_without_plants(self, mock_db, client_mock_session, default_enabled_user_in_db):
+        assert self.get_lineage(client_mock_session()).json() == []
+
+    def test_include_sinks(self, mock_db, client_mock_session, default_enabled_user_in_db):
+        test_client = client_mock_session()
+        root = self.create_plant(test_client, human_id=1, parent_id=None, source="nursery")
+        self.create_plant(test_client, human_id=2, parent_id=[root.human_id])
+        self.create_plant(test_client, human_id=3, parent_id=[2])
+        gifted_root = PlantUpdate(**root.model_dump())
+        gifted_root.sink = "friend"
+        gifted_root.sink_date = date(2024, 5, 1)
+        test_client.patch(f"/plants/{root.plant_id}", json=gifted_root.dynamodb_dump())
+
+        without_sinks = self.get_lineage(test_client)
+        assert [[node["id"] for node in level] for level in without_sinks.json()] == [["nursery"], [1], [2], [3]]
+        with_sinks = test_client.get(f"/lineages/user/{DEFAULT_TEST_USER.google_id}", params={"include_sinks": True})
+        levels = with_sinks.json()
+        # The sink sits right below the plant that went to it rather than below the whole graph
+        assert [[node["id"] for node in level] for level in levels] == [["nursery"], [1], [2, "friend"], [3]]
+        assert levels[2][1] == {
+            "id": "friend",
+            "node_name": "Sk: friend",
+            "node_type": "sink",
+            "generation": 2,
+            "parents": [1],
+        }
+        assert with_sinks.headers["ETag"] != without_sinks.headers["ETag"]
+
+    def test_layout_in_old_format_is_rebuilt(self, mock_db, client_mock_session, default_enabled_user_in_db):
+        test_client = client_mock_session()
+        self.create_plant(test_client, human_id=1, parent_id=None, source="nursery")
+        first = self.get_lineage(test_client).json()
+
+        # Layouts used to be a single item without chunks
+        table = get_db_table()
+        key = {"PK": f"USER#{DEFAULT_TEST_USER.google_id}", "SK": "LINEAGE#layout"}
+        table.put_item(Item={**key, "lineage_version": 1, "levels": b"old"})
+        assert self.get_lineage(test_client).json() == first
+        assert "chunk_refs" in table.get_item(Key=key)["Item"]
+
+    def get_chunk_sks(self) -> set[str]:
+        items = get_db_table().query(
+            KeyConditionExpression=Key("PK").eq(f"USER#{DEFAULT_TEST_USER.google_id}")
+            & Key("SK").begins_with("LINEAGE#layout#")
+        )["Items"]
+        return {item["SK"] for item in items}
+
+    def test_plant_write_stores_only_changed_chunks(
+        self, mock_db, client_mock_session, default_enabled_user_in_db, monkeypatch
+    ):
+        monkeypatch.setattr("plant_api.utils.lineage.LINEAGE_PLANT_BUCKET_SIZE", 4)
+        monkeypatch.setattr("plant_api.utils.lineage.LINEAGE_SLICE_NODES", 2)
+        test_client = client_mock_session()
+        root = self.create_plant(test_client, human_id=1, parent_id=None, source="nursery")
+        for human_id in range(2, 30):
+            self.create_plant(test_client, human_id=human_id, parent_id=[root.human_id])
+        assert [len(level) for level in self.get_lineage(test_client).json()] == [1, 1, 28]
+        chunk_sks = self.get_chunk_sks()
+
+        self.create_plant(test_client, human_id=30, parent_id=[2])
+        assert [len(level) for level in self.get_lineage(test_client).json()] == [1, 1, 28, 1]
+        assert get_stored_lineage_layout(DEFAULT_TEST_USER.google_id) is not None
+        new_chunk_sks = self.get_chunk_sks()
+        # Just its block of plants and the new level (the same with and without sinks) are stored; the rest is kept
+        assert len(chunk_sks) > 20
+        assert len(new_chunk_sks - chunk_sks) == 2
+        assert len(chunk_sks - new_chunk_sks) == 1
+
+    def test_layout_dropped_if_lineage_change_isnt_counted(
+        self, mock_db, client_mock_session, default_enabled_user_in_db, monkeypatch
+    ):
+        monkeypatch.setattr("plant_api.utils.lineage.LINEAGE_SLICE_NODES", 1)
+        test_client = client_mock_session()
+        for human_id in range(1, 4):
+            self.create_plant(test_client, human_id=human_id, parent_id=None)
+        self.get_lineage(test_client)
+        assert self.get_chunk_sks()
+
+        def fail_bump(user_id):
+            raise ValueError("Throttled")
+
+        monkeypatch.setattr("plant_api.utils.lineage.bump_lineage_version", fail_bump)
+        self.create_plant(test_client, human_id=4, parent_id=None)
+        monkeypatch.undo()
+
+        # Chunks and all, rather than leaving a layout that's missing the plant
+        assert get_stored_lineage_layout(DEFAULT_TEST_USER.google_id) is None
+        assert not self.get_chunk_sks()
+        assert {node["id"] for node in self.get_lineage(test_client).json()[1]} == {1, 2, 3, 4}
+
+    def test_build_racing_a_create_isnt_stored(
+        self, mock_db, client_mock_session, default_enabled_user_in_db, monkeypatch
+    ):
+        test_client = client_mock_session()
+        self.create_plant(test_client, human_id=1, parent_id=None)
+
+        def read_plants_then_create(*args, **kwargs):
+            items = list(iterate_items(*args, **kwargs))
+            # Lands after the build read the plants but before it stores its layout
+            self.create_plant(test_client, human_id=2, parent_id=None)
+            return items
+
+        monkeypatch.setattr("plant_api.utils.lineage.iterate_items", read_plants_then_create)
+        assert len(build_lineage_layout(DEFAULT_TEST_USER.google_id).plants) == 1
+        monkeypatch.undo()
+
+        assert get_stored_lineage_layout(DEFAULT_TEST_USER.google_id) is None
+        assert {node["id"] for node in self.get_lineage(test_client).json()[1]} == {1, 2}
+
+    def test_failed_layout_update_doesnt_fail_the_write(
+        self, mock_db, client_mock_session, default_enabled_user_in_db, monkeypatch
+    ):
+        test_client = client_mock_session()
+        self.create_plant(test_client, human_id=1, parent_id=None)
+        self.get_lineage(test_client)
+
+        def fail_store(*args, **kwargs):
+            raise ValueError("Item size has exceeded the maximum allowed size")
+
+        monkeypatch.setattr("plant_api.utils.lineage.store_lineage_layout", fail_store)
+        self.create_plant(test_client, human_id=2, parent_id=None)
+        monkeypatch.undo()
+
+        assert {node["id"] for node in self.get_lineage(test_client).json()[1]} == {1, 2}
+
+    def test_diagnostics(self, mock_db, client_mock_session, default_enabled_user_in_db):
+        test_client = client_mock_session()
+        self.create_plant(test_client, human_id=1, parent_id=[2])
+        self.create_plant(test_client, human_id=2, parent_id=[1])
+        self.create_plant(test_client, human_id=3, parent_id=[404], source="nursery")
+
+        levels = self.get_lineage(test_client).json()
+        assert [node["id"] for node in levels[0]] == ["nursery"]
+        assert {node["id"] for node in levels[1]} == {1, 2, 3}
+
+        response = test_client.get(f"/lineages/user/{DEFAULT_TEST_USER.google_id}/diagnostics")
+        assert response.status_code == 200
+        assert response.json() == {"dangling_parents": [{"node_id": 3, "parent_id": 404}], "cycles": [[1, 2]]}
+
+
+class TestPlantSubgraph:
+    @pytest.fixture
+    def plants(self, mock_db) -> dict[int, PlantItem]:
+        """1 -> 2 -> 3 -> 4, with 5 a sibling of 3 and 6 a child of both 3 and 5"""
+        parents: dict[int, Optional[list[int]]] = {1: None, 2: [1], 3: [2], 4: [3], 5: [2], 6: [3, 5]}
+        plants = {}
+        for human_id, parent_id in parents.items():
+            plants[human_id] = plant_record_factory(
+                human_id=human_id, parent_id=parent_id, source="nursery", sink=None, sink_date=None
+            )
+            mock_db.insert_mock_data(plants[human_id])
+        return plants
+
+    def get_subgraph(self, test_client, plant: PlantItem, **params) -> list[list]:
+        response = test_client.get(f"/lineages/plant/{plant.plant_id}", params=params)
+        assert response.status_code == 200
+        return [[node["id"] for node in level] for level in response.json()]
+
+    def test_direct_neighbours_by_default(self, client_mock_session, default_enabled_user_in_db, plants):
+        assert self.get_subgraph(client_mock_session(), plants[3]) == [[2], [3], [4, 6]]
+
+    def test_depth(self, client_mock_session, default_enabled_user_in_db, plants):
+        test_client = client_mock_session()
+        assert self.get_subgraph(test_client, plants[3], up=5, down=0) == [["nursery"], [1], [2], [3]]
+        assert self.get_subgraph(test_client, plants[1], up=0, down=2) == [["nursery"], [1], [2], [3, 5]]
+        assert self.get_subgraph(test_client, plants[6], up=1, down=1) == [[3, 5], [6]]
+
+    def test_cut_off_ancestor_keeps_source(self, client_mock_session, default_enabled_user_in_db, plants):
+        response = client_mock_session().get(f"/lineages/plant/{plants[3].plant_id}")
+        assert response.json()[0][0] == {
+            "id": 2,
+            "node_name": plants[2].human_name,
+            "plant_id": plants[2].plant_id,
+            "source": "nursery",
+            "source_date": plants[2].source_date.isoformat(),
+            "node_type": "plant",
+            "generation": 0,
+        }
+
+    def test_index_is_reused_until_lineage_changes(
+        self, client_mock_session, default_enabled_user_in_db, plants, monkeypatch
+    ):
+        test_client = client_mock_session()
+        assert self.get_subgraph(test_client, plants[3]) == [[2], [3], [4, 6]]
+
+        def fail_read(user_id):
+            raise AssertionError("The cached index should be used")
+
+        monkeypatch.setattr("plant_api.utils.lineage.get_lineage_layout", fail_read)
+        assert self.get_subgraph(test_client, plants[3]) == [[2], [3], [4, 6]]
+        monkeypatch.undo()
+
+        child = plant_record_factory(human_id=7, parent_id=[3], sink=None, sink_date=None)
+        test_client.post("/plants/create", json=child.dynamodb_dump())
+        assert self.get_subgraph(test_client, plants[3]) == [[2], [3], [4, 6, 7]]
+
+    def test_private_user(self, client_mock_session, default_private_user_in_db, plants):
+        response = client_mock_session(OTHER_TEST_USER).get(f"/lineages/plant/{plants[3].plant_id}")
+        assert response.status_code == 403
+
+    def test_unknown_plant(self, client_mock_session, default_enabled_user_in_db, plants):
+        response = client_mock_session().get("/lineages/plant/00000000-0000-0000-0000-000000000000")
+        assert response.status_code == 404
@@ -1,13 +1,41 @@
 import uuid
+from datetime import datetime, timedelta
 
 import pytest
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
 from pydantic import TypeAdapter
 from fastapi import status
 
-from plant_api.constants import S3_BUCKET_NAME
-from plant_api.routers.plants import PLANT_ROUTE
+from plant_api.constants import NEXT_CURSOR_HEADER, S3_BUCKET_NAME
+from plant_api.routers.plants import (
+    BULK_TRANSACTION_RETRY_POLICY,
+    PLANT_ROUTE,
+    DELETION_PAGE_SIZE,
+    PlantDeletionJob,
+    delete_plant_and_images,
+    resume_stale_plant_deletions,
+    set_plant_deletion_queue,
+)
+from plant_api.utils.jobs import JobQueue
+from plant_api.utils.s3 import get_s3_client
+from tests.conftest import create_and_insert_image_record, create_plants_for_user
 from tests.lib import DEFAULT_TEST_USER, OTHER_TEST_USER, check_object_exists_in_s3, plant_record_factory
 from plant_api.schema import ItemKeys, PlantBase, PlantItem
+from plant_api.utils.db import (
+    backfill_human_id_items,
+    backfill_plant_index_attributes,
+    get_db_table,
+    get_user_by_google_id,
+    make_human_id_key,
+)
+from plant_api.utils.lineage import get_lineage_version, invalidate_lineage_layout
+
+
+def scan_plant_items(mock_db) -> list[dict]:
+    """Every item in the table apart from the users' lineage bookkeeping"""
+    table = mock_db.dynamodb.Table(mock_db.table_name)
+    return table.scan(FilterExpression=~Attr("SK").begins_with("LINEAGE#"))["Items"]
 
 
 class TestPlantRead:
@@ -45,6 +73,70 @@ class TestPlantRead:
         assert PlantItem(**response.json()).SK == f"PLANT#{plant.plant_id}"
         assert response.status_code == 200
 
+    def test_read_missing_human_id(self, client_mock_session, default_user_plant):
+        response = client_mock_session().get(f"{PLANT_ROUTE}/user/{default_user_plant.user_id}/0")
+        assert response.status_code == 404
+
+    def test_backfilled_human_id(self, client_mock_session, mock_db, default_enabled_user_in_db, default_user_plant):
+        plant = default_user_plant
+        # As stored before plants had a human_id item
+        mock_db.dynamodb.Table(mock_db.table_name).delete_item(Key=make_human_id_key(plant.user_id, plant.human_id))
+        test_client = client_mock_session()
+        assert test_client.get(f"{PLANT_ROUTE}/user/{plant.user_id}/{plant.human_id}").status_code == 404
+
+        backfill_human_id_items()
+        response = test_client.get(f"{PLANT_ROUTE}/user/{plant.user_id}/{plant.human_id}")
+        assert response.json()["plant_id"] == plant.plant_id
+
+
+class TestPlantPagination:
+    def test_pages_through_plant_list(self, client_mock_session, mock_db):
+        plant_user_id = DEFAULT_TEST_USER.google_id
+        plants = create_plants_for_user(mock_db, DEFAULT_TEST_USER, 5)
+
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        seen_plant_ids = []
+        cursor = None
+        n_pages = 0
+        while True:
+            params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+            response = test_client.get(f"{PLANT_ROUTE}/user/{plant_user_id}", params=params)
+            assert response.status_code == 200
+            page = TypeAdapter(list[PlantItem]).validate_python(response.json())
+            assert len(page) <= 2
+            seen_plant_ids += [plant.plant_id for plant in page]
+            n_pages += 1
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if cursor is None:
+                break
+
+        assert n_pages == 3
+        assert sorted(seen_plant_ids) == sorted(plant.plant_id for plant in plants)
+
+    def test_no_cursor_header_without_paging(self, client_mock_session, mock_db):
+        create_plants_for_user(mock_db, DEFAULT_TEST_USER, 3)
+        response = client_mock_session().get(f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}")
+        assert len(response.json()) == 3
+        assert NEXT_CURSOR_HEADER not in response.headers
+
+    def test_invalid_cursor_rejected(self, client_mock_session, mock_db):
+        response = client_mock_session().get(
+            f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}", params={"limit": 2, "cursor": "not-a-cursor"}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_cursor_for_other_partition_rejected(self, client_mock_session, mock_db):
+        create_plants_for_user(mock_db, OTHER_TEST_USER, 3)
+        other_response = client_mock_session(OTHER_TEST_USER).get(
+            f"{PLANT_ROUTE}/user/{OTHER_TEST_USER.google_id}", params={"limit": 1}
+        )
+        cursor = other_response.headers[NEXT_CURSOR_HEADER]
+
+        response = client_mock_session().get(
+            f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}", params={"limit": 1, "cursor": cursor}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
 
 class TestPlantReadPrivacy:
     def test_get_public_users_plant_list(self, client_mock_session, default_enabled_user_in_db, default_user_plant):
@@ -90,10 +182,14 @@ class TestPlantCreate:
         assert response.json()["human_name"] == "New Plant"
 
         # Check the plant was created in the DB
-        db_items = mock_db.dynamodb.Table(mock_db.table_name).scan()["Items"]
+        table = mock_db.dynamodb.Table(mock_db.table_name)
+        db_items = table.scan(FilterExpression=Attr("SK").begins_with("PLANT#"))["Items"]
         assert len(db_items) == 1
         assert db_items[0]["human_name"] == "New Plant"
         assert db_items[0]["PK"] == f"{ItemKeys.USER.value}#{DEFAULT_TEST_USER.google_id}"
+        # Along with the item reserving its human_id
+        human_id_item = table.get_item(Key=make_human_id_key(DEFAULT_TEST_USER.google_id, new_plant.human_id))["Item"]
+        assert human_id_item["plant_id"] == db_items[0]["plant_id"]
 
     def test_create_with_duplicate_human_id_fails(self, client_mock_session, mock_db):
         test_client = client_mock_session(DEFAULT_TEST_USER)
@@ -104,6 +200,15 @@ class TestPlantCreate:
         response = test_client.post(f"{PLANT_ROUTE}/create", json=new_plant.dynamodb_dump())
         assert response.status_code == status.HTTP_400_BAD_REQUEST
 
+    def test_human_id_is_reusable_after_delete(self, client_mock_session, mock_db):
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        plant = plant_record_factory(human_id=42)
+        response = test_client.post(f"{PLANT_ROUTE}/create", json=plant.dynamodb_dump())
+        test_client.delete(f"{PLANT_ROUTE}/{response.json()['plant_id']}")
+
+        response = test_client.post(f"{PLANT_ROUTE}/create", json=plant.dynamodb_dump())
+        assert response.status_code == status.HTTP_201_CREATED
+
     def test_create_with_duplicate_plant_id(self, client_mock_session, mock_db, default_user_plant):
         test_client = client_mock_session(DEFAULT_TEST_USER)
         existing_plant = default_user_plant
@@ -112,7 +217,9 @@ class TestPlantCreate:
         _ = test_client.post(f"{PLANT_ROUTE}/create", json=new_plant.dynamodb_dump())
 
         # Check that the plants were created with different UUIDs
-        db_items = mock_db.dynamodb.Table(mock_db.table_name).scan()["Items"]
+        db_items = mock_db.dynamodb.Table(mock_db.table_name).scan(FilterExpression=Attr("SK").begins_with("PLANT#"))[
+            "Items"
+        ]
         assert len(db_items) == 2
         assert db_items[0]["plant_id"] != db_items[1]["plant_id"]
 
@@ -136,7 +243,9 @@ class TestPlantUpdate:
         assert response.status_code == status.HTTP_200_OK
 
         # Check the plant was updated in the DB
-        db_items = mock_db.dynamodb.Table(mock_db.table_name).scan()["Items"]
+        db_items = mock_db.dynamodb.Table(mock_db.table_name).scan(FilterExpression=Attr("SK").begins_with("PLANT#"))[
+            "Items"
+        ]
         assert len(db_items) == 1
         assert db_items[0]["human_name"] == "Updated Name"
 
@@ -182,11 +291,10 @@ class TestPlantDelete:
 
         test_client = client_mock_session(DEFAULT_TEST_USER)
         response = test_client.delete(f"{PLANT_ROUTE}/{plant.plant_id}")
-        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert response.status_code == status.HTTP_202_ACCEPTED
 
         # Check the plant was deleted from the DB
-        db_items = mock_db.dynamodb.Table(mock_db.table_name).scan()["Items"]
-        assert len(db_items) == 0
+        assert scan_plant_items(mock_db) == []
 
     def test_delete_other_users_plant_fails(self, client_mock_session, mock_db, default_user_plant):
         plant = default_user_plant
@@ -210,20 +318,388 @@ class TestPlantDelete:
 
         test_client = client_mock_session(DEFAULT_TEST_USER)
         response = test_client.delete(f"{PLANT_ROUTE}/{plant.plant_id}")
-        assert response.status_code == status.HTTP_204_NO_CONTENT
-        db_items = mock_db.dynamodb.Table(mock_db.table_name).scan()["Items"]
-        assert len(db_items) == 0
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert scan_plant_items(mock_db) == []
 
     def test_delete_plant_deletes_images_in_s3(self, client_mock_session, mock_db, fake_s3, plant_with_image_in_s3):
         plant, image = plant_with_image_in_s3
 
         test_client = client_mock_session(DEFAULT_TEST_USER)
         response = test_client.delete(f"{PLANT_ROUTE}/{plant.plant_id}")
-        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert response.status_code == status.HTTP_202_ACCEPTED
         assert check_object_exists_in_s3(fake_s3, S3_BUCKET_NAME, image.full_photo_s3_url) is False
         assert check_object_exists_in_s3(fake_s3, S3_BUCKET_NAME, image.thumbnail_photo_s3_url) is False
 
 
+class TestPlantListQuery:
+    @pytest.fixture
+    def plants(self, mock_db):
+        active = dict(sink=None, sink_date=None)
+        plants = [
+            plant_record_factory(human_id=1, human_name="Spider mom", location="kitchen", species="spider", **active),
+            plant_record_factory(human_id=2, human_name="Spider baby", location="bedroom", species="spider", **active),
+            plant_record_factory(human_id=3, human_name="Pothos", location="kitchen", species="pothos"),
+            plant_record_factory(human_id=4, human_name="Monstera", location=None, species=None, **active),
+        ]
+        for plant in plants:
+            mock_db.insert_mock_data(plant)
+        return plants
+
+    def get_human_ids(self, client_mock_session, query: str) -> list[int]:
+        url = f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}?{query}"
+        response = client_mock_session(DEFAULT_TEST_USER).get(url)
+        assert response.status_code == status.HTTP_200_OK
+        return [plant["human_id"] for plant in response.json()]
+
+    @pytest.mark.parametrize(
+        "query, human_ids",
+        [
+            ("status=active", [1, 2, 4]),
+            ("status=sunk", [3]),
+            ("location=kitchen", [1, 3]),
+            ("location=kitchen&status=active", [1]),
+            ("location=kitchen&species=pothos", [3]),
+            ("species=spider", [1, 2]),
+            ("name_prefix=Spider", [1, 2]),
+            ("status=active&name_prefix=M", [4]),
+        ],
+    )
+    def test_filters(self, client_mock_session, mock_db, plants, query, human_ids):
+        assert sorted(self.get_human_ids(client_mock_session, query)) == human_ids
+
+    def test_sorting(self, client_mock_session, mock_db, plants):
+        assert self.get_human_ids(client_mock_session, "sort_by=human_name") == [4, 3, 2, 1]
+        assert self.get_human_ids(client_mock_session, "sort_by=human_id&descending=true") == [4, 3, 2, 1]
+        assert self.get_human_ids(client_mock_session, "status=active&sort_by=human_id") == [1, 2, 4]
+
+    def test_projection(self, client_mock_session, mock_db, plants):
+        response = client_mock_session(DEFAULT_TEST_USER).get(
+            f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}?fields=human_id,location&sort_by=human_name"
+        )
+        assert response.json() == [
+            {"plant_id": plant.plant_id, "human_id": plant.human_id, "location": plant.location}
+            for plant in sorted(plants, key=lambda plant: plant.human_name)
+        ]
+
+    def test_unknown_field(self, client_mock_session, mock_db, plants):
+        response = client_mock_session(DEFAULT_TEST_USER).get(
+            f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}?fields=human_id,secret"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_no_sorting_when_paging(self, client_mock_session, mock_db, plants):
+        response = client_mock_session(DEFAULT_TEST_USER).get(
+            f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}?limit=2&sort_by=human_id"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.parametrize("fields", ["", "&fields=human_id"])
+    def test_pages_through_index(self, client_mock_session, mock_db, plants, fields):
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        url = f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}?status=active&limit=2{fields}"
+        human_ids = []
+        response = test_client.get(url)
+        while True:
+            human_ids += [plant["human_id"] for plant in response.json()]
+            if NEXT_CURSOR_HEADER not in response.headers:
+                break
+            response = test_client.get(f"{url}&cursor={response.headers[NEXT_CURSOR_HEADER]}")
+        # The active plants index is ranged by human_id
+        assert human_ids == [1, 2, 4]
+
+    def test_cursor_for_other_filters_rejected(self, client_mock_session, mock_db, plants):
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        url = f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}?limit=1"
+        cursor = test_client.get(url).headers[NEXT_CURSOR_HEADER]
+
+        response = test_client.get(f"{url}&status=active&cursor={cursor}")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = test_client.get(f"{url}&name_prefix=a&cursor={cursor}")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_sinking_leaves_active_index(self, client_mock_session, mock_db, plants):
+        plant = plants[0]
+        updated_plant = PlantBase(**plant.model_dump()).model_dump(mode="json")
+        updated_plant.update(sink="Compost", sink_date="2024-01-01", location=None)
+        client_mock_session(DEFAULT_TEST_USER).patch(f"{PLANT_ROUTE}/{plant.plant_id}", json=updated_plant)
+
+        assert sorted(self.get_human_ids(client_mock_session, "status=active")) == [2, 4]
+        assert sorted(self.get_human_ids(client_mock_session, "location=kitchen")) == [3]
+
+    def test_backfilled_index_attributes(self, client_mock_session, mock_db, default_enabled_user_in_db):
+        plant = plant_record_factory(human_id=7, sink=None, sink_date=None)
+        table = mock_db.dynamodb.Table(mock_db.table_name)
+        # Written before plants had index attributes
+        table.put_item(Item=PlantBase.dynamodb_dump(plant))
+        assert self.get_human_ids(client_mock_session, "status=active") == []
+
+        backfill_plant_index_attributes()
+        assert self.get_human_ids(client_mock_session, "status=active") == [7]
+        assert self.get_human_ids(client_mock_session, f"location={plant.location}") == [7]
+
+
+class TestPlantBulkCreate:
+    CSV = (
+        "human_id,human_name,species,location,parent_id,source,source_date,sink,sink_date,notes\n"
+        "1,Mother spider plant,,kitchen,,Nursery,2023-01-01,,,\n"
+        "2,Other spider plant,,kitchen,,Nursery,2023-01-01,,,\n"
+        '3,Baby spider plant,,bedroom,"1, 2",plant,2023-06-01,Compost,2024-01-01,bulk imported\n'
+    )
+
+    def test_csv(self, client_mock_session, mock_db):
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        response = test_client.post(f"{PLANT_ROUTE}/bulk", content=self.CSV, headers={"Content-Type": "text/csv"})
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json() == {"n_created": 3, "errors": []}
+
+        plants = TypeAdapter(list[PlantItem]).validate_python(
+            test_client.get(f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}").json()
+        )
+        plants_by_human_id = {plant.human_id: plant for plant in plants}
+        assert sorted(plants_by_human_id) == [1, 2, 3]
+        assert plants_by_human_id[3].parent_id == [1, 2]
+        assert plants_by_human_id[3].sink == "Compost"
+        assert plants_by_human_id[1].species is None
+        response = test_client.get(f"{PLANT_ROUTE}/user/{DEFAULT_TEST_USER.google_id}/3")
+        assert response.json()["plant_id"] == plants_by_human_id[3].plant_id
+
+    def test_ndjson(self, client_mock_session, mock_db):
+        lines = [
+            '{"human_id": 1, "human_name": "Pothos", "source": "Nursery", "source_date": "2023-01-01"}',
+            "",
+            '{"human_id": 2, "human_name": "Pothos cutting", "parent_id": [1], "source": "plant", '
+            '"source_date": "2023-02-01"}',
+        ]
+        response = client_mock_session(DEFAULT_TEST_USER).post(
+            f"{PLANT_ROUTE}/bulk", content="\n".join(lines), headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json() == {"n_created": 2, "errors": []}
+
+    def test_row_errors(self, client_mock_session, mock_db, default_user_plant):
+        csv_content = (
+            "human_id,human_name,source,source_date\n"
+            f"{default_user_plant.human_id},Taken,Nursery,2023-01-01\n"
+            "100001,No source date,Nursery,\n"
+            "100002,First,Nursery,2023-01-01\n"
+            "100002,Second,Nursery,2023-01-01\n"
+        )
+        response = client_mock_session(DEFAULT_TEST_USER).post(
+            f"{PLANT_ROUTE}/bulk", content=csv_content, headers={"Content-Type": "text/csv"}
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        errors = response.json()["detail"]
+        assert [error["line"] for error in errors] == [2, 3, 5]
+        assert errors[0]["errors"] == [f"human_id {default_user_plant.human_id} is already used"]
+        assert errors[1]["errors"][0].startswith("source_date:")
+        assert errors[2]["errors"] == ["human_id 100002 is also on line 4"]
+
+        # Nothing was written
+        db_items = mock_db.dynamodb.Table(mock_db.table_name).scan(FilterExpression=Attr("SK").begins_with("PLANT#"))
+        assert len(db_items["Items"]) == 1
+
+    def test_unsupported_content_type(self, client_mock_session, mock_db):
+        response = client_mock_session(DEFAULT_TEST_USER).post(f"{PLANT_ROUTE}/bulk", json=[{"human_id": 1}])
+        assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+    def test_human_id_taken_during_import(self, client_mock_session, mock_db, default_user_plant, monkeypatch):
+        # As if the existing plant was created after the upload was validated
+        monkeypatch.setattr("plant_api.routers.plants.get_used_human_ids", lambda user_id: set())
+        monkeypatch.setattr("plant_api.routers.plants.BULK_TRANSACTION_PLANTS", 2)
+        csv_content = (
+            "human_id,human_name,source,source_date\n"
+            "100001,First,Nursery,2023-01-01\n"
+            f"{default_user_plant.human_id},Taken,Nursery,2023-01-01\n"
+            "100002,Second,Nursery,2023-01-01\n"
+        )
+        response = client_mock_session(DEFAULT_TEST_USER).post(
+            f"{PLANT_ROUTE}/bulk", content=csv_content, headers={"Content-Type": "text/csv"}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        result = response.json()
+        assert result["n_created"] == 2
+        assert [error["line"] for error in result["errors"]] == [3]
+
+        table = mock_db.dynamodb.Table(mock_db.table_name)
+        human_id_item = table.get_item(Key=make_human_id_key(default_user_plant.user_id, default_user_plant.human_id))
+        assert human_id_item["Item"]["plant_id"] == default_user_plant.plant_id
+        db_items = table.scan(FilterExpression=Attr("SK").begins_with("PLANT#"))["Items"]
+        assert sorted(item["human_id"] for item in db_items) == sorted([default_user_plant.human_id, 100001, 100002])
+
+    def cancel_transactions(self, monkeypatch, codes: list[str], n_committed: int = 0):
+        """Cancels the bulk import's transactions after the first n_committed, one per code as if for that reason,
+        then lets the rest through
+        """
+        table = get_db_table()
+        client = table.meta.client
+        transact_write_items = client.transact_write_items
+        calls = []
+
+        def cancelled_transact_write_items(**kwargs):
+            calls.append(kwargs)
+            if len(calls) <= n_committed or len(calls) > n_committed + len(codes):
+                return transact_write_items(**kwargs)
+            reasons = [{"Code": codes[len(calls) - n_committed - 1]}]
+            reasons += [{"Code": "None"}] * (len(kwargs["TransactItems"]) - 1)
+            error_response = {"Error": {"Code": "TransactionCanceledException"}, "CancellationReasons": reasons}
+            raise client.exceptions.TransactionCanceledException(error_response, "TransactWriteItems")
+
+        monkeypatch.setattr(client, "transact_write_items", cancelled_transact_write_items)
+        monkeypatch.setattr("plant_api.routers.plants.get_db_table", lambda: table)
+        monkeypatch.setattr(BULK_TRANSACTION_RETRY_POLICY, "base_delay_sec", 0.0)
+
+    def test_conflicting_transaction_retried(
+        self, client_mock_session, mock_db, default_enabled_user_in_db, monkeypatch
+    ):
+        self.cancel_transactions(monkeypatch, ["TransactionConflict", "ThrottlingError"])
+        response = client_mock_session(DEFAULT_TEST_USER).post(
+            f"{PLANT_ROUTE}/bulk", content=self.CSV, headers={"Content-Type": "text/csv"}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json() == {"n_created": 3, "errors": []}
+
+    def test_failed_transaction_counts_earlier_ones(
+        self, client_mock_session, mock_db, default_enabled_user_in_db, monkeypatch
+    ):
+        monkeypatch.setattr("plant_api.routers.plants.BULK_TRANSACTION_PLANTS", 2)
+        lineage_version = get_lineage_version(DEFAULT_TEST_USER.google_id)
+        # The first transaction is committed, every attempt at the second conflicts
+        codes = ["TransactionConflict"] * BULK_TRANSACTION_RETRY_POLICY.attempts
+        self.cancel_transactions(monkeypatch, codes, n_committed=1)
+        with pytest.raises(ClientError):
+            client_mock_session(DEFAULT_TEST_USER).post(
+                f"{PLANT_ROUTE}/bulk", content=self.CSV, headers={"Content-Type": "text/csv"}
+            )
+
+        user = get_user_by_google_id(DEFAULT_TEST_USER.google_id)
+        assert user is not None
+        assert (user.n_total_plants, user.n_active_plants) == (2, 2)
+        assert get_lineage_version(DEFAULT_TEST_USER.google_id) > lineage_version
+
+    def test_too_many_rows(self, client_mock_session, mock_db, monkeypatch):
+        monkeypatch.setattr("plant_api.routers.plants.MAX_BULK_PLANTS", 2)
+        response = client_mock_session(DEFAULT_TEST_USER).post(
+            f"{PLANT_ROUTE}/bulk", content=self.CSV, headers={"Content-Type": "text/csv"}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_body_too_large(self, client_mock_session, mock_db, monkeypatch):
+        monkeypatch.setattr("plant_api.routers.plants.MAX_BULK_BODY_BYTES", len(self.CSV) - 1)
+        response = client_mock_session(DEFAULT_TEST_USER).post(
+            f"{PLANT_ROUTE}/bulk", content=self.CSV, headers={"Content-Type": "text/csv"}
+        )
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+class QueuedJobs(JobQueue):
+    """Holds on to submitted jobs instead of running them, like a worker that hasn't got to them yet"""
+
+    def __init__(self):
+        super().__init__(delete_plant_and_images)
+        self.jobs = []
+
+    async def submit(self, job):
+        self.jobs.append(job)
+        return None
+
+
+class TestPlantDeletion:
+    @pytest.fixture
+    def queued_jobs(self):
+        queue = QueuedJobs()
+        set_plant_deletion_queue(queue)
+        yield queue
+        set_plant_deletion_queue(None)
+
+    def test_deleting_plant_is_hidden(self, client_mock_session, mock_db, queued_jobs, default_user_plant):
+        plant = default_user_plant
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        assert test_client.delete(f"{PLANT_ROUTE}/{plant.plant_id}").status_code == status.HTTP_202_ACCEPTED
+        assert queued_jobs.jobs == [PlantDeletionJob(user_id=plant.user_id, plant_id=plant.plant_id)]
+
+        assert test_client.get(f"{PLANT_ROUTE}/{plant.plant_id}").status_code == status.HTTP_404_NOT_FOUND
+        assert test_client.get(f"{PLANT_ROUTE}/user/{plant.user_id}/{plant.human_id}").status_code == 404
+        assert test_client.get(f"{PLANT_ROUTE}/user/{plant.user_id}").json() == []
+        assert test_client.get(f"{PLANT_ROUTE}/user/{plant.user_id}?limit=10").json() == []
+        updated_plant = PlantBase(**plant.model_dump()).model_dump(mode="json")
+        response = test_client.patch(f"{PLANT_ROUTE}/{plant.plant_id}", json=updated_plant)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_deletion_is_resumable(self, client_mock_session, mock_db, fake_s3, queued_jobs, plant_with_image_in_s3):
+        plant, image = plant_with_image_in_s3
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        test_client.delete(f"{PLANT_ROUTE}/{plant.plant_id}")
+        # Deleting again while the first deletion is outstanding queues it again
+        assert test_client.delete(f"{PLANT_ROUTE}/{plant.plant_id}").status_code == status.HTTP_202_ACCEPTED
+        assert len(queued_jobs.jobs) == 2
+
+        for job in queued_jobs.jobs:
+            delete_plant_and_images(job)
+        assert scan_plant_items(mock_db) == []
+        assert check_object_exists_in_s3(fake_s3, S3_BUCKET_NAME, image.full_photo_s3_url) is False
+        assert test_client.delete(f"{PLANT_ROUTE}/{plant.plant_id}").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_stale_deletions_are_resumed(
+        self, client_mock_session, mock_db, fake_s3, queued_jobs, default_enabled_user_in_db
+    ):
+        stale, recent = create_plants_for_user(mock_db, DEFAULT_TEST_USER, 2)
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        for plant in (stale, recent):
+            test_client.delete(f"{PLANT_ROUTE}/{plant.plant_id}")
+        table = mock_db.dynamodb.Table(mock_db.table_name)
+        table.update_item(
+            Key={"PK": stale.PK, "SK": stale.SK},
+            UpdateExpression="SET deleted_at = :then",
+            ExpressionAttributeValues={":then": (datetime.utcnow() - timedelta(hours=1)).isoformat()},
+        )
+
+        resume_stale_plant_deletions()
+        assert "Item" not in table.get_item(Key={"PK": stale.PK, "SK": stale.SK})
+        assert "Item" not in table.get_item(Key=make_human_id_key(stale.user_id, stale.human_id))
+        assert "Item" in table.get_item(Key={"PK": recent.PK, "SK": recent.SK})
+
+    def test_deleting_plant_is_hidden_from_lineage(
+        self, client_mock_session, mock_db, queued_jobs, default_enabled_user_in_db, default_user_plant
+    ):
+        test_client = client_mock_session(DEFAULT_TEST_USER)
+        lineage_route = f"/lineages/user/{DEFAULT_TEST_USER.google_id}"
+        assert test_client.get(lineage_route).json() != []
+        test_client.delete(f"{PLANT_ROUTE}/{default_user_plant.plant_id}")
+        assert test_client.get(lineage_route).json() == []
+
+        # Also left out when the layout is built again from the plants
+        invalidate_lineage_layout(DEFAULT_TEST_USER.google_id)
+        assert test_client.get(lineage_route).json() == []
+
+    def test_job_leaves_plant_without_tombstone(self, mock_db, fake_s3, plant_with_image_record):
+        plant, image = plant_with_image_record
+        delete_plant_and_images(PlantDeletionJob(user_id=plant.user_id, plant_id=plant.plant_id))
+
+        table = mock_db.dynamodb.Table(mock_db.table_name)
+        assert "Item" in table.get_item(Key={"PK": plant.PK, "SK": plant.SK})
+        assert "Item" in table.get_item(Key={"PK": image.PK, "SK": image.SK})
+
+    def test_deletes_images_in_pages(self, client_mock_session, mock_db, fake_s3, default_user_plant, monkeypatch):
+        plant = default_user_plant
+        n_images = DELETION_PAGE_SIZE + 10
+        for _ in range(n_images):
+            create_and_insert_image_record(mock_db, plant_id=plant.plant_id, owner_user_id=plant.user_id)
+        delete_objects_calls = []
+        s3_client = get_s3_client()
+        delete_objects = s3_client.delete_objects
+
+        def counting_delete_objects(**kwargs):
+            delete_objects_calls.append(len(kwargs["Delete"]["Objects"]))
+            return delete_objects(**kwargs)
+
+        monkeypatch.setattr(s3_client, "delete_objects", counting_delete_objects)
+        response = client_mock_session(DEFAULT_TEST_USER).delete(f"{PLANT_ROUTE}/{plant.plant_id}")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+
+        assert scan_plant_items(mock_db) == []
+        assert delete_objects_calls == [2 * DELETION_PAGE_SIZE, 2 * 10]
+
+
 class TestParsing:
     def test_parses_mult_parent_id(self):
         plant = PlantItem.model_validate(
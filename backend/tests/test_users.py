@@ -1,9 +1,20 @@
 from datetime import date
 
-from tests.conftest import create_plants_for_user
-from tests.lib import DEFAULT_TEST_USER, OTHER_TEST_USER, plant_record_factory
-from plant_api.schema import DeAnonUser, User, UserItem
-from plant_api.utils.db import get_all_users, get_db_table, get_user_by_google_id, is_user_access_allowed
+from boto3.dynamodb.conditions import Attr, Key
+
+from tests.conftest import create_and_insert_image_record, create_plants_for_user
+from plant_api.constants import NEXT_CURSOR_HEADER
+from tests.lib import DEFAULT_TEST_USER, OTHER_TEST_USER, create_test_image, plant_record_factory, user_record_factory
+from plant_api.schema import DeAnonUser, PlantBase, PlantItem, User, UserItem
+from plant_api.utils.db import (
+    add_to_user_counters,
+    get_all_users,
+    get_db_table,
+    get_user_by_google_id,
+    is_user_access_allowed,
+    paginate,
+    recompute_all_user_counters,
+)
 
 from pydantic import TypeAdapter
 
@@ -67,8 +78,10 @@ class TestGetUsers:
         assert parsed_response[0].google_id == OTHER_TEST_USER.google_id
 
     def test_get_user_n_plants(self, default_enabled_user_in_db, mock_db, client_mock_session):
-        create_plants_for_user(mock_db, DEFAULT_TEST_USER, 3)
-        response = client_mock_session().get("/users")
+        test_client = client_mock_session()
+        for _ in range(3):
+            test_client.post("/plants/create", json=plant_record_factory().dynamodb_dump())
+        response = test_client.get("/users")
         parsed_user = TypeAdapter(list[DeAnonUser]).validate_python(response.json())
 
         assert parsed_user[0].n_total_plants == 3
@@ -80,14 +93,15 @@ class TestGetUsers:
         assert parsed_user[0].n_total_plants == 0
 
     def test_get_user_w_sunk_plants(self, mock_db, default_enabled_user_in_db, client_mock_session):
+        test_client = client_mock_session()
         plants = [
             plant_record_factory(human_id=1, sink=None, sink_date=None),
             plant_record_factory(human_id=2, sink="mock_sink", sink_date=date.today()),
         ]
         for plant in plants:
-            mock_db.insert_mock_data(plant)
+            test_client.post("/plants/create", json=plant.dynamodb_dump())
 
-        response = client_mock_session().get("/users")
+        response = test_client.get("/users")
         parsed_user = TypeAdapter(list[DeAnonUser]).validate_python(response.json())[0]
 
         assert parsed_user.n_total_plants == 2
@@ -99,6 +113,98 @@ class TestGetUsers:
 
         assert parsed_response[0].last_initial == DEFAULT_TEST_USER.family_name[0]
 
+    def test_pages_through_users(self, mock_db, client_mock_session):
+        for i in range(5):
+            mock_db.insert_mock_data(user_record_factory(google_id=str(i)))
+
+        test_client = client_mock_session()
+        first_page = test_client.get("/users/", params={"limit": 3})
+        cursor = first_page.headers[NEXT_CURSOR_HEADER]
+        second_page = test_client.get("/users/", params={"limit": 3, "cursor": cursor})
+
+        google_ids = [user["google_id"] for user in first_page.json() + second_page.json()]
+        assert sorted(google_ids) == [str(i) for i in range(5)]
+
+
+class TestUserCounters:
+    def get_counters(self) -> tuple[int, int, int]:
+        user = get_user_by_google_id(DEFAULT_TEST_USER.google_id)
+        assert user is not None
+        return user.n_total_plants, user.n_active_plants, user.n_images
+
+    def test_sinking_and_deleting_plants_updates_counters(
+        self, mock_db, default_enabled_user_in_db, client_mock_session
+    ):
+        test_client = client_mock_session()
+        plant = PlantItem(
+            **test_client.post(
+                "/plants/create", json=plant_record_factory(sink=None, sink_date=None).dynamodb_dump()
+            ).json()
+        )
+        assert self.get_counters() == (1, 1, 0)
+
+        sunk_plant = PlantBase(**plant.model_dump())
+        sunk_plant.sink = "compost"
+        sunk_plant.sink_date = date.today()
+        test_client.patch(f"/plants/{plant.plant_id}", json=sunk_plant.dynamodb_dump())
+        assert self.get_counters() == (1, 0, 0)
+
+        test_client.delete(f"/plants/{plant.plant_id}")
+        assert self.get_counters() == (0, 0, 0)
+
+    def test_images_update_counters(self, mock_db, fake_s3, default_enabled_user_in_db, client_mock_session):
+        test_client = client_mock_session()
+        plant = PlantItem(**test_client.post("/plants/create", json=plant_record_factory().dynamodb_dump()).json())
+        image_ids = [
+            test_client.post(
+                f"/images/plants/{plant.plant_id}", files={"image_file": ("filename", create_test_image(), "image/png")}
+            ).json()["image_id"]
+            for _ in range(2)
+        ]
+        assert self.get_counters()[2] == 2
+
+        test_client.delete(f"/images/{image_ids[0]}")
+        assert self.get_counters()[2] == 1
+
+        test_client.delete(f"/plants/{plant.plant_id}")
+        assert self.get_counters() == (0, 0, 0)
+
+    def test_recompute_repairs_counters(self, mock_db, default_enabled_user_in_db):
+        plants = [
+            plant_record_factory(human_id=1, sink=None, sink_date=None),
+            plant_record_factory(human_id=2, sink="mock_sink", sink_date=date.today()),
+        ]
+        for plant in plants:
+            mock_db.insert_mock_data(plant)
+        create_and_insert_image_record(mock_db, plant_id=plants[0].plant_id)
+        assert self.get_counters() == (0, 0, 0)
+
+        recompute_all_user_counters()
+        assert self.get_counters() == (2, 1, 1)
+
+    def test_counters_skip_missing_user(self, mock_db, client_mock_session):
+        response = client_mock_session().post("/plants/create", json=plant_record_factory().dynamodb_dump())
+        assert response.status_code == 201
+        # Only the plant (and its human_id) was written; no partial user item was created for the counters
+        assert get_db_table().scan(FilterExpression=Attr("SK").begins_with("USER#"))["Items"] == []
+
+
+class TestUserDirectory:
+    def test_get_all_users_ignores_plants_and_images(
+        self, mock_db, default_enabled_user_in_db, plant_with_image_record
+    ):
+        users = get_all_users()
+        assert [user.google_id for user in users] == [DEFAULT_TEST_USER.google_id]
+
+    def test_get_all_users_reads_index_not_table_scan(self, mock_db, default_enabled_user_in_db, monkeypatch):
+        def fail_scan(*args, **kwargs):
+            raise AssertionError("The user directory should not scan the table")
+
+        table = get_db_table()
+        table.scan = fail_scan
+        monkeypatch.setattr("plant_api.utils.db.get_db_table", lambda: table)
+        assert len(get_all_users()) == 1
+
 
 class TestUserUpdate:
     def test_change_user_visibility(self, default_enabled_user_in_db, client_mock_session):
@@ -109,6 +215,14 @@ class TestUserUpdate:
         user = get_user_by_google_id(DEFAULT_TEST_USER.google_id)
         assert user.is_public_profile is False
 
+    def test_change_user_visibility_keeps_counters(self, default_enabled_user_in_db, client_mock_session):
+        add_to_user_counters(DEFAULT_TEST_USER.google_id, n_total_plants=2, n_active_plants=1, n_images=3)
+        client_mock_session().post("/users/settings/visibility", json={"is_public": False})
+
+        user = get_user_by_google_id(DEFAULT_TEST_USER.google_id)
+        assert user is not None
+        assert (user.n_total_plants, user.n_active_plants, user.n_images) == (2, 1, 3)
+
 
 class TestRestrictedAccess:
     def test_access_allowed_for_self(self, default_enabled_user_in_db):
@@ -132,3 +246,20 @@ class TestReadUserDB:
         """
         user = get_user_by_google_id(DEFAULT_TEST_USER.google_id)
         assert user.google_id == DEFAULT_TEST_USER.google_id
+
+
+class TestPaginate:
+    def test_follows_last_evaluated_key(self, mock_db):
+        create_plants_for_user(mock_db, DEFAULT_TEST_USER, 5)
+        table = get_db_table()
+
+        pages = list(
+            paginate(
+                table.query,
+                KeyConditionExpression=Key("PK").eq(f"USER#{DEFAULT_TEST_USER.google_id}")
+                & Key("SK").begins_with("PLANT#"),
+                Limit=2,
+            )
+        )
+        assert [len(page) for page in pages if page] == [2, 2, 1]
+        assert sum(len(page) for page in pages) == 5
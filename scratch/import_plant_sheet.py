@@ -1,5 +1,7 @@
+import asyncio
 import csv
 import io
+import threading
 from datetime import datetime
 from typing import Any, Optional
 from uuid import UUID
@@ -15,7 +17,8 @@ from googleapiclient.http import MediaIoBaseDownload
 from pydantic import BaseModel, TypeAdapter
 
 from plant_api.constants import IMAGES_TABLE_NAME, PLANTS_TABLE_NAME, S3_BUCKET_NAME
-from plant_api.utils.db import get_db_table
+from plant_api.utils.db import get_db_table, iterate_items
+from plant_api.utils.ingestion import IngestionPipeline
 from plant_api.schema import PlantCreate, PlantItem
 
 BASE_URL = "http://localhost:8000"
@@ -51,7 +54,7 @@ def get_s3_connection():
     return s3
 
 
-def get_gdrive_connection():
+def get_gdrive_credentials():
     # Google API client configuration
     client_config = {
         "installed": {
@@ -67,9 +70,11 @@ def get_gdrive_connection():
 
     # Authenticate and create the service
     flow = InstalledAppFlow.from_client_config(client_config, ["https://www.googleapis.com/auth/drive.readonly"])
-    creds = flow.run_local_server(port=8080)
-    service = build("drive", "v3", credentials=creds)
-    return service
+    return flow.run_local_server(port=8080)
+
+
+def get_gdrive_connection(creds=None):
+    return build("drive", "v3", credentials=creds or get_gdrive_credentials())
 
 
 def old_upload_plants():
@@ -104,7 +109,7 @@ def upload_images():
     print("Plant images uploaded to DynamoDB successfully!")
 
 
-def download_file_from_drive(service, file_id):
+def download_file_from_drive(service, file_id) -> bytes:
     request = service.files().get_media(fileId=file_id)
     fh = io.BytesIO()
     downloader = MediaIoBaseDownload(fh, request)
@@ -114,8 +119,8 @@ def download_file_from_drive(service, file_id):
         status, done = downloader.next_chunk()
         print("Download Progress: {0}%".format(int(status.progress() * 100)))
 
-    fh.seek(0)  # Reset stream position
-    return fh
+    # Bytes rather than the stream, so every upload attempt sends the whole file
+    return fh.getvalue()
 
 
 def transfer_images_from_gdrive_to_s3():
@@ -141,10 +146,10 @@ def transfer_images_from_gdrive_to_s3():
         gdrive_url = item["GDriveUrl"].split("id=")[1]
 
         # Download the image from gdrive
-        fh = download_file_from_drive(gdrive, gdrive_url)
+        image_bytes = download_file_from_drive(gdrive, gdrive_url)
         # Upload the image to s3
         s3_key = f"images/{image_id}.jpg"
-        s3.upload_fileobj(fh, S3_BUCKET_NAME, s3_key)
+        s3.upload_fileobj(io.BytesIO(image_bytes), S3_BUCKET_NAME, s3_key)
         s3_url = f"https://{S3_BUCKET_NAME}.s3-us-west-2.amazonaws.com/{s3_key}"
 
         # Update the database entry with the s3 url
@@ -240,14 +245,16 @@ def create_new_plant(plant_item: PlantCreate):
 
 
 def upload_plants_from_csv():
-    """Load in plant data, format it to proper schema, and use our app to POST to database"""
+    """Load in plant data, format it to proper schema, and POST it to our app in one bulk request"""
     with open("../data/plants_sheet.csv", "r", encoding="utf-8") as file:
         reader = csv.DictReader(file)
-        for row in reader:
-            # Format the CSV row to DynamoDB item structure
-            item = format_new_plant_row(row)
+        plants = [format_new_plant_row(row) for row in reader]
 
-            print(create_new_plant(item).json())
+    ndjson = "\n".join(plant.model_dump_json() for plant in plants)
+    headers = {**get_jwt_token_header(set_content_type=False), "Content-Type": "application/x-ndjson"}
+    response = requests.post(f"{BASE_URL}/plants/bulk", data=ndjson.encode("utf-8"), headers=headers)
+    # A 422 lists the errors of every bad row; nothing is created then
+    print(response.status_code, response.json())
 
 
 def get_jwt_token_header(set_content_type=True) -> dict[str, Any]:
@@ -270,7 +277,7 @@ class ImageCreate(BaseModel):
     gdrive_url: str
 
 
-def format_new_image_row(row, all_plants: list[PlantItem]) -> Optional[ImageCreate]:
+def format_new_image_row(row, plant_ids_by_human_id: dict[int, str]) -> Optional[ImageCreate]:
     # if row is empty return None
     if row["Timestamp"] == "":
         return None
@@ -281,8 +288,10 @@ def format_new_image_row(row, all_plants: list[PlantItem]) -> Optional[ImageCrea
     # output_format = "%Y-%m-%dT%H:%M:%S.%f"
     # output_datetime_str = parsed_datetime.strftime(output_format)
 
-    # Get plant_id for human_id
-    plant_id = get_plant_id_for_human_id(row["plant_id"], all_plants)
+    plant_id = plant_ids_by_human_id.get(int(row["plant_id"]))
+    if plant_id is None:
+        print(f"No plant with human_id {row['plant_id']}, skipping photo {row['Photo:::']}")
+        return None
 
     return ImageCreate(
         human_id=row["plant_id"],
@@ -292,54 +301,73 @@ def format_new_image_row(row, all_plants: list[PlantItem]) -> Optional[ImageCrea
     )
 
 
-def get_plant_id_for_human_id(human_id: int, all_plants: list[PlantItem]) -> Optional[UUID]:
-    for plant in all_plants:
-        if plant.human_id == int(human_id):
-            return plant.plant_id
-    return None
+def get_plant_ids_by_human_id() -> dict[int, str]:
+    """All of the user's plants, indexed by human_id"""
+    items = iterate_items(
+        get_db_table().query,
+        KeyConditionExpression=Key("PK").eq(f"USER#{google_id}") & Key("SK").begins_with("PLANT#"),
+    )
+    plants = TypeAdapter(list[PlantItem]).validate_python(list(items))
+    return {plant.human_id: plant.plant_id for plant in plants}
+
 
+class ImageMigrationClients(threading.local):
+    """Drive services and HTTP sessions aren't thread-safe, so each pipeline thread gets its own"""
 
-def create_new_image(gdrive_service, image_item: ImageCreate):
-    headers = get_jwt_token_header(set_content_type=False)
+    def __init__(self, gdrive_creds):
+        self.gdrive_service = get_gdrive_connection(gdrive_creds)
+        self.session = requests.Session()
+        self.session.headers.update(get_jwt_token_header(set_content_type=False))
 
-    # Get the full image from gdrive
-    image_file = download_file_from_drive(gdrive_service, image_item.gdrive_url)
 
+def create_new_image(session: requests.Session, image_item: ImageCreate, image_bytes: bytes) -> None:
     post_url = f"{BASE_URL}/images/plants/{image_item.plant_id}"
-    return requests.post(
+    response = session.post(
         post_url,
-        headers=headers,
-        data={
-            "timestamp": image_item.timestamp,
-        },
-        files={"image_file": ("filename", image_file, "image/png")},
+        data={"timestamp": image_item.timestamp.isoformat()},
+        files={"image_file": ("filename", image_bytes, "image/png")},
     )
+    # Raising lets the pipeline retry the upload (or record it as failed)
+    response.raise_for_status()
 
 
-def upload_images_from_csv():
-    """Load in image data, format it to proper schema, and use our app to POST to database"""
+def image_already_recorded(session: requests.Session, image_item: ImageCreate) -> bool:
+    """Whether the plant already has an image with the photo's timestamp"""
+    response = session.get(f"{BASE_URL}/images/plants/{image_item.plant_id}")
+    if response.status_code == 404:
+        return False
+    response.raise_for_status()
+    return any(datetime.fromisoformat(image["timestamp"]) == image_item.timestamp for image in response.json())
 
-    gdrive_service = get_gdrive_connection()
 
-    # First get all plants since we need to know the human_id -> plant_id mapping
-    pk_value = f"USER#{google_id}"
-    sk_value = f"PLANT#"
-    table = get_db_table()
-
-    response = table.query(KeyConditionExpression=Key("PK").eq(pk_value) & Key("SK").begins_with(sk_value))
-    all_plants = TypeAdapter(list[PlantItem]).validate_python(response.get("Items", []))
+def upload_images_from_csv(checkpoint_path: str = "../data/photos_migrated.txt"):
+    """Load in image data, download each photo from Drive and POST it to our app, many at a time.
 
+    Photos already listed in the checkpoint file are skipped, so the migration can just be run again after a crash.
+    """
+    plant_ids_by_human_id = get_plant_ids_by_human_id()
     with open("../data/photos_sheet.csv", "r", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-        for i, row in enumerate(reader):
-            # if i == 1:
-            #     break
-            item = format_new_image_row(row, all_plants)
-
-            if item is None:
-                continue
-
-            print(create_new_image(gdrive_service, item).json())
+        rows = csv.DictReader(file)
+        items = [item for item in (format_new_image_row(row, plant_ids_by_human_id) for row in rows) if item]
+
+    clients = ImageMigrationClients(get_gdrive_credentials())
+    attempted: set[str] = set()
+
+    def upload(item: ImageCreate, image_bytes: bytes) -> None:
+        # The POST isn't idempotent, and one that failed (e.g. timed out) may still have created the image
+        if item.gdrive_url in attempted and image_already_recorded(clients.session, item):
+            return
+        attempted.add(item.gdrive_url)
+        create_new_image(clients.session, item, image_bytes)
+
+    pipeline = IngestionPipeline(
+        key=lambda item: item.gdrive_url,
+        download=lambda item: download_file_from_drive(clients.gdrive_service, item.gdrive_url),
+        upload=upload,
+        checkpoint_path=checkpoint_path,
+    )
+    result = asyncio.run(pipeline.run(items))
+    print(result.model_dump_json(indent=2))
 
 
 def main():